@@ -0,0 +1,103 @@
+"""
+Время последней активности пользователей.
+
+Middleware (dobro.middleware.ActivityTrackingMiddleware) запоминает время
+последнего запроса авторизованного пользователя в памяти процесса, а в БД
+накопленные значения пишутся пачками (один UPDATE на BATCH_SIZE пользователей)
+не чаще раза в FLUSH_INTERVAL секунд, то есть каждый пользователь обновляется
+не чаще раза за интервал, сколько бы запросов он ни сделал. get_last_activity
+учитывает еще не записанные значения своего процесса, а recently_active сначала
+записывает их и фильтрует только по колонке; значения других процессов видны
+с задержкой до FLUSH_INTERVAL.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Case, DateTimeField, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import User
+
+DEFAULT_ACTIVITY_TRACKING = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 60,
+    'BATCH_SIZE': 500,
+    'ONLINE_WINDOW': 300,
+}
+
+
+def get_activity_settings():
+    """Настройки учета активности с подстановкой значений по умолчанию"""
+    return {**DEFAULT_ACTIVITY_TRACKING, **getattr(settings, 'ACTIVITY_TRACKING', {})}
+
+
+class ActivityTracker:
+    """Незаписанные времена активности {id пользователя: время} процесса"""
+
+    def __init__(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def touch(self, user_id, when=None):
+        """Запомнить активность; возвращает True, если накопленное пора записать в БД"""
+        when = when or timezone.now()
+        with self.lock:
+            if self.pending.get(user_id, when) <= when:
+                self.pending[user_id] = when
+            return time.monotonic() - self.flushed_at >= get_activity_settings()['FLUSH_INTERVAL']
+
+    def get(self, user_id):
+        with self.lock:
+            return self.pending.get(user_id)
+
+    def active_since(self, since):
+        with self.lock:
+            return [user_id for user_id, when in self.pending.items() if when >= since]
+
+    def reset(self):
+        """Забрать накопленное и начать новый интервал"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        return pending
+
+    def flush(self):
+        """Записать накопленное в БД; возвращает число обновленных пользователей"""
+        items = list(self.reset().items())
+        batch_size = get_activity_settings()['BATCH_SIZE']
+        updated = 0
+        for start in range(0, len(items), batch_size):
+            batch = dict(items[start:start + batch_size])
+            # Время из другого процесса может оказаться новее, поэтому значение только растет
+            last_activity = Case(*[When(pk=user_id, then=Value(when)) for user_id, when in batch.items()],
+                                 output_field=DateTimeField())
+            updated += User.objects.filter(pk__in=batch).update(
+                last_activity=Greatest(F('last_activity'), last_activity)
+            )
+        return updated
+
+
+tracker = ActivityTracker()
+
+
+def get_last_activity(user):
+    """Время последней активности с учетом еще не записанного в БД"""
+    pending = tracker.get(user.pk)
+    if pending is None or pending < user.last_activity:
+        return user.last_activity
+    return pending
+
+
+def recently_active(since=None, queryset=None):
+    """Пользователи, активные начиная с since (по умолчанию за последние ONLINE_WINDOW секунд)"""
+    if since is None:
+        since = timezone.now() - timedelta(seconds=get_activity_settings()['ONLINE_WINDOW'])
+    # Накопленное записывается пачками, чтобы не подставлять в запрос список id неограниченной длины
+    if tracker.active_since(since):
+        tracker.flush()
+    queryset = User.objects.all() if queryset is None else queryset
+    return queryset.filter(last_activity__gte=since)
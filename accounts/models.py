@@ -3,8 +3,10 @@ from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from cities.models import LoadedCityMixin
 
-class User(AbstractUser):
+
+class User(LoadedCityMixin, AbstractUser):
     ROLE_CHOICES = [
         ('volunteer', 'Волонтер'),
         ('nko_representative', 'Представитель НКО'),
@@ -31,6 +33,15 @@ class User(AbstractUser):
 
     # Локация
     city = models.CharField("Город", max_length=100, blank=True)
+    city_ref = models.ForeignKey(
+        'cities.City',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Город из справочника",
+        related_name='+'
+    )
 
     # Профиль
     bio = models.TextField("О себе", blank=True)
@@ -51,8 +62,11 @@ class User(AbstractUser):
 
     # Даты
     date_joined = models.DateTimeField("Дата регистрации", auto_now_add=True)
-    last_activity = models.DateTimeField("Последняя активность", auto_now=True)
+    # Обновляется accounts.activity пачками, а не при каждом save()
+    last_activity = models.DateTimeField("Последняя активность", default=timezone.now, editable=False)
     email_verified_at = models.DateTimeField("Email подтвержден", null=True, blank=True)
+    # Версия имени и других данных, которые показываются на чужих страницах (см. dobro.conditional)
+    updated_at = models.DateTimeField("Обновлен", auto_now=True)
 
     class Meta:
         verbose_name = "Пользователь"
@@ -76,9 +90,11 @@ class User(AbstractUser):
         return self.role in ['moderator', 'admin']
 
     def update_activity(self):
-        """Обновить время последней активности"""
+        """Отметить активность; в БД время попадет с ближайшей записью accounts.activity"""
+        from .activity import tracker
+
         self.last_activity = timezone.now()
-        self.save(update_fields=['last_activity'])
+        tracker.touch(self.pk, self.last_activity)
 
 
 class VerificationCode(models.Model):
@@ -1,3 +1,222 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.sessions.models import Session
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from content.models import EventParticipation
+from content.services import LeaderboardService
+from accounts import activity
+from dobro import sessions
+from dobro.testing import QueryBudgetMixin, create_user, create_users, create_event
+from .models import User, UserActivity, VerificationCode
+
+
+class SessionStoreTest(TestCase):
+    def setUp(self):
+        sessions.local_sessions.clear()
+        self.session = sessions.SessionStore()
+        self.session['visits'] = 1
+        self.session.save()
+        self.key = self.session.session_key
+
+    def test_load_from_process_cache(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(sessions.SessionStore(self.key).load(), {'visits': 1})
+
+        sessions.local_sessions.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(sessions.SessionStore(self.key)['visits'], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(sessions.SessionStore(self.key)['visits'], 1)
+
+        with override_settings(SESSION_CACHE={'TIMEOUT': 0}), self.assertNumQueries(1):
+            sessions.SessionStore(self.key).load()
+
+    def test_unchanged_session_is_not_written(self):
+        session = sessions.SessionStore(self.key)
+        session['visits'] = 1
+        # Вместо записи - чтение строки по ключу
+        with self.assertNumQueries(1):
+            session.save()
+
+        session['visits'] = 2
+        session.save()
+        sessions.local_sessions.clear()
+        self.assertEqual(sessions.SessionStore(self.key)['visits'], 2)
+
+    def test_session_written_by_other_process_is_overwritten(self):
+        session = sessions.SessionStore(self.key)
+        session.load()
+        # Другой процесс сохранил сессию, кэш этого процесса о ней не знает
+        Session.objects.filter(pk=self.key).update(session_data=session.encode({'visits': 5}))
+        session['visits'] = 1
+        session.save()
+        sessions.local_sessions.clear()
+        self.assertEqual(sessions.SessionStore(self.key)['visits'], 1)
+
+    def test_delete_drops_cached_session(self):
+        sessions.SessionStore(self.key).delete()
+        self.assertEqual(sessions.SessionStore(self.key).load(), {})
+
+    @override_settings(SESSION_CACHE={'SIZE': 2})
+    def test_least_recently_used_session_is_evicted(self):
+        others = []
+        for _ in range(2):
+            session = sessions.SessionStore()
+            session.create()
+            others.append(session.session_key)
+        self.assertEqual(list(sessions.local_sessions.entries), others)
+
+    @override_settings(SESSION_CACHE={'CLEAR_BATCH_SIZE': 2})
+    def test_clear_expired_in_batches(self):
+        expired = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create(Session(session_key=f'expired{i}', session_data='', expire_date=expired)
+                                    for i in range(5))
+        # Три пачки и проверка, что больше удалять нечего
+        with self.assertNumQueries(7):
+            self.assertEqual(sessions.SessionStore.clear_expired(), 5)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [self.key])
+
+
+class ActivityTrackingTest(TestCase):
+    def setUp(self):
+        activity.tracker.reset()
+        self.user = create_user()
+        self.long_ago = timezone.now() - timedelta(days=30)
+        User.objects.filter(pk=self.user.pk).update(last_activity=self.long_ago)
+        self.user.refresh_from_db()
+
+    def test_save_does_not_touch_last_activity(self):
+        self.user.first_name = 'Петр'
+        self.user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_activity, self.long_ago)
+
+    def test_requests_are_coalesced_in_memory(self):
+        self.client.force_login(self.user)
+        for _ in range(3):
+            self.client.get(reverse('accounts:profile'))
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_activity, self.long_ago)
+        self.assertGreater(activity.get_last_activity(self.user), self.long_ago)
+        self.assertEqual(list(activity.recently_active()), [self.user])
+
+    @override_settings(ACTIVITY_TRACKING={'BATCH_SIZE': 2})
+    def test_recently_active_flushes_pending(self):
+        others = create_users(3)
+        for user in [self.user, *others]:
+            activity.tracker.touch(user.pk)
+        # Две пачки UPDATE; сам QuerySet ленивый
+        with self.assertNumQueries(2):
+            active = activity.recently_active()
+        # Фильтр только по колонке, без списка id из памяти
+        self.assertNotIn(' IN ', str(active.query))
+        self.assertEqual(set(active), {self.user, *others})
+        self.assertIsNone(activity.tracker.get(self.user.pk))
+
+        with self.assertNumQueries(0):
+            activity.recently_active()
+
+    @override_settings(ACTIVITY_TRACKING={'FLUSH_INTERVAL': 0})
+    def test_flush_after_interval(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('accounts:profile'))
+        self.user.refresh_from_db()
+        self.assertGreater(self.user.last_activity, self.long_ago)
+        self.assertIsNone(activity.tracker.get(self.user.pk))
+
+    @override_settings(ACTIVITY_TRACKING={'BATCH_SIZE': 2})
+    def test_flush_in_batches_never_moves_back(self):
+        others = create_users(2)
+        now = timezone.now()
+        for user in others:
+            activity.tracker.touch(user.pk, now)
+        activity.tracker.touch(self.user.pk, self.long_ago - timedelta(days=1))
+        with self.assertNumQueries(2):
+            self.assertEqual(activity.tracker.flush(), 3)
+
+        self.assertEqual(set(User.objects.filter(last_activity=now)), set(others))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_activity, self.long_ago)
+
+
+class AccountsQueryBudgetTest(QueryBudgetMixin, TestCase):
+    def login_with_history(self, size, **fields):
+        """Авторизовать нового пользователя с size записями активности и кодов"""
+        user = create_user(**fields)
+        UserActivity.objects.bulk_create(UserActivity(user=user, action='login') for _ in range(size))
+        VerificationCode.objects.bulk_create(
+            VerificationCode(user=user, code_type='email_verification', code='123456',
+                             expires_at=timezone.now(), is_used=True)
+            for _ in range(size)
+        )
+        self.client.force_login(user)
+        return user
+
+    def test_register(self):
+        self.assertQueryBudget(0, lambda size: reverse('accounts:register'))
+
+    def test_login(self):
+        self.assertQueryBudget(0, lambda size: reverse('accounts:login'))
+
+    def test_password_reset_request(self):
+        self.assertQueryBudget(0, lambda size: reverse('accounts:password_reset_request'))
+
+    def test_logout(self):
+        def populate(size):
+            self.login_with_history(size)
+            return reverse('accounts:logout')
+
+        self.assertQueryBudget(4, populate, status=302)
+
+    def test_profile(self):
+        def populate(size):
+            user = self.login_with_history(size, skills='фотография, экология')
+            event = create_event(description='Экологическая акция, нужна фотосъемка')
+            EventParticipation.objects.bulk_create(
+                EventParticipation(user=volunteer, event=event, status='attended', volunteer_hours=2)
+                for volunteer in create_users(size) + [user]
+            )
+            LeaderboardService.rebuild()
+            return reverse('accounts:profile')
+
+        # Кэш рекомендаций сброшен созданием мероприятия: индекс строится заново
+        self.assertQueryBudget(5, populate)
+
+    def test_profile_edit(self):
+        def populate(size):
+            self.login_with_history(size)
+            return reverse('accounts:profile_edit')
+
+        self.assertQueryBudget(2, populate)
+
+    def test_activity_log(self):
+        def populate(size):
+            self.login_with_history(size)
+            return reverse('accounts:activity_log')
+
+        self.assertQueryBudget(2, populate)
+
+    def test_email_verification(self):
+        def populate(size):
+            self.login_with_history(size)
+            return reverse('accounts:email_verification')
+
+        self.assertQueryBudget(4, populate)
+
+    def test_resend_verification(self):
+        def populate(size):
+            self.login_with_history(size)
+            return reverse('accounts:resend_verification')
+
+        self.assertQueryBudget(3, populate, status=302)
+
+    def test_password_change(self):
+        def populate(size):
+            self.login_with_history(size)
+            return reverse('accounts:password_change')
+
+        self.assertQueryBudget(1, populate)
@@ -11,6 +11,8 @@ from .models import User, UserProfile, VerificationCode, UserActivity
 from .forms import (CustomUserCreationForm, CustomUserChangeForm, UserProfileForm,
                     EmailVerificationForm, PasswordResetRequestForm, PasswordResetForm)
 from .services import AuthService, VerificationService
+from content import ical
+from content.services import EventService, LeaderboardService
 
 
 def register(request):
@@ -103,7 +105,12 @@ def logout_view(request):
 @login_required
 def profile(request):
     """Профиль пользователя"""
-    return render(request, 'accounts/profile.html')
+    context = {
+        'ranks': LeaderboardService.get_ranks(request.user),
+        'recommended_events': EventService.get_recommended_events(request.user),
+        'events_ical_token': ical.user_token(request.user),
+    }
+    return render(request, 'accounts/profile.html', context)
 
 
 @login_required
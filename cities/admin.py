@@ -0,0 +1,16 @@
+from django.contrib import admin
+
+from .models import City
+
+
+@admin.register(City)
+class CityAdmin(admin.ModelAdmin):
+    list_display = ['name', 'key', 'created_at']
+    search_fields = ['name', 'key']
+    readonly_fields = ['key', 'created_at']
+
+    def get_readonly_fields(self, request, obj=None):
+        # Название хранится и в полях city связанных записей, поэтому существующий город не переименовывается
+        if obj is not None:
+            return ['name', *self.readonly_fields]
+        return self.readonly_fields
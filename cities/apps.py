@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class CitiesConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'cities'
+    verbose_name = 'Справочник городов'
+
+    def ready(self):
+        import cities.signals
@@ -0,0 +1,108 @@
+"""
+Поиск городов справочника по префиксу для автодополнения.
+
+Индекс держится в памяти процесса: отсортированный список ключей полных
+названий (names.normalize) и отдельный список ключей, начинающихся с каждого
+следующего слова названия («новгород» для «Нижний Новгород»). Подсказки находятся двоичным поиском начала диапазона и
+чтением не больше limit соседних ключей, поэтому время поиска почти не зависит
+от размера справочника. При изменении справочника меняется версия в общем для
+всех процессов кэше (CACHES в settings, не LocMemCache), и каждый процесс
+перестраивает свой индекс при следующем обращении.
+"""
+import uuid
+from bisect import bisect_left
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from .models import City
+from .names import WORD_RE, clean, normalize
+
+VERSION_KEY = 'cities:version'
+SUGGEST_LIMIT = 10
+# Слова короче не ищутся отдельно: «на» в «Ростов-на-Дону» подсказывало бы лишнее
+MIN_WORD_LENGTH = 3
+
+
+class CityIndex:
+    def __init__(self, rows):
+        # rows: [(pk, название)]
+        self.cities = {normalize(name): (pk, name) for pk, name in rows}
+        self.keys = sorted(self.cities)
+        self.words = sorted(
+            (key[match.start():], key)
+            for key in self.keys
+            for match in WORD_RE.finditer(key)
+            if match.start() and len(match[0]) >= MIN_WORD_LENGTH
+        )
+
+    @classmethod
+    def build(cls):
+        return cls(City.objects.values_list('pk', 'name').iterator())
+
+    def get(self, name):
+        """(pk, название) города из справочника или None"""
+        return self.cities.get(normalize(name))
+
+    def suggest(self, prefix, limit=SUGGEST_LIMIT):
+        """[(pk, название)]: сначала названия, начинающиеся с prefix, затем названия с таким словом внутри"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = []
+        start = bisect_left(self.keys, prefix)
+        for key in self.keys[start:start + limit]:
+            if not key.startswith(prefix):
+                break
+            found.append(key)
+        position = bisect_left(self.words, (prefix,))
+        while len(found) < limit and position < len(self.words):
+            word, key = self.words[position]
+            if not word.startswith(prefix):
+                break
+            if key not in found:
+                found.append(key)
+            position += 1
+        return [self.cities[key] for key in found]
+
+
+_index = None
+_index_version = None
+
+
+def get_version():
+    # Случайная версия вместо счетчика: после очистки кэша не совпадет со старой
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_index():
+    """Индекс текущей версии, перестраивается в процессе после изменений справочника"""
+    global _index, _index_version
+    version = get_version()
+    if _index is None or _index_version != version:
+        _index, _index_version = CityIndex.build(), version
+    return _index
+
+
+def invalidate():
+    """Сбросить индекс во всех процессах (при изменении справочника)"""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def suggest(prefix, limit=SUGGEST_LIMIT):
+    return get_index().suggest(prefix, limit)
+
+
+def canonical_name(name):
+    """Название города из справочника для фильтров; город не из справочника возвращается очищенным"""
+    city = get_index().get(name)
+    return city[1] if city else clean(name)
+
+
+async def acanonical_name(name):
+    # Индекс может перестраиваться запросом к БД, поэтому вызывается в потоке
+    return await sync_to_async(canonical_name)(name)
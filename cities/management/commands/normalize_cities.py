@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cities.services import CityService
+from content import feeds, recommendations
+from content.models import Event
+from content.services import LeaderboardService
+from organizations import dedup
+
+
+class Command(BaseCommand):
+    help = 'Привести города пользователей, НКО, новостей и мероприятий к справочнику городов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пачки при пересборке рейтингов')
+
+    def handle(self, *args, **options):
+        changed = CityService.backfill()
+        # UPDATE обходит сигналы, поэтому зависящие от города кэши и индексы обновляются явно
+        if any(changed.values()):
+            feeds.invalidate()
+            recommendations.invalidate()
+            transaction.on_commit(dedup.invalidate)
+        if changed.get(Event):
+            LeaderboardService.rebuild(options['batch_size'])
+        for model, count in changed.items():
+            self.stdout.write(f'{model._meta.label}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Записей изменено: {sum(changed.values())}'))
@@ -0,0 +1,39 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+
+from .names import clean, normalize
+
+
+class LoadedCityMixin:
+    """Запоминает город, прочитанный из БД: неизмененный город не сверяется со справочником при сохранении"""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_city = instance.__dict__.get('city')
+        return instance
+
+
+class City(models.Model):
+    """Город справочника; поля city пользователей, НКО, новостей и мероприятий хранят его название"""
+    name = models.CharField("Название", max_length=100)
+    # Нормализованное название (index.normalize): по нему совпадают варианты написания
+    key = models.CharField("Ключ", max_length=100, unique=True, editable=False)
+    created_at = models.DateTimeField("Добавлен", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Город"
+        verbose_name_plural = "Города"
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        if City.objects.filter(key=normalize(self.name)).exclude(pk=self.pk).exists():
+            raise ValidationError({'name': "Этот город уже есть в справочнике"})
+
+    def save(self, *args, **kwargs):
+        self.name = clean(self.name)
+        self.key = normalize(self.name)
+        super().save(*args, **kwargs)
@@ -0,0 +1,27 @@
+"""
+Нормализация названий городов: варианты написания («г. Саров», « саров »,
+«САРОВ») сводятся к одному ключу, по которому город ищется в справочнике.
+"""
+import re
+
+PREFIX_RE = re.compile(r'^(?:город\s+|гор\.\s*|г\.\s*|гор\s+|г\s+)', re.IGNORECASE)
+HYPHEN_RE = re.compile(r'\s*-\s*')
+WORD_RE = re.compile(r'[^\s-]+')
+# Служебные слова внутри названия пишутся строчными: «Ростов-на-Дону»
+LOWER_WORDS = {'на', 'над', 'под', 'де', 'у'}
+
+
+def clean(name):
+    """Название для показа: без «г.», лишних пробелов, с заглавной буквы"""
+    name = HYPHEN_RE.sub('-', ' '.join(name.split()))
+    name = PREFIX_RE.sub('', name)
+    if name.islower() or name.isupper():
+        # Ввод одним регистром: «нижний новгород», «САРОВ»
+        name = WORD_RE.sub(lambda match: match[0].lower() if match.start() and match[0].lower() in LOWER_WORDS
+                           else match[0].capitalize(), name)
+    return name[:1].upper() + name[1:]
+
+
+def normalize(name):
+    """Ключ города: варианты написания одного города дают один ключ"""
+    return clean(name).lower().replace('ё', 'е')
@@ -0,0 +1,98 @@
+from collections import Counter, defaultdict
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count
+
+from . import index
+from .models import City
+from .names import clean, normalize
+
+
+class CityService:
+    # Статусы проверенных модератором записей: только их города добавляются в справочник при сохранении.
+    # Город из профиля пользователя или непроверенной заявки связывается лишь с уже известным городом.
+    TRUSTED_STATUSES = ('approved', 'published', 'completed', 'archived')
+
+    @staticmethod
+    def linked_models():
+        """Модели с текстовым полем city и ссылкой city_ref на справочник"""
+        return [model for model in apps.get_models()
+                if any(field.name == 'city_ref' and field.related_model is City for field in model._meta.fields)]
+
+    @staticmethod
+    def is_trusted(instance):
+        """Можно ли добавить в справочник город записи: у пользователей статуса нет, и их города не добавляются"""
+        return getattr(instance, 'status', None) in CityService.TRUSTED_STATUSES
+
+    @staticmethod
+    def resolve(names, create=False):
+        """{ключ: город} для названий; с create города, которых нет в справочнике, добавляются одним запросом"""
+        names = {normalize(name): clean(name) for name in names}
+        names.pop('', None)
+        if not names:
+            return {}
+        cities = {city.key: city for city in City.objects.filter(key__in=names)}
+        missing = [City(name=name, key=key) for key, name in names.items() if key not in cities]
+        if missing and create:
+            # Тот же город мог добавить параллельный запрос, поэтому после вставки города перечитываются
+            City.objects.bulk_create(missing, ignore_conflicts=True)
+            cities.update((city.key, city) for city in City.objects.filter(key__in=[city.key for city in missing]))
+            # bulk_create не отправляет сигналы
+            transaction.on_commit(index.invalidate)
+        return cities
+
+    @staticmethod
+    def link(instances, create=False):
+        """
+        Заменить город объектов названием из справочника и проставить city_ref (без сохранения).
+        Без create неизвестный город остается как введен, с city_ref=None.
+        """
+        cities = CityService.resolve((instance.city for instance in instances), create=create)
+        for instance in instances:
+            city = cities.get(normalize(instance.city))
+            instance.city_ref = city
+            if city is not None:
+                instance.city = city.name
+
+    @staticmethod
+    def link_moderated(queryset):
+        """Добавить в справочник города одобренных записей, которые еще не связаны с ним (в обход сигналов)"""
+        instances = list(queryset.filter(city_ref__isnull=True).exclude(city='').only('pk', 'city'))
+        if instances:
+            CityService.link(instances, create=True)
+            queryset.model.objects.bulk_update(instances, ['city', 'city_ref'])
+        return len(instances)
+
+    @staticmethod
+    def backfill():
+        """
+        Привести поля city существующих записей к справочнику: варианты написания одного
+        города получают самое частое из них название. Записи меняются UPDATE по каждому
+        варианту в обход сигналов; возвращает {модель: число измененных записей}.
+        """
+        models = CityService.linked_models()
+        variants = defaultdict(Counter)
+        values = {}
+        for model in models:
+            values[model] = list(model.objects.exclude(city='').order_by()
+                                 .values_list('city').annotate(total=Count('pk')))
+            for value, total in values[model]:
+                variants[normalize(value)][clean(value)] += total
+        variants.pop('', None)
+
+        # При равной частоте выбирается первое по алфавиту название
+        cities = CityService.resolve((max(sorted(counter), key=counter.get) for counter in variants.values()),
+                                     create=True)
+        changed = {}
+        with transaction.atomic():
+            for model in models:
+                changed[model] = 0
+                for value, _ in values[model]:
+                    city = cities.get(normalize(value))
+                    if city is None:
+                        continue
+                    changed[model] += (model.objects.filter(city=value)
+                                       .exclude(city=city.name, city_ref=city)
+                                       .update(city=city.name, city_ref=city))
+        return changed
@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import index
+from .models import City
+from .services import CityService
+
+
+def link_city(sender, instance, update_fields=None, **kwargs):
+    """Привести город записи к справочнику перед сохранением"""
+    if update_fields is not None and 'city' not in update_fields:
+        return
+    city = instance.__dict__.get('city')
+    if instance.city_ref_id is not None and city is not None and city == getattr(instance, '_loaded_city', None):
+        return
+    CityService.link([instance], create=CityService.is_trusted(instance))
+    instance._loaded_city = instance.city
+
+
+for model in CityService.linked_models():
+    pre_save.connect(link_city, sender=model, dispatch_uid=f'cities.link_city.{model._meta.label_lower}')
+
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def invalidate_index(sender, **kwargs):
+    # Индекс живет в памяти процесса, поэтому сбрасываем его только после фиксации транзакции
+    transaction.on_commit(index.invalidate)
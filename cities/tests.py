@@ -0,0 +1,187 @@
+import io
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import User
+from content import moderation
+from content.models import Event, News
+from dobro.testing import create_event, create_news, create_nko, create_user
+from organizations.models import NKO
+from . import index
+from .index import CityIndex
+from .models import City
+from .names import clean, normalize
+
+
+class NamesTest(TestCase):
+    def test_spelling_variants_share_key(self):
+        for variant in (' г. Саров ', 'саров', 'САРОВ', 'город Саров', 'г.Саров', 'гор. саров'):
+            with self.subTest(variant=variant):
+                self.assertEqual(clean(variant), 'Саров')
+                self.assertEqual(normalize(variant), 'саров')
+        self.assertEqual(clean('ростов - на - дону'), 'Ростов-на-Дону')
+        self.assertEqual(clean('нижний   новгород'), 'Нижний Новгород')
+        self.assertEqual(normalize('Королёв'), normalize('королев'))
+        # Написанное смешанным регистром не переделывается
+        self.assertEqual(clean('Усть-Илимск'), 'Усть-Илимск')
+
+
+class CityIndexTest(TestCase):
+    def setUp(self):
+        names = ['Саров', 'Сарапул', 'Санкт-Петербург', 'Нижний Новгород', 'Великий Новгород', 'Ростов-на-Дону',
+                 'Королёв']
+        self.index = CityIndex(enumerate(names, 1))
+
+    def names(self, prefix, limit=10):
+        return [name for _, name in self.index.suggest(prefix, limit)]
+
+    def test_prefix_of_name(self):
+        self.assertEqual(self.names('сар'), ['Сарапул', 'Саров'])
+        self.assertEqual(self.names('  СА '), ['Санкт-Петербург', 'Сарапул', 'Саров'])
+        self.assertEqual(self.names('са', limit=1), ['Санкт-Петербург'])
+        self.assertEqual(self.names('королё'), ['Королёв'])
+        self.assertEqual(self.names('г. сар'), ['Сарапул', 'Саров'])
+        self.assertEqual(self.names(''), [])
+        self.assertEqual(self.names('москва'), [])
+
+    def test_prefix_of_following_word(self):
+        self.assertEqual(self.names('новг'), ['Великий Новгород', 'Нижний Новгород'])
+        self.assertEqual(self.names('петер'), ['Санкт-Петербург'])
+        self.assertEqual(self.names('дону'), ['Ростов-на-Дону'])
+        # Служебные слова отдельно не ищутся
+        self.assertEqual(self.names('на'), [])
+        # Совпадение с началом названия идет раньше совпадения со словом внутри
+        self.assertEqual(self.names('н'), ['Нижний Новгород', 'Великий Новгород'])
+
+    def test_get(self):
+        self.assertEqual(self.index.get('САРОВ'), (1, 'Саров'))
+        self.assertIsNone(self.index.get('Озерск'))
+
+
+class CityLinkTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_variants_link_to_one_city(self):
+        nko = create_nko(city='САРОВ')
+        news = create_news(city='Саров')
+        event = create_event(city='город Саров')
+        user = create_user(city=' г. саров ')
+        city = City.objects.get()
+        self.assertEqual((city.name, city.key), ('Саров', 'саров'))
+        for obj in (user, nko, news, event):
+            obj.refresh_from_db()
+            self.assertEqual((obj.city, obj.city_ref), ('Саров', city))
+
+        user.city = ''
+        user.save()
+        user.refresh_from_db()
+        self.assertIsNone(user.city_ref)
+
+    def test_unmoderated_input_does_not_add_cities(self):
+        user = create_user(city='озерск')
+        nko = create_nko(city='озерск', status='pending')
+        self.assertFalse(City.objects.exists())
+        for obj in (user, nko):
+            obj.refresh_from_db()
+            self.assertEqual((obj.city, obj.city_ref), ('озерск', None))
+
+        # Одобренная модератором заявка добавляет город в справочник
+        moderation.decide('approve', {'nko': [nko.pk]})
+        nko.refresh_from_db()
+        self.assertEqual((nko.city, nko.city_ref.name), ('Озерск', 'Озерск'))
+        # Профиль связывается с уже известным городом при следующем сохранении
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual((user.city, user.city_ref), ('Озерск', nko.city_ref))
+
+    def test_unchanged_city_is_not_checked(self):
+        create_nko(city='Саров')
+        nko = NKO.objects.get()
+        with self.assertNumQueries(1):
+            nko.save()
+
+        nko.city = 'озерск'
+        nko.save()
+        nko.refresh_from_db()
+        self.assertEqual((nko.city, nko.city_ref.name), ('Озерск', 'Озерск'))
+
+    def test_version_is_shared_between_processes(self):
+        # Версию меняет отдельный процесс, как команда cron или другой воркер
+        version = index.get_version()
+        subprocess.run([sys.executable, 'manage.py', 'shell', '-c', 'from cities import index; index.invalidate()'],
+                       cwd=settings.BASE_DIR, check=True, capture_output=True)
+        self.assertNotEqual(index.get_version(), version)
+
+    def test_new_city_resets_index(self):
+        index.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_nko(city='Озерск')
+        self.assertEqual(index.suggest('оз'), [(City.objects.get(name='Озерск').pk, 'Озерск')])
+        self.assertEqual(index.canonical_name('г. озерск'), 'Озерск')
+        # Города не из справочника фильтруются по очищенному вводу
+        self.assertEqual(index.canonical_name(' москва '), 'Москва')
+
+
+class BackfillTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_variants_are_merged_into_most_common(self):
+        nkos = [create_nko() for _ in range(3)]
+        news = create_news()
+        event = create_event()
+        # Записи, созданные до справочника: город как ввели, без ссылки
+        NKO.objects.filter(pk=nkos[0].pk).update(city='нижний  новгород', city_ref=None)
+        NKO.objects.filter(pk__in=[nkos[1].pk, nkos[2].pk]).update(city='Нижний Новгород', city_ref=None)
+        News.objects.filter(pk=news.pk).update(city='г. Нижний Новгород', city_ref=None)
+        Event.objects.filter(pk=event.pk).update(city='Озерск ', city_ref=None)
+        User.objects.update(city='', city_ref=None)
+        City.objects.all().delete()
+
+        out = io.StringIO()
+        call_command('normalize_cities', stdout=out)
+        self.assertIn('Записей изменено: 5', out.getvalue())
+        self.assertEqual(list(City.objects.values_list('name', flat=True)), ['Нижний Новгород', 'Озерск'])
+        city = City.objects.get(name='Нижний Новгород')
+        self.assertEqual(set(NKO.objects.values_list('city', 'city_ref')), {('Нижний Новгород', city.pk)})
+        self.assertEqual(News.objects.get().city_ref, city)
+        self.assertEqual(Event.objects.get().city, 'Озерск')
+        self.assertFalse(User.objects.filter(city_ref__isnull=False).exists())
+
+        out = io.StringIO()
+        call_command('normalize_cities', stdout=out)
+        self.assertIn('Записей изменено: 0', out.getvalue())
+
+
+class CityViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nko = create_nko(city='Нижний Новгород')
+            create_news(title='Новость Нижнего Новгорода', city='Нижний Новгород')
+            self.other = create_nko(city='Великий Новгород')
+        index.get_index()
+
+    def test_autocomplete(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('cities:autocomplete'), {'q': 'новгор', 'limit': 1})
+        self.assertEqual(response.json(), {'results': [{'id': self.other.city_ref_id, 'name': 'Великий Новгород'}]})
+        self.assertIn('max-age=300', response['Cache-Control'])
+        response = self.client.get(reverse('cities:autocomplete'), {'q': 'новгор', 'limit': 'x'})
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_filters_accept_spelling_variants(self):
+        response = self.client.get(reverse('organizations:nko_list'), {'city': 'нижний новгород'})
+        self.assertEqual(list(response.context['nkos']), [self.nko])
+        self.assertEqual(response.context['selected_city'], 'Нижний Новгород')
+        response = self.client.get(reverse('content:news_list'), {'city': 'г. Нижний  Новгород'})
+        self.assertContains(response, 'Новость Нижнего Новгорода')
+        response = self.client.get('/api/nko/', {'city': 'НИЖНИЙ НОВГОРОД'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.nko.pk])
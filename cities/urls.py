@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'cities'
+
+urlpatterns = [
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
+]
@@ -0,0 +1,18 @@
+from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
+
+from . import index
+
+MAX_LIMIT = 20
+
+
+@cache_control(max_age=300)
+def autocomplete(request):
+    """Подсказки городов по началу названия: ?q=сар&limit=10"""
+    try:
+        limit = min(max(int(request.GET.get('limit', index.SUGGEST_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        limit = index.SUGGEST_LIMIT
+    cities = index.suggest(request.GET.get('q', ''), limit)
+    return JsonResponse({'results': [{'id': pk, 'name': name} for pk, name in cities]},
+                        json_dumps_params={'ensure_ascii': False})
@@ -1,6 +1,10 @@
 from django.contrib import admin
+from django.utils import timezone
 from django.contrib.contenttypes.admin import GenericTabularInline
-from .models import News, Event, KnowledgeBase, Comment, EventParticipation, ContentView, ContentLike
+from dobro.bulk_import import ImportAdminMixin
+from . import feeds
+from .models import (News, Event, KnowledgeBase, Comment, EventParticipation, ContentView, ContentLike,
+                     LeaderboardEntry)
 
 
 class CommentInline(GenericTabularInline):
@@ -20,19 +24,23 @@ class NewsAdmin(admin.ModelAdmin):
 
     actions = ['publish_news', 'archive_news']
 
+    # Массовые обновления обходят сигналы, поэтому кэш лент сбрасываем явно
     def publish_news(self, request, queryset):
         queryset.update(status='published', published_at=timezone.now())
+        feeds.invalidate()
 
     publish_news.short_description = "Опубликовать выбранные новости"
 
     def archive_news(self, request, queryset):
         queryset.update(status='archived')
+        feeds.invalidate()
 
     archive_news.short_description = "Архивировать выбранные новости"
 
 
 @admin.register(Event)
-class EventAdmin(admin.ModelAdmin):
+class EventAdmin(ImportAdminMixin, admin.ModelAdmin):
+    import_kind = 'events'
     list_display = ['title', 'event_type', 'city', 'start_date', 'status', 'current_participants']
     list_filter = ['status', 'event_type', 'city', 'start_date']
     search_fields = ['title', 'description', 'created_by__username']
@@ -53,7 +61,8 @@ class EventAdmin(admin.ModelAdmin):
 
 
 @admin.register(KnowledgeBase)
-class KnowledgeBaseAdmin(admin.ModelAdmin):
+class KnowledgeBaseAdmin(ImportAdminMixin, admin.ModelAdmin):
+    import_kind = 'knowledge'
     list_display = ['title', 'category', 'author', 'difficulty_level', 'is_public', 'view_count']
     list_filter = ['category', 'difficulty_level', 'is_public', 'created_at']
     search_fields = ['title', 'content', 'author__username']
@@ -101,4 +110,12 @@ class ContentLikeAdmin(admin.ModelAdmin):
     list_display = ['content_object', 'user', 'created_at']
     list_filter = ['created_at', 'content_type']
     search_fields = ['user__username']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+
+
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ['user', 'city', 'period', 'period_start', 'hours', 'events']
+    list_filter = ['period', 'city']
+    search_fields = ['user__username']
+    raw_id_fields = ['user']
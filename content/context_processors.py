@@ -0,0 +1,15 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import moderation
+
+
+def moderation_counts(request):
+    """Счетчики очереди модерации для значка в меню; считаются только если шаблон их использует"""
+    # Асинхронные страницы загружают счетчики заранее (moderation.aload_counts)
+    if hasattr(request, 'moderation_counts'):
+        return {'moderation_counts': request.moderation_counts}
+    return {
+        'moderation_counts': SimpleLazyObject(
+            lambda: moderation.get_counts() if moderation.can_moderate(request.user) else {}
+        ),
+    }
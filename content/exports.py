@@ -0,0 +1,200 @@
+"""
+Выгрузка участников мероприятия в CSV и XLSX для организаторов.
+
+Участия читаются через values_list().iterator() пачками по CHUNK_SIZE строк,
+каждая пачка сразу превращается в кусок ответа StreamingHttpResponse, поэтому
+память не зависит от числа участников. XLSX собирается стандартным zipfile в
+потоковом режиме (без перемотки файла): лист пишется построчно inline-строками,
+без общей таблицы строк, которую пришлось бы держать в памяти целиком.
+Под ASGI куски отдаются асинхронным итератором (dobro.async_utils.streaming_content).
+
+В CSV значения, начинающиеся с =, +, -, @, табуляции или перевода строки, получают
+префикс ', чтобы таблица не выполнила их как формулу. В XLSX строки записываются
+inline-строками, которые формулой не считаются, поэтому остаются как есть.
+"""
+import csv
+import re
+import zipfile
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from dobro.async_utils import streaming_content
+from organizations.models import NKO
+from .models import EventParticipation
+
+CHUNK_SIZE = 2000
+# Роли в НКО-организаторе, которым доступна выгрузка
+MANAGER_ROLES = ('admin', 'moderator', 'coordinator')
+
+COLUMNS = [
+    ('Фамилия', 'user__last_name'),
+    ('Имя', 'user__first_name'),
+    ('Email', 'user__email'),
+    ('Телефон', 'user__phone'),
+    ('Город', 'user__city'),
+    ('Статус', 'status'),
+    ('Часов волонтерства', 'volunteer_hours'),
+    ('Зарегистрирован', 'registered_at'),
+]
+STATUSES = dict(EventParticipation.STATUS_CHOICES)
+
+# Начало формулы в Excel и LibreOffice
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+# Управляющие символы, недопустимые в XML
+ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def can_export(user, event):
+    """Выгрузка доступна автору мероприятия, модераторам и руководству НКО-организатора"""
+    if not user.is_authenticated:
+        return False
+    if event.created_by_id == user.pk or user.is_moderator_or_admin():
+        return True
+    if not event.nko_id:
+        return False
+    return NKO.objects.filter(pk=event.nko_id).filter(
+        Q(owner=user) |
+        Q(memberships__user=user, memberships__status='approved', memberships__role__in=MANAGER_ROLES)
+    ).exists()
+
+
+def escape_formula(value):
+    """Текст, который таблица не примет за формулу"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def get_rows(event):
+    """Строки выгрузки по порядку регистрации, без создания моделей"""
+    participations = (EventParticipation.objects.filter(event=event).order_by('pk')
+                      .values_list(*[field for _, field in COLUMNS]))
+    for *user, status, hours, registered_at in participations.iterator(chunk_size=CHUNK_SIZE):
+        yield [*user, STATUSES.get(status, status), hours,
+               timezone.localtime(registered_at).strftime('%d.%m.%Y %H:%M')]
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+class Echo:
+    """Псевдофайл: csv.writer возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    # BOM, чтобы Excel распознал UTF-8
+    yield '\ufeff' + writer.writerow([title for title, _ in COLUMNS])
+    for chunk in chunks(rows, CHUNK_SIZE):
+        yield ''.join(writer.writerow(map(escape_formula, row)) for row in chunk)
+
+
+class Buffer:
+    """Файл без перемотки: zipfile пишет в него, генератор забирает записанное"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts.clear()
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Участники" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+
+
+def xlsx_cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, int):
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(ILLEGAL_XML.sub("", str(value)))}</t></is></c>'
+
+
+def xlsx_row(row):
+    return '<row>' + ''.join(xlsx_cell(value) for value in row) + '</row>'
+
+
+def render_xlsx(rows):
+    buffer = Buffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write((SHEET_START + xlsx_row([title for title, _ in COLUMNS])).encode())
+            for chunk in chunks(rows, CHUNK_SIZE):
+                sheet.write(''.join(xlsx_row(row) for row in chunk).encode())
+                yield buffer.drain()
+            sheet.write(SHEET_END.encode())
+    yield buffer.drain()
+
+
+FORMATS = {
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (render_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def export_response(request, event, format):
+    """Потоковый ответ с файлом выгрузки"""
+    render, content_type = FORMATS[format]
+    response = StreamingHttpResponse(streaming_content(request, render(get_rows(event))), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="event-{event.pk}-participants.{format}"'
+    return response
@@ -0,0 +1,153 @@
+"""
+RSS и Atom ленты новостей: все новости, новости города и новости НКО.
+
+Готовая лента хранится в кэше вместе с ETag и Last-Modified до следующей
+публикации в ее области: ключ содержит версию области, которую сигналы
+новостей меняют при публикации, правке или удалении. Если в области есть
+новость с отложенной датой публикации, запись живет только до этой даты.
+"""
+import hashlib
+import uuid
+
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db.models import Min
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from django.utils.http import parse_http_date
+from django.utils.text import Truncator
+
+from organizations.models import NKO
+from .models import News
+
+FEED_SIZE = 20
+FEED_TIMEOUT = 24 * 60 * 60
+# Меняется при массовых правках (admin, transition_content), которые обходят сигналы
+GENERATION_KEY = 'news_feed:generation'
+
+# Поля, от которых зависит содержимое лент
+FEED_FIELDS = {'title', 'excerpt', 'content', 'status', 'published_at', 'city', 'nko', 'slug', 'author'}
+
+
+def get_scopes(city=None, nko_id=None):
+    """Области, в которые попадает новость: общая лента, ее город и ее НКО"""
+    scopes = ['all']
+    if city:
+        scopes.append(f'city:{hashlib.md5(city.encode()).hexdigest()}')
+    if nko_id:
+        scopes.append(f'nko:{nko_id}')
+    return scopes
+
+
+def published_news(city=None, nko_id=None):
+    news = News.objects.filter(status='published')
+    if city:
+        news = news.filter(city=city)
+    if nko_id:
+        news = news.filter(nko_id=nko_id)
+    return news
+
+
+def version_key(scope):
+    return f'news_feed:version:{scope}'
+
+
+def get_versions(keys):
+    """Текущие версии; отсутствующие создаются, чтобы не совпасть со старыми после вытеснения"""
+    versions = cache.get_many(keys)
+    for key in set(keys) - set(versions):
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        versions[key] = cache.get(key)
+    return versions
+
+
+def invalidate(*scopes):
+    """Сбросить ленты областей; без аргументов - все ленты"""
+    keys = [version_key(scope) for scope in scopes] if scopes else [GENERATION_KEY]
+    cache.set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+
+
+class NewsFeed(Feed):
+    feed_type = Rss201rev2Feed
+
+    def get_object(self, request, city=None, nko_id=None):
+        nko = get_object_or_404(NKO.objects.only('name'), pk=nko_id, is_active=True) if nko_id else None
+        return {'city': city, 'nko': nko}
+
+    def title(self, scope):
+        if scope['nko']:
+            return f"Новости: {scope['nko'].name}"
+        if scope['city']:
+            return f"Новости: {scope['city']}"
+        return 'Новости - Добрые дела Росатома'
+
+    def link(self, scope):
+        if scope['nko']:
+            return reverse('organizations:nko_detail', args=[scope['nko'].pk])
+        url = reverse('content:news_list')
+        return f"{url}?city={scope['city']}" if scope['city'] else url
+
+    def description(self, scope):
+        return 'Новости волонтерских и некоммерческих организаций'
+
+    def items(self, scope):
+        # Диапазон частичного индекса news_live_idx
+        news = published_news(scope['city'], scope['nko'] and scope['nko'].pk)
+        return (news.filter(published_at__lte=timezone.now()).select_related('author')
+                .order_by('-published_at')[:FEED_SIZE])
+
+    def item_title(self, item):
+        return item.title
+
+    def item_description(self, item):
+        return item.excerpt or Truncator(item.content).words(50)
+
+    def item_link(self, item):
+        return reverse('content:news_detail', args=[item.slug])
+
+    def item_pubdate(self, item):
+        return item.published_at
+
+    def item_updateddate(self, item):
+        return item.updated_at
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+
+class AtomNewsFeed(NewsFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, scope):
+        return self.description(scope)
+
+
+FEEDS = {'rss': NewsFeed(), 'atom': AtomNewsFeed()}
+
+
+def get_cached(request, format, city=None, nko_id=None):
+    """(тело, Content-Type, ETag, Last-Modified) ленты; строится только при смене версии области"""
+    scope = get_scopes(city, nko_id)[-1]
+    keys = [GENERATION_KEY, version_key(scope)]
+    versions = get_versions(keys)
+    key = f"news_feed:{format}:{scope}:{versions[keys[0]]}:{versions[keys[1]]}:{request.get_host()}"
+    entry = cache.get(key)
+    if entry is None:
+        response = FEEDS[format](request, city=city, nko_id=nko_id)
+        last_modified = response.get('Last-Modified')
+        entry = (
+            response.content,
+            response['Content-Type'],
+            f'"{hashlib.md5(response.content).hexdigest()}"',
+            parse_http_date(last_modified) if last_modified else None,
+        )
+        # Отложенная публикация не меняет версию, поэтому запись живет только до нее
+        scheduled = (published_news(city, nko_id).filter(published_at__gt=timezone.now())
+                     .aggregate(next=Min('published_at'))['next'])
+        timeout = FEED_TIMEOUT
+        if scheduled:
+            timeout = max(1, min(timeout, int((scheduled - timezone.now()).total_seconds()) + 1))
+        cache.set(key, entry, timeout)
+    return entry
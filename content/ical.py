@@ -0,0 +1,134 @@
+"""
+Календарные подписки (iCalendar, RFC 5545) на мероприятия города, НКО
+или собственные регистрации пользователя.
+
+Календарные приложения опрашивают подписки постоянно, поэтому версия ленты
+(ETag и Last-Modified) считается одним агрегатом по отфильтрованному набору,
+и неизменившаяся лента отвечает 304 без сериализации. Тело ленты строится
+генератором поверх iterator() кусками по chunk_size мероприятий, так что
+мероприятия не загружаются в память целиком; под ASGI куски отдаются
+асинхронным итератором (dobro.async_utils.streaming_content).
+"""
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.core import signing
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Event
+
+# Отмененные мероприятия остаются в ленте со STATUS:CANCELLED, чтобы клиенты убрали их из календаря
+FEED_STATUSES = ('published', 'completed', 'cancelled')
+# Насколько давние мероприятия еще попадают в ленту
+HISTORY = timedelta(days=30)
+PARTICIPANT_STATUSES = ('registered', 'confirmed', 'attended')
+TOKEN_SALT = 'content.ical'
+LINE_LIMIT = 75
+
+FIELDS = ('title', 'description', 'start_date', 'end_date', 'city', 'address', 'online', 'online_link',
+          'status', 'updated_at')
+
+
+def get_events(city=None, nko_id=None, user_id=None):
+    """Мероприятия подписки: будущие и недавние, по индексу (start_date, status)"""
+    events = Event.objects.filter(status__in=FEED_STATUSES, start_date__gte=timezone.now() - HISTORY)
+    if city:
+        events = events.filter(city=city)
+    if nko_id:
+        events = events.filter(nko_id=nko_id)
+    if user_id:
+        events = events.filter(eventparticipation__user_id=user_id,
+                               eventparticipation__status__in=PARTICIPANT_STATUSES)
+    return events
+
+
+def get_state(events):
+    """(ETag, время последнего изменения) набора мероприятий одним запросом"""
+    # Количество входит в ETag, потому что удаление или выход из набора не меняет max(updated_at)
+    state = events.order_by().aggregate(total=Count('pk'), last=Max('updated_at'))
+    last = state['last']
+    version = f"{state['total']}:{last.timestamp() if last else 0}"
+    return hashlib.md5(version.encode()).hexdigest(), last
+
+
+def user_token(user):
+    """Секрет личной ленты: календарные приложения не передают cookies сессии"""
+    return signing.Signer(salt=TOKEN_SALT).sign(str(user.pk))
+
+
+def user_from_token(token):
+    """pk пользователя по секрету ленты или None"""
+    try:
+        return int(signing.Signer(salt=TOKEN_SALT).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line):
+    """Строка свойства, разбитая на части не длиннее 75 байт (не разрывая символы UTF-8)"""
+    encoded = line.encode()
+    parts = []
+    limit = LINE_LIMIT
+    while len(encoded) > limit:
+        cut = limit
+        while encoded[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut])
+        encoded = encoded[cut:]
+        # Строки продолжения начинаются с пробела
+        limit = LINE_LIMIT - 1
+    parts.append(encoded)
+    return '\r\n '.join(part.decode() for part in parts) + '\r\n'
+
+
+def format_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def vevent(event, base_url, host):
+    if event.online:
+        location = event.online_link or 'Онлайн'
+    else:
+        location = f'{event.city}, {event.address}'
+    properties = [
+        ('UID', f'event-{event.pk}@{host}'),
+        ('DTSTAMP', format_datetime(event.updated_at)),
+        ('LAST-MODIFIED', format_datetime(event.updated_at)),
+        ('DTSTART', format_datetime(event.start_date)),
+        ('DTEND', format_datetime(event.end_date)),
+        ('SUMMARY', escape(event.title)),
+        ('DESCRIPTION', escape(event.description)),
+        ('LOCATION', escape(location)),
+        ('URL', base_url + reverse('content:event_detail', args=[event.pk])),
+        ('STATUS', 'CANCELLED' if event.status == 'cancelled' else 'CONFIRMED'),
+    ]
+    lines = ['BEGIN:VEVENT\r\n']
+    lines.extend(fold(f'{name}:{value}') for name, value in properties)
+    lines.append('END:VEVENT\r\n')
+    return ''.join(lines)
+
+
+def render(events, name, request, chunk_size=500):
+    """Генератор текста ленты: заголовок, по VEVENT на мероприятие, окончание"""
+    base_url = f'{request.scheme}://{request.get_host()}'
+    host = request.get_host().split(':')[0]
+    yield ''.join([
+        'BEGIN:VCALENDAR\r\n',
+        'VERSION:2.0\r\n',
+        'PRODID:-//Добрые дела Росатома//Мероприятия//RU\r\n',
+        'CALSCALE:GREGORIAN\r\n',
+        'METHOD:PUBLISH\r\n',
+        fold(f'X-WR-CALNAME:{escape(name)}'),
+    ])
+    events = events.order_by('start_date').only(*FIELDS).iterator(chunk_size=chunk_size)
+    while chunk := list(islice(events, chunk_size)):
+        yield ''.join(vevent(event, base_url, host) for event in chunk)
+    yield 'END:VCALENDAR\r\n'
@@ -0,0 +1,65 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from dobro.benchmarks import compare, make_report, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк сервисов и страниц на синтетических данных с проверкой регрессий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[1, 5], help='Масштабы seed_data')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого замера')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора данных')
+        parser.add_argument('--output', default=settings.BASE_DIR / 'benchmarks' / 'results.json',
+                            help='Куда сохранить результаты')
+        parser.add_argument('--baseline', default=settings.BASE_DIR / 'benchmarks' / 'baseline.json',
+                            help='Сохраненная база для сравнения')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Допустимый рост p95 (доля от базы)')
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Записать результаты как новую базу')
+
+    def handle(self, *args, **options):
+        # Бенчмарк работает на отдельной тестовой БД и не трогает рабочие данные
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(DEBUG=False, SQL_INSTRUMENTATION={'ENABLED': False}):
+                results = run_benchmarks(options['scales'], options['repeat'], options['seed'],
+                                         stdout=self.stdout)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        report = make_report(results, options['scales'], options['repeat'], options['seed'])
+        self.write_json(options['output'], report)
+        self.stdout.write(f'Результаты сохранены в {options["output"]}')
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            self.write_json(baseline_path, report)
+            self.stdout.write(self.style.SUCCESS(f'База обновлена: {baseline_path}'))
+            return
+
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(
+                f'База {baseline_path} не найдена, запустите с --update-baseline'
+            ))
+            return
+
+        baseline = json.loads(baseline_path.read_text(encoding='utf-8'))['results']
+        regressions = compare(results, baseline, options['tolerance'])
+        if regressions:
+            for regression in regressions:
+                self.stderr.write(regression)
+            raise CommandError(f'Обнаружено регрессий: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий не обнаружено'))
+
+    @staticmethod
+    def write_json(path, data):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
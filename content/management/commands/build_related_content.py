@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from content import related
+
+
+class Command(BaseCommand):
+    help = 'Пересобрать индекс похожих новостей и материалов базы знаний (MinHash/LSH)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пачки при чтении и записи')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        indexed = related.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано материалов: {indexed} за {time.perf_counter() - started:.1f} с'
+        ))
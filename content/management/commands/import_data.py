@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import User
+from dobro import bulk_import
+
+
+class Command(BaseCommand):
+    help = 'Импортировать мероприятия, НКО или материалы базы знаний из CSV/JSONL с продолжением после сбоя'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(bulk_import.KINDS), help='Что импортируется')
+        parser.add_argument('path', help='Файл .csv или .jsonl в UTF-8')
+        parser.add_argument('--user', required=True, help='Логин автора (владельца) импортируемых записей')
+        parser.add_argument('--format', choices=bulk_import.FORMATS, help='Формат файла (по умолчанию по расширению)')
+        parser.add_argument('--batch-size', type=int, default=bulk_import.BATCH_SIZE, help='Строк в одной пачке')
+        parser.add_argument('--checkpoint', help='Файл контрольной точки (по умолчанию <path>.checkpoint)')
+        parser.add_argument('--restart', action='store_true', help='Начать с начала, игнорируя контрольную точку')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if format not in bulk_import.FORMATS:
+            raise CommandError('Не удалось определить формат файла, укажите --format')
+        try:
+            owner = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+
+        checkpoint = bulk_import.Checkpoint(options['checkpoint'] or f'{path}.checkpoint', options['kind'])
+        start_after = 0
+        if not options['restart']:
+            try:
+                start_after = checkpoint.load()
+            except ValueError as e:
+                raise CommandError(f'{e}, используйте --restart')
+        if start_after:
+            self.stdout.write(f'Продолжаем после строки {start_after}')
+
+        def save_checkpoint(report):
+            checkpoint.save(report)
+            self.stdout.write(f'Обработано строк: {report.processed}, создано: {report.created}')
+
+        importer = bulk_import.Importer(options['kind'], owner, batch_size=options['batch_size'])
+        started = time.perf_counter()
+        with open(path, encoding='utf-8-sig', newline='') as file:
+            report = importer.run(bulk_import.read_rows(file, format), start_after=start_after,
+                                  on_batch=save_checkpoint)
+
+        for line, message in report.errors:
+            self.stderr.write(f'Строка {line}: {message}')
+        if report.error_count > len(report.errors):
+            self.stderr.write(f'... и еще {report.error_count - len(report.errors)} ошибок')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {report.created} из {report.processed}, ошибок: {report.error_count} '
+            f'за {time.perf_counter() - started:.1f} с'
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from content.services import LeaderboardService
+
+
+class Command(BaseCommand):
+    help = 'Пересобрать рейтинги волонтеров по таблице участий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пачки при чтении и записи')
+
+    def handle(self, *args, **options):
+        created = LeaderboardService.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Записей в рейтингах: {created}'))
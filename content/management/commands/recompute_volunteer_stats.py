@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from content.services import VolunteerStatsService
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать часы и количество участий волонтеров по таблице участий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Пользователей в одной порции')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать количество расхождений')
+
+    def handle(self, *args, **options):
+        checked, fixed = VolunteerStatsService.recompute(options['chunk_size'], options['dry_run'])
+        action = 'найдено расхождений' if options['dry_run'] else 'исправлено'
+        self.stdout.write(self.style.SUCCESS(f'Проверено пользователей: {checked}, {action}: {fixed}'))
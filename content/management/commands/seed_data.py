@@ -0,0 +1,501 @@
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User, UserProfile
+from cities.services import CityService
+from organizations.models import NKO, NKOMembership
+from content.models import (News, Event, KnowledgeBase, Comment, EventParticipation,
+                            ContentView, ContentLike)
+from content.services import VolunteerStatsService, LeaderboardService
+from content import related, reminders
+from content.slugs import SlugAllocator
+
+SEED_PREFIX = 'seed_'
+# Анонимные просмотры получают адреса из диапазона для бенчмарков (RFC 2544)
+SEED_IP_PREFIX = '198.18.'
+
+# Объем данных на единицу --scale
+PER_SCALE = {
+    'users': 200,
+    'nkos': 10,
+    'news': 50,
+    'events': 30,
+    'knowledge': 10,
+    'comments': 300,
+    'likes': 500,
+    'views': 20000,
+}
+
+# Города присутствия Росатома с весами, примерно пропорциональными населению
+CITIES = [
+    ('Москва', 30), ('Санкт-Петербург', 15), ('Нижний Новгород', 8), ('Екатеринбург', 8),
+    ('Томск', 5), ('Обнинск', 4), ('Ангарск', 4), ('Волгодонск', 4), ('Северск', 3),
+    ('Саров', 3), ('Снежинск', 2), ('Озерск', 2), ('Новоуральск', 2), ('Железногорск', 2),
+    ('Зеленогорск', 2), ('Глазов', 2), ('Димитровград', 2), ('Заречный', 1), ('Лесной', 1),
+    ('Трехгорный', 1), ('Полярные Зори', 1), ('Удомля', 1), ('Десногорск', 1),
+    ('Курчатов', 1), ('Нововоронеж', 1), ('Сосновый Бор', 1), ('Билибино', 1), ('Певек', 1),
+]
+
+USER_ROLES = [
+    ('volunteer', 70), ('corporate_volunteer', 15), ('nko_representative', 10),
+    ('corporate_coordinator', 3), ('moderator', 2),
+]
+NKO_STATUSES = [('approved', 80), ('pending', 10), ('draft', 5), ('rejected', 5)]
+NKO_CATEGORIES = [
+    ('ecology', 20), ('animals', 15), ('children', 20), ('elderly', 10),
+    ('sport', 10), ('culture', 10), ('education', 10), ('health', 5),
+]
+MEMBERSHIP_ROLES = [('member', 60), ('volunteer', 30), ('coordinator', 7), ('moderator', 2), ('admin', 1)]
+MEMBERSHIP_STATUSES = [('approved', 75), ('pending', 15), ('rejected', 5), ('banned', 5)]
+NEWS_STATUSES = [('published', 85), ('pending', 5), ('draft', 5), ('archived', 5)]
+EVENT_STATUSES = [('published', 80), ('pending', 5), ('draft', 5), ('cancelled', 5), ('completed', 5)]
+EVENT_TYPES = [
+    ('volunteer', 30), ('cleanup', 20), ('meeting', 15), ('training', 10),
+    ('celebration', 10), ('fundraising', 10), ('conference', 5),
+]
+KNOWLEDGE_CATEGORIES = [
+    ('guide', 25), ('volunteer', 20), ('law', 15), ('finance', 15),
+    ('reporting', 10), ('success_story', 10), ('methodology', 5),
+]
+DIFFICULTY_LEVELS = [('beginner', 60), ('intermediate', 30), ('advanced', 10)]
+PAST_PARTICIPATION_STATUSES = [('attended', 70), ('no_show', 15), ('cancelled', 15)]
+FUTURE_PARTICIPATION_STATUSES = [('registered', 70), ('confirmed', 20), ('cancelled', 10)]
+
+FIRST_NAMES = ['Александр', 'Мария', 'Дмитрий', 'Анна', 'Сергей', 'Елена', 'Иван', 'Ольга',
+               'Андрей', 'Наталья', 'Алексей', 'Татьяна', 'Михаил', 'Екатерина', 'Павел', 'Юлия']
+LAST_NAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов',
+              'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев']
+SKILLS = ['первая помощь', 'фотография', 'дизайн', 'программирование', 'вождение', 'педагогика',
+          'психология', 'английский язык', 'организация мероприятий', 'smm', 'юриспруденция',
+          'бухгалтерия', 'медицина', 'спорт', 'музыка', 'кулинария', 'строительство',
+          'садоводство', 'ветеринария', 'видеомонтаж']
+INTERESTS = ['экология', 'животные', 'дети', 'пожилые', 'спорт', 'культура', 'образование',
+             'здоровье', 'история', 'наука', 'туризм', 'искусство']
+WEEKDAYS = ['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс']
+WORDS = ['волонтеры', 'город', 'помощь', 'акция', 'субботник', 'парк', 'дети', 'приют', 'уборка',
+         'экология', 'сбор', 'средства', 'праздник', 'концерт', 'спорт', 'забег', 'обучение',
+         'семинар', 'проект', 'грант', 'отчет', 'организация', 'команда', 'жители', 'школа',
+         'библиотека', 'музей', 'пожилые', 'животные', 'деревья', 'посадка', 'мусор', 'раздельный',
+         'фестиваль', 'выставка', 'мастер-класс', 'лекция', 'донор', 'кровь', 'здоровье',
+         'инициатива', 'росатом', 'атом', 'энергия', 'наука', 'история', 'память', 'ветераны']
+
+
+def weighted(choices):
+    """Кумулятивные веса для быстрого random.choices"""
+    values = [value for value, _ in choices]
+    return values, list(accumulate(weight for _, weight in choices))
+
+
+@contextmanager
+def preserve_timestamps(*models):
+    """Временно отключить auto_now/auto_now_add, чтобы сохранить сгенерированные даты"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1, help='Множитель объема данных')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Размер пачки bulk_create')
+        parser.add_argument('--clear', action='store_true', help='Удалить ранее сгенерированные данные')
+
+    def handle(self, *args, **options):
+        if options['scale'] < 1:
+            raise CommandError('--scale должен быть положительным')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.total_rows = 0
+
+        if options['clear']:
+            self.clear()
+        if User.objects.filter(username__startswith=SEED_PREFIX).exists():
+            raise CommandError('Данные уже сгенерированы, используйте --clear')
+
+        counts = {key: value * options['scale'] for key, value in PER_SCALE.items()}
+        started = time.perf_counter()
+
+        with preserve_timestamps(User, UserProfile, NKO, NKOMembership, News, Event, KnowledgeBase,
+                                 Comment, EventParticipation, ContentView, ContentLike):
+            users = self.create_users(counts['users'])
+            nkos = self.create_nkos(counts['nkos'], users)
+            self.create_memberships(nkos, users)
+            news = self.create_news(counts['news'], users, nkos)
+            events = self.create_events(counts['events'], users, nkos)
+            knowledge = self.create_knowledge(counts['knowledge'], users)
+
+            targets = self.popularity_targets(news, events, knowledge)
+            self.create_comments(counts['comments'], targets, users)
+            self.create_likes(counts['likes'], targets, users)
+            self.create_views(counts['views'], targets, users)
+
+        # Данные созданы через bulk_create без сигналов, связи со справочником городов, статистику,
+        # рейтинги, похожие материалы и очередь напоминаний считаем отдельно
+        CityService.backfill()
+        VolunteerStatsService.recompute(self.batch_size)
+        LeaderboardService.rebuild(self.batch_size)
+        related.rebuild(self.batch_size)
+        reminders.rebuild(self.batch_size)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {self.total_rows} строк за {elapsed:.1f} с '
+            f'({self.total_rows / elapsed:.0f} строк/с)'
+        ))
+
+    # Вспомогательные методы
+
+    def clear(self):
+        """Удалить данные, созданные предыдущим запуском"""
+        ContentView.objects.filter(user__isnull=True, ip_address__startswith=SEED_IP_PREFIX).delete()
+        User.objects.filter(username__startswith=SEED_PREFIX).delete()
+        self.stdout.write('Старые данные удалены')
+
+    def pick(self, choices, k=None):
+        values, cum_weights = weighted(choices)
+        if k is None:
+            return self.rng.choices(values, cum_weights=cum_weights)[0]
+        return self.rng.choices(values, cum_weights=cum_weights, k=k)
+
+    def past_date(self, mean_days, max_days=730):
+        """Дата в прошлом, чаще недавняя"""
+        days = min(self.rng.expovariate(1 / mean_days), max_days)
+        return self.now - timedelta(days=days, seconds=self.rng.randrange(86400))
+
+    def text(self, words):
+        return ' '.join(self.rng.choices(WORDS, k=words)).capitalize() + '.'
+
+    def group_size(self, limit, scale=3):
+        """Размер группы с тяжелым хвостом: большинство маленьких, единицы огромные"""
+        return min(int(self.rng.paretovariate(1.2) * scale), limit)
+
+    def bulk_insert(self, model, objects, return_objects=False):
+        """Вставить объекты пачками через bulk_create с отчетом о скорости"""
+        started = time.perf_counter()
+        created = []
+        count = 0
+        objects = iter(objects)
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            count += len(batch)
+            if return_objects:
+                created.extend(batch)
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.total_rows += count
+        self.stdout.write(
+            f'{model.__name__}: {count} строк за {elapsed:.2f} с '
+            f'({count / elapsed:.0f} строк/с)'
+        )
+        return created
+
+    # Генераторы данных
+
+    def create_users(self, count):
+        password = make_password('password')
+        roles = self.pick(USER_ROLES, k=count)
+        cities = self.pick(CITIES, k=count)
+
+        def rows():
+            for i in range(count):
+                joined = self.past_date(365)
+                yield User(
+                    username=f'{SEED_PREFIX}{i}',
+                    email=f'{SEED_PREFIX}{i}@example.com',
+                    password=password,
+                    first_name=self.rng.choice(FIRST_NAMES),
+                    last_name=self.rng.choice(LAST_NAMES),
+                    role=roles[i],
+                    city=cities[i],
+                    skills=', '.join(self.rng.sample(SKILLS, self.rng.randint(0, 4))),
+                    interests=', '.join(self.rng.sample(INTERESTS, self.rng.randint(0, 3))),
+                    email_verified=self.rng.random() < 0.8,
+                    date_joined=joined,
+                    updated_at=joined,
+                    last_activity=joined + (self.now - joined) * self.rng.random(),
+                )
+
+        users = self.bulk_insert(User, rows(), return_objects=True)
+
+        def profiles():
+            for user in users:
+                days = sorted(self.rng.sample(range(7), self.rng.randint(1, 7)))
+                yield UserProfile(
+                    user_id=user.pk,
+                    available_weekdays=','.join(WEEKDAYS[day] for day in days),
+                    has_car=self.rng.random() < 0.3,
+                    created_at=user.date_joined,
+                    updated_at=user.date_joined,
+                )
+
+        self.bulk_insert(UserProfile, profiles())
+        return users
+
+    def create_nkos(self, count, users):
+        def rows():
+            for i in range(count):
+                created = self.past_date(365)
+                yield NKO(
+                    name=f'{self.text(2)[:-1]} {i}',
+                    description=self.text(40),
+                    mission=self.text(15),
+                    category=self.pick(NKO_CATEGORIES),
+                    email=f'nko{i}@example.com',
+                    city=self.pick(CITIES),
+                    owner_id=self.rng.choice(users).pk,
+                    status=self.pick(NKO_STATUSES),
+                    created_at=created,
+                    updated_at=created,
+                )
+
+        return self.bulk_insert(NKO, rows(), return_objects=True)
+
+    def create_memberships(self, nkos, users):
+        def rows():
+            for nko in nkos:
+                for user in self.rng.sample(users, self.group_size(len(users))):
+                    status = self.pick(MEMBERSHIP_STATUSES)
+                    if status == 'approved':
+                        nko.member_count += 1
+                    joined = nko.created_at + (self.now - nko.created_at) * self.rng.random()
+                    yield NKOMembership(
+                        user_id=user.pk,
+                        nko_id=nko.pk,
+                        role=self.pick(MEMBERSHIP_ROLES),
+                        status=status,
+                        joined_at=joined,
+                        updated_at=joined,
+                    )
+
+        self.bulk_insert(NKOMembership, rows())
+        # bulk_create не вызывает сигналы, поэтому счетчики сохраняем сами
+        NKO.objects.bulk_update(nkos, ['member_count'], batch_size=self.batch_size)
+
+    def create_news(self, count, users, nkos):
+        slugs = SlugAllocator(News)
+
+        def rows():
+            for _ in range(count):
+                status = self.pick(NEWS_STATUSES)
+                published = self.past_date(120)
+                title = self.text(6)[:-1]
+                yield News(
+                    title=title,
+                    content=self.text(150),
+                    excerpt=self.text(25),
+                    author_id=self.rng.choice(users).pk,
+                    nko_id=self.rng.choice(nkos).pk if nkos and self.rng.random() < 0.6 else None,
+                    status=status,
+                    is_featured=self.rng.random() < 0.05,
+                    city=self.pick(CITIES),
+                    published_at=published if status in ('published', 'archived') else None,
+                    created_at=published - timedelta(hours=self.rng.randint(1, 72)),
+                    updated_at=published,
+                    slug=slugs.allocate(title),
+                )
+
+        return self.bulk_insert(News, rows(), return_objects=True)
+
+    def create_events(self, count, users, nkos):
+        participations = []
+
+        def rows():
+            for _ in range(count):
+                start = self.now + timedelta(days=self.rng.uniform(-365, 180))
+                start = start.replace(minute=0, second=0, microsecond=0)
+                online = self.rng.random() < 0.15
+                max_participants = None if self.rng.random() < 0.3 else self.rng.randint(10, 200)
+                participants = self.rng.sample(
+                    users, self.group_size(min(max_participants or len(users), len(users)), scale=5)
+                )
+                statuses = PAST_PARTICIPATION_STATUSES if start < self.now else FUTURE_PARTICIPATION_STATUSES
+                planned = [(user, self.pick(statuses)) for user in participants]
+                participations.append(planned)
+                created = start - timedelta(days=self.rng.randint(7, 60))
+                yield Event(
+                    title=self.text(5)[:-1],
+                    description=self.text(80),
+                    event_type=self.pick(EVENT_TYPES),
+                    start_date=start,
+                    end_date=start + timedelta(hours=self.rng.randint(2, 8)),
+                    registration_deadline=start - timedelta(days=1) if self.rng.random() < 0.7 else None,
+                    city=self.pick(CITIES),
+                    address='' if online else f'ул. {self.rng.choice(LAST_NAMES)}а, {self.rng.randint(1, 120)}',
+                    online=online,
+                    online_link='https://example.com/meet' if online else '',
+                    nko_id=self.rng.choice(nkos).pk if nkos and self.rng.random() < 0.8 else None,
+                    created_by_id=self.rng.choice(users).pk,
+                    max_participants=max_participants,
+                    current_participants=sum(1 for _, status in planned if status != 'cancelled'),
+                    status=self.pick(EVENT_STATUSES),
+                    is_featured=self.rng.random() < 0.05,
+                    requirements=', '.join(self.rng.sample(SKILLS, self.rng.randint(0, 3))),
+                    what_to_bring=self.text(5),
+                    created_at=created,
+                    updated_at=created,
+                )
+
+        events = self.bulk_insert(Event, rows(), return_objects=True)
+
+        def participation_rows():
+            for event, planned in zip(events, participations):
+                for user, status in planned:
+                    registered = event.created_at + (event.start_date - event.created_at) * self.rng.random()
+                    yield EventParticipation(
+                        user_id=user.pk,
+                        event_id=event.pk,
+                        status=status,
+                        volunteer_hours=self.rng.randint(1, 8) if status == 'attended' else None,
+                        registered_at=registered,
+                        status_changed_at=max(registered, min(event.end_date, self.now)),
+                    )
+
+        self.bulk_insert(EventParticipation, participation_rows())
+        return events
+
+    def create_knowledge(self, count, users):
+        def rows():
+            for _ in range(count):
+                created = self.past_date(365)
+                yield KnowledgeBase(
+                    title=self.text(5)[:-1],
+                    content=self.text(300),
+                    excerpt=self.text(25),
+                    category=self.pick(KNOWLEDGE_CATEGORIES),
+                    is_public=self.rng.random() < 0.9,
+                    difficulty_level=self.pick(DIFFICULTY_LEVELS),
+                    author_id=self.rng.choice(users).pk,
+                    created_at=created,
+                    updated_at=created,
+                )
+
+        return self.bulk_insert(KnowledgeBase, rows(), return_objects=True)
+
+    def popularity_targets(self, news, events, knowledge):
+        """Объекты контента с весами по закону Ципфа"""
+        targets = []
+        for objects in (news, events, knowledge):
+            if objects:
+                content_type_id = ContentType.objects.get_for_model(objects[0]).id
+                targets.extend((content_type_id, obj.pk) for obj in objects)
+        self.rng.shuffle(targets)
+        cum_weights = list(accumulate(1 / (rank + 1) ** 0.8 for rank in range(len(targets))))
+        return targets, cum_weights
+
+    def create_comments(self, count, targets, users):
+        targets, cum_weights = targets
+        top_level_count = int(count * 0.7)
+
+        def top_level():
+            for content_type_id, object_id in self.rng.choices(targets, cum_weights=cum_weights,
+                                                                k=top_level_count):
+                created = self.past_date(90)
+                yield Comment(
+                    content_type_id=content_type_id,
+                    object_id=object_id,
+                    author_id=self.rng.choice(users).pk,
+                    text=self.text(self.rng.randint(5, 40)),
+                    is_approved=self.rng.random() < 0.95,
+                    created_at=created,
+                    updated_at=created,
+                )
+
+        parents = self.bulk_insert(Comment, top_level(), return_objects=True)
+        if not parents:
+            return
+
+        def replies():
+            for _ in range(count - top_level_count):
+                parent = self.rng.choice(parents)
+                created = parent.created_at + (self.now - parent.created_at) * self.rng.random()
+                yield Comment(
+                    content_type_id=parent.content_type_id,
+                    object_id=parent.object_id,
+                    parent_id=parent.pk,
+                    author_id=self.rng.choice(users).pk,
+                    text=self.text(self.rng.randint(3, 20)),
+                    is_approved=self.rng.random() < 0.95,
+                    created_at=created,
+                    updated_at=created,
+                )
+
+        self.bulk_insert(Comment, replies())
+
+    def create_likes(self, count, targets, users):
+        targets, cum_weights = targets
+        seen = set()
+
+        def rows():
+            for content_type_id, object_id in self.rng.choices(targets, cum_weights=cum_weights, k=count):
+                user_id = self.rng.choice(users).pk
+                if (content_type_id, object_id, user_id) in seen:
+                    continue
+                seen.add((content_type_id, object_id, user_id))
+                yield ContentLike(
+                    content_type_id=content_type_id,
+                    object_id=object_id,
+                    user_id=user_id,
+                    created_at=self.past_date(90),
+                )
+
+        self.bulk_insert(ContentLike, rows())
+
+    def create_views(self, count, targets, users):
+        targets, cum_weights = targets
+        view_counts = Counter()
+
+        def rows():
+            remaining = count
+            while remaining > 0:
+                chunk = min(remaining, self.batch_size)
+                remaining -= chunk
+                for content_type_id, object_id in self.rng.choices(targets, cum_weights=cum_weights, k=chunk):
+                    view_counts[content_type_id, object_id] += 1
+                    authenticated = self.rng.random() < 0.4
+                    yield ContentView(
+                        content_type_id=content_type_id,
+                        object_id=object_id,
+                        user_id=self.rng.choice(users).pk if authenticated else None,
+                        ip_address=f'{SEED_IP_PREFIX}{self.rng.randrange(256)}.{self.rng.randrange(1, 255)}',
+                        viewed_at=self.past_date(60),
+                    )
+
+        self.bulk_insert(ContentView, rows())
+
+        # Синхронизируем денормализованные счетчики просмотров
+        for model in (News, KnowledgeBase):
+            content_type_id = ContentType.objects.get_for_model(model).id
+            objects = [
+                model(pk=object_id, view_count=views)
+                for (ct_id, object_id), views in view_counts.items() if ct_id == content_type_id
+            ]
+            model.objects.bulk_update(objects, ['view_count'], batch_size=self.batch_size)
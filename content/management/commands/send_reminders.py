@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from content import reminders
+
+
+class Command(BaseCommand):
+    help = 'Рассылать напоминания участникам мероприятий по мере наступления времени отправки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Напоминаний в одной пачке')
+        parser.add_argument('--max-sleep', type=float, default=60,
+                            help='Максимальная пауза между проверками очереди, секунд')
+        parser.add_argument('--once', action='store_true', help='Отправить наступившие напоминания и выйти')
+        parser.add_argument('--rebuild', action='store_true', help='Сначала пересоздать очередь по участиям')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.stdout.write(f'Запланировано напоминаний: {reminders.rebuild()}')
+
+        while True:
+            sent = reminders.process(options['batch_size'])
+            if sent:
+                self.stdout.write(f'Отправлено напоминаний: {sent}')
+            if sent == options['batch_size']:
+                continue
+            if options['once']:
+                break
+
+            # Спим до ближайшего напоминания, но не дольше max_sleep:
+            # за это время могут появиться более ранние
+            due_at = reminders.next_due()
+            delay = options['max_sleep']
+            if due_at is not None:
+                delay = min(max((due_at - timezone.now()).total_seconds(), 0), delay)
+            time.sleep(delay)
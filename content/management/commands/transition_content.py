@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from content.services import LifecycleService
+
+
+class Command(BaseCommand):
+    help = 'Перевести закончившиеся мероприятия в завершенные, а старые новости - в архив (запускать периодически)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Строк в одном UPDATE')
+
+    def handle(self, *args, **options):
+        events = LifecycleService.complete_events(batch_size=options['batch_size'])
+        news = LifecycleService.archive_news(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Завершено мероприятий: {events}, новостей в архиве: {news}'))
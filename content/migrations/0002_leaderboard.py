@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(blank=True, max_length=100, verbose_name='Город')),
+                ('period', models.CharField(choices=[('month', 'Месяц'), ('year', 'Год'), ('all', 'Все время')], max_length=10, verbose_name='Период')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('hours', models.PositiveIntegerField(default=0, verbose_name='Часов волонтерства')),
+                ('events', models.PositiveIntegerField(default=0, verbose_name='Мероприятий')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция в рейтинге',
+                'verbose_name_plural': 'Рейтинг волонтеров',
+                'indexes': [models.Index(fields=['city', 'period', 'period_start', '-hours', 'user'], name='leaderboard_rank_idx')],
+                'unique_together': {('user', 'city', 'period', 'period_start')},
+            },
+        ),
+    ]
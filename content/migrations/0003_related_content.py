@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0002_leaderboard'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('bucket', models.BigIntegerField()),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket'], name='content_con_bucket_34de9d_idx'), models.Index(fields=['content_type', 'object_id'], name='content_con_content_1c7643_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ContentSignature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('signature', models.JSONField(verbose_name='Подпись')),
+                ('title', models.CharField(max_length=200, verbose_name='Заголовок')),
+                ('url', models.CharField(max_length=300, verbose_name='Ссылка')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('related_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=200, verbose_name='Заголовок')),
+                ('url', models.CharField(max_length=300, verbose_name='Ссылка')),
+                ('similarity', models.FloatField(verbose_name='Сходство')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype')),
+                ('related_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name': 'Похожий материал',
+                'verbose_name_plural': 'Похожие материалы',
+                'indexes': [models.Index(fields=['content_type', 'object_id', '-similarity'], name='related_lookup_idx'), models.Index(fields=['related_type', 'related_id'], name='content_rel_related_870d62_idx')],
+                'unique_together': {('content_type', 'object_id', 'related_type', 'related_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0003_related_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('start', 'Начало мероприятия'), ('deadline', 'Подтверждение участия до дедлайна')], max_length=20, verbose_name='Тип')),
+                ('due_at', models.DateTimeField(verbose_name='Время отправки')),
+                ('participation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='content.eventparticipation', verbose_name='Участие')),
+            ],
+            options={
+                'verbose_name': 'Напоминание',
+                'verbose_name_plural': 'Напоминания',
+                'indexes': [models.Index(fields=['due_at'], name='reminder_due_idx')],
+                'unique_together': {('participation', 'kind')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0004_reminders'),
+        ('organizations', '0003_nko_member_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['start_date'], name='event_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(condition=models.Q(('status', 'published')), fields=['-published_at'], name='news_live_idx'),
+        ),
+    ]
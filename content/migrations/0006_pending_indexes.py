@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0005_live_indexes'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('organizations', '0004_pending_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_approved', False), ('is_deleted', False)), fields=['created_at', 'id'], name='comment_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at', 'id'], name='event_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at', 'id'], name='news_pending_idx'),
+        ),
+    ]
@@ -1,17 +1,24 @@
+from datetime import date
+
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 
+from cities.models import LoadedCityMixin
+from .slugs import save_with_unique_slug
+
 
-class News(models.Model):
+class News(LoadedCityMixin, models.Model):
     STATUS_CHOICES = [
         ('draft', 'Черновик'),
         ('pending', 'На модерации'),
         ('published', 'Опубликовано'),
         ('archived', 'В архиве'),
     ]
+    # Статусы, в которых новость доступна по ссылке (в списках - только опубликованные)
+    VISIBLE_STATUSES = ('published', 'archived')
 
     # Основная информация
     title = models.CharField("Заголовок", max_length=200)
@@ -42,6 +49,15 @@ class News(models.Model):
 
     # Локация
     city = models.CharField("Город", max_length=100)
+    city_ref = models.ForeignKey(
+        'cities.City',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Город из справочника",
+        related_name='+'
+    )
 
     # Даты
     created_at = models.DateTimeField("Создано", auto_now_add=True)
@@ -62,6 +78,10 @@ class News(models.Model):
         indexes = [
             models.Index(fields=['status', 'published_at']),
             models.Index(fields=['city', 'status']),
+            # Частичный индекс только по живым новостям: архив в него не попадает
+            models.Index(fields=['-published_at'], condition=models.Q(status='published'), name='news_live_idx'),
+            # Очередь модерации (content/moderation.py)
+            models.Index(fields=['created_at', 'id'], condition=models.Q(status='pending'), name='news_pending_idx'),
         ]
 
     def __str__(self):
@@ -71,8 +91,8 @@ class News(models.Model):
         if self.status == 'published' and not self.published_at:
             self.published_at = timezone.now()
         if not self.slug:
-            from django.utils.text import slugify
-            self.slug = slugify(self.title)
+            save_with_unique_slug(self, lambda: super(News, self).save(*args, **kwargs), self.title)
+            return
         super().save(*args, **kwargs)
 
     @property
@@ -80,7 +100,7 @@ class News(models.Model):
         return self.status == 'published' and self.published_at <= timezone.now()
 
 
-class Event(models.Model):
+class Event(LoadedCityMixin, models.Model):
     EVENT_TYPE_CHOICES = [
         ('volunteer', 'Волонтерское мероприятие'),
         ('meeting', 'Встреча'),
@@ -98,6 +118,8 @@ class Event(models.Model):
         ('cancelled', 'Отменено'),
         ('completed', 'Завершено'),
     ]
+    # Статусы, в которых мероприятие доступно по ссылке; завершенные переводит transition_content
+    VISIBLE_STATUSES = ('published', 'completed')
 
     # Основная информация
     title = models.CharField("Название", max_length=200)
@@ -111,6 +133,15 @@ class Event(models.Model):
 
     # Место проведения
     city = models.CharField("Город", max_length=100)
+    city_ref = models.ForeignKey(
+        'cities.City',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Город из справочника",
+        related_name='+'
+    )
     address = models.TextField("Адрес")
     online = models.BooleanField("Онлайн мероприятие", default=False)
     online_link = models.URLField("Ссылка для онлайн", blank=True)
@@ -156,6 +187,9 @@ class Event(models.Model):
         indexes = [
             models.Index(fields=['start_date', 'status']),
             models.Index(fields=['city', 'event_type']),
+            # Частичный индекс только по живым мероприятиям: завершенные в него не попадают
+            models.Index(fields=['start_date'], condition=models.Q(status='published'), name='event_live_idx'),
+            models.Index(fields=['created_at', 'id'], condition=models.Q(status='pending'), name='event_pending_idx'),
         ]
 
     def __str__(self):
@@ -275,6 +309,8 @@ class Comment(models.Model):
         ordering = ['created_at']
         indexes = [
             models.Index(fields=['content_type', 'object_id']),
+            models.Index(fields=['created_at', 'id'], condition=models.Q(is_approved=False, is_deleted=False),
+                         name='comment_pending_idx'),
         ]
 
     def __str__(self):
@@ -350,4 +386,118 @@ class ContentLike(models.Model):
         verbose_name_plural = "Лайки"
 
     def __str__(self):
-        return f"Лайк от {self.user.username}"
\ No newline at end of file
+        return f"Лайк от {self.user.username}"
+
+
+class LeaderboardEntry(models.Model):
+    """Часы волонтера в рейтинге по городу и периоду (обновляется сигналами участия)"""
+    PERIOD_CHOICES = [
+        ('month', 'Месяц'),
+        ('year', 'Год'),
+        ('all', 'Все время'),
+    ]
+
+    # Рейтинг "за все время" хранится с фиксированной датой начала периода,
+    # а рейтинг по всем городам - с пустым городом
+    ALL_TIME = date(2000, 1, 1)
+    ALL_CITIES = ''
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Пользователь")
+    city = models.CharField("Город", max_length=100, blank=True)
+    period = models.CharField("Период", max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField("Начало периода")
+
+    hours = models.PositiveIntegerField("Часов волонтерства", default=0)
+    events = models.PositiveIntegerField("Мероприятий", default=0)
+
+    class Meta:
+        unique_together = ['user', 'city', 'period', 'period_start']
+        verbose_name = "Позиция в рейтинге"
+        verbose_name_plural = "Рейтинг волонтеров"
+        indexes = [
+            # Страница рейтинга и "мое место" читаются диапазоном этого индекса
+            models.Index(fields=['city', 'period', 'period_start', '-hours', 'user'], name='leaderboard_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.hours} ч ({self.city or 'все города'}, {self.period} {self.period_start})"
+
+
+class ContentSignature(models.Model):
+    """MinHash-подпись текста новости или материала (см. related.py)"""
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    signature = models.JSONField("Подпись")
+
+    # Копия заголовка и ссылки, чтобы собирать "Смотрите также" без обращения к самим материалам
+    title = models.CharField("Заголовок", max_length=200)
+    url = models.CharField("Ссылка", max_length=300)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['content_type', 'object_id']
+
+
+class ContentBucket(models.Model):
+    """Корзина LSH: материалы с совпадающей полосой подписи - кандидаты в похожие"""
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    # Номер полосы в старших битах, хеш ее значений - в младших
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['bucket']),
+            models.Index(fields=['content_type', 'object_id']),
+        ]
+
+
+class RelatedContent(models.Model):
+    """Похожий материал для блока "Смотрите также" (заголовок и ссылка хранятся здесь же)"""
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    object_id = models.PositiveIntegerField()
+
+    related_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    related_id = models.PositiveIntegerField()
+    title = models.CharField("Заголовок", max_length=200)
+    url = models.CharField("Ссылка", max_length=300)
+    similarity = models.FloatField("Сходство")
+
+    class Meta:
+        verbose_name = "Похожий материал"
+        verbose_name_plural = "Похожие материалы"
+        unique_together = ['content_type', 'object_id', 'related_type', 'related_id']
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', '-similarity'], name='related_lookup_idx'),
+            models.Index(fields=['related_type', 'related_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.similarity:.2f})"
+
+
+class Reminder(models.Model):
+    """Запланированное напоминание участнику мероприятия (очередь для send_reminders)"""
+    KIND_CHOICES = [
+        ('start', 'Начало мероприятия'),
+        ('deadline', 'Подтверждение участия до дедлайна'),
+    ]
+
+    participation = models.ForeignKey(EventParticipation, on_delete=models.CASCADE, related_name='reminders',
+                                      verbose_name="Участие")
+    kind = models.CharField("Тип", max_length=20, choices=KIND_CHOICES)
+    # Забранное обработчиком напоминание сдвигается на время аренды: если письмо
+    # не отправится, оно снова станет доступно без отдельного поля блокировки
+    due_at = models.DateTimeField("Время отправки")
+
+    class Meta:
+        verbose_name = "Напоминание"
+        verbose_name_plural = "Напоминания"
+        unique_together = ['participation', 'kind']
+        indexes = [
+            # Очередь читается только по времени отправки
+            models.Index(fields=['due_at'], name='reminder_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} для участия {self.participation_id} в {self.due_at}"
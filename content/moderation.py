@@ -0,0 +1,183 @@
+"""
+Единая очередь модерации: новости, мероприятия и НКО со статусом «На модерации»
+и неодобренные комментарии.
+
+Очередь читается одним запросом UNION ALL по четырем таблицам в порядке
+поступления (created_at, тип, id). Каждая часть выбирается по своему частичному
+индексу (*_pending_idx), а страницы листаются курсором по этому ключу, так что
+каждая часть начинается с места остановки, без OFFSET. Одобрение и отклонение
+выполняются одним UPDATE на модель. Счетчики по типам для значка в меню хранятся
+в кэше и сбрасываются при модерации и при сохранении записи, ожидающей проверки.
+"""
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import CharField, F, Q, Value
+from django.db.models.functions import Coalesce, Now, Substr
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from cities.services import CityService
+from organizations.models import NKO
+from . import feeds, recommendations, related
+from .models import Comment, Event, News
+
+PAGE_SIZE = 50
+COUNTS_KEY = 'moderation:counts'
+# Переходы из очереди в обход модерации (правка в админке) не сбрасывают счетчики сразу
+COUNTS_TIMEOUT = 60
+CURSOR_SALT = 'content.moderation'
+LABEL_LENGTH = 100
+
+
+@dataclass
+class Queue:
+    """Что считается ожидающим проверкой и что меняется при решении модератора"""
+    model: type
+    title: str
+    pending: Q
+    label: object
+    approve: dict
+    reject: dict
+
+
+QUEUES = {
+    'news': Queue(News, 'Новость', Q(status='pending'), F('title'),
+                  approve={'status': 'published', 'published_at': Coalesce('published_at', Now())},
+                  reject={'status': 'draft'}),
+    'event': Queue(Event, 'Мероприятие', Q(status='pending'), F('title'),
+                   approve={'status': 'published'}, reject={'status': 'draft'}),
+    'nko': Queue(NKO, 'НКО', Q(status='pending'), F('name'),
+                 approve={'status': 'approved'}, reject={'status': 'rejected'}),
+    # Отклоненный комментарий скрывается, а не остается неодобренным навсегда
+    'comment': Queue(Comment, 'Комментарий', Q(is_approved=False, is_deleted=False), Substr('text', 1, LABEL_LENGTH),
+                     approve={'is_approved': True}, reject={'is_deleted': True}),
+}
+
+
+def can_moderate(user):
+    return user.is_authenticated and (user.is_staff or user.is_moderator_or_admin())
+
+
+def is_pending(instance):
+    # Читаем из __dict__, чтобы не загружать отложенные поля
+    if isinstance(instance, Comment):
+        return instance.__dict__.get('is_approved') is False and instance.__dict__.get('is_deleted') is False
+    return instance.__dict__.get('status') == 'pending'
+
+
+def get_counts():
+    """{тип: число ожидающих, 'total': всего} из кэша"""
+    counts = cache.get(COUNTS_KEY)
+    if counts is None:
+        counts = {name: queue.model.objects.filter(queue.pending).count() for name, queue in QUEUES.items()}
+        counts['total'] = sum(counts.values())
+        cache.set(COUNTS_KEY, counts, COUNTS_TIMEOUT)
+    return counts
+
+
+async def aload_counts(request):
+    """Счетчики для меню асинхронной страницы: ее шаблон рендерится синхронно и к БД обращаться не может"""
+    if can_moderate(request.user):
+        request.moderation_counts = await sync_to_async(get_counts)()
+
+
+def invalidate_counts():
+    cache.delete(COUNTS_KEY)
+
+
+def encode_cursor(item):
+    return signing.dumps([item['created_at'].isoformat(), item['kind'], item['id']], salt=CURSOR_SALT)
+
+
+def decode_cursor(cursor):
+    """(created_at, тип, id) последнего элемента страницы или None"""
+    try:
+        created_at, kind, pk = signing.loads(cursor, salt=CURSOR_SALT)
+        created_at = parse_datetime(created_at)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if created_at is None or kind not in QUEUES or not isinstance(pk, int):
+        return None
+    return created_at, kind, pk
+
+
+def after(name, cursor):
+    """Условие «после курсора» для части очереди: тип в части постоянен, поэтому хватает диапазона"""
+    created_at, kind, pk = cursor
+    if name > kind:
+        return Q(created_at__gte=created_at)
+    if name < kind:
+        return Q(created_at__gt=created_at)
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+
+
+def get_page(cursor=None, kinds=None, limit=PAGE_SIZE):
+    """(элементы, курсор следующей страницы или None)"""
+    position = decode_cursor(cursor) if cursor else None
+    parts = []
+    for name, queue in QUEUES.items():
+        if kinds and name not in kinds:
+            continue
+        part = queue.model.objects.filter(queue.pending)
+        if position:
+            part = part.filter(after(name, position))
+        part = (part.annotate(kind=Value(name, output_field=CharField()), label=queue.label)
+                .values('kind', 'id', 'label', 'created_at').order_by())
+        # Там, где СУБД позволяет, каждая часть ограничивается своей страницей
+        if connection.features.supports_slicing_ordering_in_compound:
+            part = part.order_by('created_at', 'id')[:limit + 1]
+        parts.append(part)
+    if not parts:
+        return [], None
+
+    items = list(parts[0].union(*parts[1:], all=True).order_by('created_at', 'kind', 'id')[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1])
+    for item in items:
+        queue = QUEUES[item['kind']]
+        item['title'] = queue.title
+        item['admin_url'] = reverse(
+            f'admin:{queue.model._meta.app_label}_{queue.model._meta.model_name}_change', args=[item['id']]
+        )
+    return items, next_cursor
+
+
+def parse_items(values):
+    """{тип: [id]} из значений вида 'news:15'"""
+    selected = {}
+    for value in values:
+        kind, _, pk = value.partition(':')
+        if kind in QUEUES and pk.isdigit():
+            selected.setdefault(kind, []).append(int(pk))
+    return selected
+
+
+def decide(action, selected):
+    """Одобрить или отклонить выбранное: по одному UPDATE на модель; возвращает число измененных"""
+    changed = {}
+    with transaction.atomic():
+        for kind, pks in selected.items():
+            queue = QUEUES[kind]
+            values = queue.approve if action == 'approve' else queue.reject
+            changed[kind] = (queue.model.objects.filter(queue.pending, pk__in=pks)
+                             .update(**values, updated_at=timezone.now()))
+            if action == 'approve' and kind != 'comment':
+                # Города заявок попадают в справочник только после одобрения
+                CityService.link_moderated(queue.model.objects.filter(pk__in=pks, status=values['status']))
+
+    # UPDATE обходит сигналы, поэтому зависящие от статуса кэши и индексы обновляются явно
+    if action == 'approve' and changed.get('news'):
+        feeds.invalidate()
+        for news in News.objects.filter(pk__in=selected['news'], status='published'):
+            related.update(news)
+    if action == 'approve' and changed.get('event'):
+        recommendations.invalidate()
+    invalidate_counts()
+    return sum(changed.values())
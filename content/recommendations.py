@@ -0,0 +1,158 @@
+"""
+Рекомендации мероприятий волонтерам.
+
+Описания и требования ближайших мероприятий превращаются в разреженные
+TF-IDF векторы и складываются в инвертированный индекс (термин -> список
+(мероприятие, вес)). Сходство с навыками и интересами пользователя
+считается одним проходом по спискам только его терминов, а готовый топ
+кэшируется для каждого пользователя.
+"""
+import hashlib
+import heapq
+import math
+import re
+import uuid
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Event
+
+WEEKDAYS = ['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс']
+
+INDEX_TIMEOUT = 15 * 60
+RECOMMENDATIONS_TIMEOUT = 60 * 60
+VERSION_KEY = 'recommendations:version'
+
+# Поля мероприятия, от которых зависит индекс
+INDEXED_FIELDS = {'title', 'description', 'requirements', 'city', 'online', 'start_date', 'status'}
+
+# Навыки и интересы пользователь формулирует сам, поэтому весят больше слов описания
+SKILLS_WEIGHT = 2.0
+INTERESTS_WEIGHT = 1.0
+
+WORD_RE = re.compile(r'[a-zа-яё]+')
+STEM_LENGTH = 6
+STOP_WORDS = {
+    'и', 'в', 'во', 'на', 'с', 'со', 'по', 'для', 'от', 'до', 'из', 'к', 'о', 'об', 'за', 'не',
+    'что', 'как', 'это', 'или', 'а', 'но', 'мы', 'вы', 'они', 'все', 'при', 'так', 'же', 'бы',
+}
+
+
+def tokenize(text):
+    """Слова текста, обрезанные до общей основы"""
+    # Вместо морфологии берем первые буквы слова: "экологию" и "экология" дают один термин
+    return [
+        word[:STEM_LENGTH]
+        for word in WORD_RE.findall(text.lower().replace('ё', 'е'))
+        if len(word) > 2 and word not in STOP_WORDS
+    ]
+
+
+def normalize(vector):
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+
+def parse_weekdays(value):
+    """'пн,ср,сб' -> {0, 2, 5}"""
+    days = {day.strip().lower() for day in value.split(',')}
+    return {number for number, name in enumerate(WEEKDAYS) if name in days}
+
+
+class EventIndex:
+    """Инвертированный индекс ближайших опубликованных мероприятий"""
+
+    def __init__(self, events):
+        # events: [(pk, текст, город, онлайн, день недели)]
+        self.events = [(pk, city, online, weekday) for pk, _, city, online, weekday in events]
+        documents = [Counter(tokenize(text)) for _, text, *_ in events]
+
+        frequency = Counter(term for document in documents for term in document)
+        total = len(documents)
+        self.idf = {term: math.log((1 + total) / (1 + count)) + 1 for term, count in frequency.items()}
+
+        self.postings = defaultdict(list)
+        for position, document in enumerate(documents):
+            vector = normalize({term: count * self.idf[term] for term, count in document.items()})
+            for term, weight in vector.items():
+                self.postings[term].append((position, weight))
+
+    @classmethod
+    def build(cls):
+        now = timezone.now()
+        rows = (Event.objects.filter(status='published', start_date__gte=now)
+                .values_list('pk', 'title', 'description', 'requirements', 'city', 'online', 'start_date'))
+        return cls([
+            (pk, f'{title} {description} {requirements}', city, online, timezone.localtime(start).weekday())
+            for pk, title, description, requirements, city, online, start in rows.iterator()
+        ])
+
+    def vectorize(self, weighted_texts):
+        """Вектор пользователя в пространстве терминов индекса"""
+        vector = Counter()
+        for text, weight in weighted_texts:
+            for term in tokenize(text):
+                if term in self.idf:
+                    vector[term] += weight * self.idf[term]
+        return normalize(vector)
+
+    def scores(self, vector):
+        """Косинусное сходство со всеми мероприятиями, у которых есть общие термины"""
+        scores = defaultdict(float)
+        for term, weight in vector.items():
+            for position, event_weight in self.postings[term]:
+                scores[position] += weight * event_weight
+        return scores
+
+    def top(self, vector, limit, city='', weekdays=None):
+        """Лучшие мероприятия с учетом города (или онлайн) и доступных дней"""
+        candidates = []
+        for position, score in self.scores(vector).items():
+            pk, event_city, online, weekday = self.events[position]
+            if city and not online and event_city != city:
+                continue
+            if weekdays and weekday not in weekdays:
+                continue
+            candidates.append((score, pk))
+        return [pk for _, pk in heapq.nlargest(limit, candidates)]
+
+
+def get_version():
+    # Случайная версия вместо счетчика: после вытеснения ключа не совпадет со старой
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """Сбросить индекс и все кэшированные рекомендации во всех процессах (при изменении мероприятий)"""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_index(version):
+    key = f'recommendations:index:{version}'
+    index = cache.get(key)
+    if index is None:
+        index = EventIndex.build()
+        cache.set(key, index, INDEX_TIMEOUT)
+    return index
+
+
+def recommend(user, profile=None, limit=10):
+    """pk рекомендованных мероприятий для пользователя, лучшие первыми"""
+    weekdays = profile.available_weekdays if profile else ''
+    signature = '|'.join([user.skills, user.interests, user.city, weekdays])
+    # Ключ зависит от версии индекса и анкеты, поэтому изменения сбрасывают кэш сами
+    version = get_version()
+    key = f'recommendations:{version}:{user.pk}:{limit}:{hashlib.md5(signature.encode()).hexdigest()}'
+    event_ids = cache.get(key)
+    if event_ids is None:
+        index = get_index(version)
+        vector = index.vectorize([(user.skills, SKILLS_WEIGHT), (user.interests, INTERESTS_WEIGHT)])
+        event_ids = index.top(vector, limit, city=user.city, weekdays=parse_weekdays(weekdays))
+        cache.set(key, event_ids, RECOMMENDATIONS_TIMEOUT)
+    return event_ids
@@ -0,0 +1,309 @@
+"""
+Индекс похожих материалов для новостей и базы знаний.
+
+Текст разбивается на шинглы (основы слов, см. recommendations.tokenize),
+по ним считается MinHash-подпись из NUM_PERM значений. Подпись режется на
+BANDS полос по ROWS значений; материалы, у которых совпала хотя бы одна
+полоса (корзина LSH), становятся кандидатами, и для них по подписям
+оценивается сходство Жаккара. Лучшие TOP_N кандидатов сохраняются в
+RelatedContent, поэтому детальной странице достаточно одного запроса по
+индексу.
+
+Полная пересборка: python manage.py build_related_content. При сохранении
+материала индекс обновляется только для него и его кандидатов, а пачка
+импортированных материалов индексируется целиком (add_many).
+"""
+import random
+import zlib
+from array import array
+from collections import defaultdict
+from functools import lru_cache
+from operator import eq
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.urls import reverse
+
+from .models import News, KnowledgeBase, ContentSignature, ContentBucket, RelatedContent
+from .recommendations import tokenize
+
+NUM_PERM = 64
+# Порог LSH (1 / BANDS) ** (1 / ROWS): при 16 полосах по 4 значения кандидатом становится пара
+# со сходством около 0.5 и выше (при 0.3 - лишь с вероятностью ~12%), а не почти любая пара
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Для "похожих", а не дубликатов шинглом служит одна основа слова
+SHINGLE_SIZE = 1
+TOP_N = 5
+MIN_SIMILARITY = 0.1
+# Сколько самых похожих кандидатов получают новый материал в свои списки при сохранении
+REVERSE_UPDATE_LIMIT = 50
+# Сколько владельцев списков обрезается одним запросом
+OWNERS_CHUNK = 500
+
+# Сколько шинглов хранить с посчитанными перестановками (около 0.5 КБ на шингл)
+PERMUTED_CACHE_SIZE = 1 << 14
+
+PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+# Коэффициенты фиксированы, чтобы подписи не зависели от перезапуска
+_random = random.Random(1729)
+PERMUTATIONS = [(_random.randrange(1, PRIME), _random.randrange(0, PRIME)) for _ in range(NUM_PERM)]
+
+# Поля, изменение которых требует пересчета подписи
+INDEXED_FIELDS = {'title', 'excerpt', 'content', 'status', 'is_public', 'slug'}
+
+
+def get_sources():
+    """Индексируемые модели: только опубликованные новости и публичные материалы"""
+    return {
+        News: News.objects.filter(status='published'),
+        KnowledgeBase: KnowledgeBase.objects.filter(is_public=True),
+    }
+
+
+def get_url(instance):
+    if isinstance(instance, News):
+        return reverse('content:news_detail', args=[instance.slug])
+    return reverse('content:knowledge_base_detail', args=[instance.pk])
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    words = tokenize(text)
+    return {zlib.crc32(' '.join(words[i:i + size]).encode()) for i in range(len(words) - size + 1)}
+
+
+@lru_cache(maxsize=PERMUTED_CACHE_SIZE)
+def permuted(value):
+    """Значения шингла во всех перестановках; частые основы слов берутся из кэша"""
+    return array('Q', [(a * value + b) % PRIME for a, b in PERMUTATIONS])
+
+
+def minhash(values):
+    """MinHash-подпись множества шинглов; None для пустого текста"""
+    if not values:
+        return None
+    return [value & MAX_HASH for value in map(min, zip(*map(permuted, values)))]
+
+
+def get_buckets(signature):
+    """Корзины LSH подписи: номер полосы в старших битах, хеш ее значений - в младших"""
+    return [
+        band << 32 | zlib.crc32(repr(signature[band * ROWS:(band + 1) * ROWS]).encode())
+        for band in range(BANDS)
+    ]
+
+
+def similarity(first, second):
+    """Оценка сходства Жаккара по доле совпавших значений подписи"""
+    return sum(map(eq, first, second)) / NUM_PERM
+
+
+def get_signature(instance):
+    return minhash(shingles(f'{instance.title} {instance.excerpt} {instance.content}'))
+
+
+def get_related(model, **lookup):
+    """Похожие материалы по индексу related_lookup_idx одним запросом"""
+    return RelatedContent.objects.filter(
+        content_type__app_label=model._meta.app_label,
+        content_type__model=model._meta.model_name,
+        object_id__in=model.objects.filter(**lookup).values('pk'),
+    ).order_by('-similarity')[:TOP_N]
+
+
+def related_rows(owner_type, owner_id, scored):
+    return [
+        RelatedContent(content_type_id=owner_type, object_id=owner_id, related_type_id=item.content_type_id,
+                       related_id=item.object_id, title=item.title, url=item.url, similarity=score)
+        for score, item in scored
+    ]
+
+
+def trim(owners):
+    """Оставить в списках похожих владельцев owners {(тип, id)} только TOP_N лучших"""
+    owners = list(owners)
+    for start in range(0, len(owners), OWNERS_CHUNK):
+        by_type = defaultdict(set)
+        for owner_type, owner_id in owners[start:start + OWNERS_CHUNK]:
+            by_type[owner_type].add(owner_id)
+        of_owners = Q()
+        for owner_type, object_ids in by_type.items():
+            of_owners |= Q(content_type_id=owner_type, object_id__in=object_ids)
+        lists = defaultdict(list)
+        for pk, owner_type, owner_id, score in (RelatedContent.objects.filter(of_owners)
+                                                .values_list('pk', 'content_type', 'object_id', 'similarity')):
+            lists[owner_type, owner_id].append((score, pk))
+        extra = [pk for rows in lists.values() for _, pk in sorted(rows, reverse=True)[TOP_N:]]
+        RelatedContent.objects.filter(pk__in=extra).delete()
+
+
+@transaction.atomic
+def update(instance):
+    """Пересчитать подпись материала, его похожие и его место в списках кандидатов"""
+    content_type = ContentType.objects.get_for_model(instance)
+    key = {'content_type': content_type, 'object_id': instance.pk}
+    ContentBucket.objects.filter(**key).delete()
+    RelatedContent.objects.filter(**key).delete()
+    # Материал мог перестать быть похожим на прежних соседей; их списки дополнит пересборка
+    RelatedContent.objects.filter(related_type=content_type, related_id=instance.pk).delete()
+
+    signature = None
+    if get_sources()[type(instance)].filter(pk=instance.pk).exists():
+        signature = get_signature(instance)
+    if signature is None:
+        ContentSignature.objects.filter(**key).delete()
+        return
+
+    item, _ = ContentSignature.objects.update_or_create(
+        **key, defaults={'signature': signature, 'title': instance.title, 'url': get_url(instance)}
+    )
+    buckets = get_buckets(signature)
+    ContentBucket.objects.bulk_create(ContentBucket(**key, bucket=bucket) for bucket in buckets)
+
+    candidates = (ContentBucket.objects.filter(bucket__in=buckets).exclude(**key)
+                  .values_list('content_type', 'object_id').distinct())
+    by_type = defaultdict(set)
+    for candidate_type, object_id in candidates:
+        by_type[candidate_type].add(object_id)
+    if not by_type:
+        return
+
+    of_candidates = Q()
+    for candidate_type, object_ids in by_type.items():
+        of_candidates |= Q(content_type_id=candidate_type, object_id__in=object_ids)
+    scored = [
+        (similarity(signature, candidate.signature), candidate)
+        for candidate in ContentSignature.objects.filter(of_candidates).only(
+            'content_type', 'object_id', 'signature', 'title', 'url')
+    ]
+    scored = sorted((pair for pair in scored if pair[0] >= MIN_SIMILARITY), key=lambda pair: -pair[0])
+    RelatedContent.objects.bulk_create(related_rows(content_type.pk, instance.pk, scored[:TOP_N]))
+
+    # Добавляем материал в списки кандидатов и обрезаем их до TOP_N
+    scored = scored[:REVERSE_UPDATE_LIMIT]
+    owners = {(candidate.content_type_id, candidate.object_id): score for score, candidate in scored}
+    if not owners:
+        return
+    RelatedContent.objects.bulk_create([
+        row for (owner_type, owner_id), score in owners.items()
+        for row in related_rows(owner_type, owner_id, [(score, item)])
+    ])
+    trim(owners)
+
+
+@transaction.atomic
+def add_many(instances):
+    """
+    Проиндексировать пачку новых материалов одной модели (массовый импорт). Подписи и корзины
+    вставляются двумя bulk_create, а кандидаты всей пачки с их подписями читаются одним запросом,
+    поэтому число запросов не зависит от размера пачки. Возвращает число проиндексированных.
+    """
+    if not instances:
+        return 0
+    model = type(instances[0])
+    content_type = ContentType.objects.get_for_model(model)
+    indexed = set(get_sources()[model].filter(pk__in=[instance.pk for instance in instances])
+                  .values_list('pk', flat=True))
+    items = {}
+    for instance in instances:
+        signature = get_signature(instance) if instance.pk in indexed else None
+        if signature is not None:
+            items[content_type.pk, instance.pk] = ContentSignature(
+                content_type=content_type, object_id=instance.pk, signature=signature,
+                title=instance.title, url=get_url(instance),
+            )
+    if not items:
+        return 0
+
+    ContentSignature.objects.bulk_create(items.values())
+    ContentBucket.objects.bulk_create(
+        ContentBucket(content_type_id=content_type.pk, object_id=item.object_id, bucket=bucket)
+        for item in items.values() for bucket in get_buckets(item.signature)
+    )
+    # Уже проиндексированные материалы, у которых есть общая корзина с пачкой
+    new_buckets = ContentBucket.objects.filter(content_type=content_type,
+                                               object_id__in=[object_id for _, object_id in items]).values('bucket')
+    shares_bucket = ContentBucket.objects.filter(content_type=OuterRef('content_type'),
+                                                 object_id=OuterRef('object_id'), bucket__in=new_buckets)
+    candidates = {
+        (candidate.content_type_id, candidate.object_id): candidate
+        for candidate in ContentSignature.objects.filter(Exists(shares_bucket)).only(
+            'content_type', 'object_id', 'signature', 'title', 'url')
+    }
+    candidates.update(items)
+
+    # Корзины считаются по подписям, а не читаются из БД
+    members = defaultdict(set)
+    for key, candidate in candidates.items():
+        for bucket in get_buckets(candidate.signature):
+            members[bucket].add(key)
+
+    rows = []
+    owners = set()
+    for key, item in items.items():
+        others = set().union(*(members[bucket] for bucket in get_buckets(item.signature))) - {key}
+        scored = [(similarity(item.signature, candidates[other].signature), candidates[other]) for other in others]
+        scored = sorted((pair for pair in scored if pair[0] >= MIN_SIMILARITY), key=lambda pair: -pair[0])
+        rows.extend(related_rows(content_type.pk, item.object_id, scored[:TOP_N]))
+        # Материалы пачки находят друг друга сами; в списки прежних материалов новый добавляется здесь
+        for score, candidate in scored[:REVERSE_UPDATE_LIMIT]:
+            owner = (candidate.content_type_id, candidate.object_id)
+            if owner not in items:
+                rows.extend(related_rows(*owner, [(score, item)]))
+                owners.add(owner)
+    RelatedContent.objects.bulk_create(rows)
+    trim(owners)
+    return len(items)
+
+
+def remove(instance):
+    content_type = ContentType.objects.get_for_model(instance)
+    for model in (ContentSignature, ContentBucket, RelatedContent):
+        model.objects.filter(content_type=content_type, object_id=instance.pk).delete()
+    RelatedContent.objects.filter(related_type=content_type, related_id=instance.pk).delete()
+
+
+def rebuild(batch_size=1000):
+    """Пересобрать индекс целиком; возвращает число проиндексированных материалов"""
+    items = []
+    buckets = defaultdict(list)
+    for model, queryset in get_sources().items():
+        content_type = ContentType.objects.get_for_model(model)
+        for instance in queryset.iterator(chunk_size=batch_size):
+            signature = get_signature(instance)
+            if signature is None:
+                continue
+            item = ContentSignature(content_type=content_type, object_id=instance.pk, signature=signature,
+                                    title=instance.title, url=get_url(instance))
+            for bucket in get_buckets(signature):
+                buckets[bucket].append(len(items))
+            items.append(item)
+
+    candidates = defaultdict(set)
+    for members in buckets.values():
+        for position in members:
+            candidates[position].update(members)
+
+    related = []
+    for position, item in enumerate(items):
+        scored = [
+            (similarity(item.signature, items[other].signature), items[other])
+            for other in candidates[position] if other != position
+        ]
+        scored = sorted((pair for pair in scored if pair[0] >= MIN_SIMILARITY), key=lambda pair: -pair[0])
+        related.extend(related_rows(item.content_type_id, item.object_id, scored[:TOP_N]))
+
+    with transaction.atomic():
+        for model in (ContentSignature, ContentBucket, RelatedContent):
+            model.objects.all().delete()
+        ContentSignature.objects.bulk_create(items, batch_size=batch_size)
+        ContentBucket.objects.bulk_create(
+            (ContentBucket(content_type_id=items[position].content_type_id, object_id=items[position].object_id,
+                           bucket=bucket)
+             for bucket, members in buckets.items() for position in members),
+            batch_size=batch_size,
+        )
+        RelatedContent.objects.bulk_create(related, batch_size=batch_size)
+    return len(items)
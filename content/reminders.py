@@ -0,0 +1,129 @@
+"""
+Напоминания участникам мероприятий.
+
+Для каждого активного участия в таблице Reminder лежат строки со временем
+отправки: за START_NOTICE до начала мероприятия и, пока участие не
+подтверждено, за DEADLINE_NOTICE до дедлайна регистрации. Строки создаются
+и пересчитываются сигналами участия и мероприятия, а обработчик
+(python manage.py send_reminders) читает очередь только по индексу due_at:
+забирает пачку наступивших напоминаний, отправляет письма одним соединением
+и удаляет отправленные строки.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EventParticipation, Reminder
+
+ACTIVE_STATUSES = ('registered', 'confirmed')
+START_NOTICE = timedelta(hours=24)
+DEADLINE_NOTICE = timedelta(hours=24)
+# На это время забранные напоминания скрываются от других обработчиков
+LEASE = timedelta(minutes=5)
+
+# Поля мероприятия, от которых зависит расписание
+SCHEDULE_FIELDS = ('start_date', 'registration_deadline', 'status')
+
+
+def plan(status, event_status, start_date, registration_deadline, now):
+    """[(тип, время отправки)] для участия; пусто, если напоминать не о чем"""
+    if status not in ACTIVE_STATUSES or event_status != 'published':
+        return []
+    reminders = []
+    if start_date > now:
+        reminders.append(('start', max(start_date - START_NOTICE, now)))
+    if status == 'registered' and registration_deadline and registration_deadline > now:
+        reminders.append(('deadline', max(registration_deadline - DEADLINE_NOTICE, now)))
+    return reminders
+
+
+def schedule(participation, created=False):
+    """Пересчитать напоминания одного участия"""
+    if not created:
+        Reminder.objects.filter(participation=participation).delete()
+    event = participation.event
+    Reminder.objects.bulk_create(
+        Reminder(participation=participation, kind=kind, due_at=due_at)
+        for kind, due_at in plan(participation.status, event.status, event.start_date,
+                                 event.registration_deadline, timezone.now())
+    )
+
+
+def schedule_event(event):
+    """Пересчитать напоминания всех участников мероприятия (после переноса или отмены)"""
+    Reminder.objects.filter(participation__event=event).delete()
+    now = timezone.now()
+    participations = (EventParticipation.objects.filter(event=event, status__in=ACTIVE_STATUSES)
+                      .values_list('pk', 'status'))
+    Reminder.objects.bulk_create(
+        Reminder(participation_id=pk, kind=kind, due_at=due_at)
+        for pk, status in participations
+        for kind, due_at in plan(status, event.status, event.start_date, event.registration_deadline, now)
+    )
+
+
+def rebuild(batch_size=1000):
+    """Пересоздать очередь по всем активным участиям в будущих мероприятиях"""
+    now = timezone.now()
+    participations = EventParticipation.objects.filter(
+        status__in=ACTIVE_STATUSES, event__status='published', event__start_date__gt=now,
+    ).values_list('pk', 'status', 'event__status', 'event__start_date', 'event__registration_deadline')
+    with transaction.atomic():
+        Reminder.objects.all().delete()
+        reminders = Reminder.objects.bulk_create(
+            (Reminder(participation_id=pk, kind=kind, due_at=due_at)
+             for pk, *fields in participations.iterator(chunk_size=batch_size)
+             for kind, due_at in plan(*fields, now)),
+            batch_size=batch_size,
+        )
+    return len(reminders)
+
+
+def next_due():
+    """Время ближайшего напоминания (первая строка индекса) или None"""
+    return Reminder.objects.order_by('due_at').values_list('due_at', flat=True).first()
+
+
+def claim(batch_size, now=None):
+    """Забрать пачку наступивших напоминаний, сдвинув их на время аренды"""
+    now = now or timezone.now()
+    with transaction.atomic():
+        # Параллельные обработчики пропускают строки, заблокированные соседом (где СУБД это умеет)
+        pks = list(Reminder.objects.select_for_update(skip_locked=True).filter(due_at__lte=now)
+                   .order_by('due_at').values_list('pk', flat=True)[:batch_size])
+        Reminder.objects.filter(pk__in=pks).update(due_at=now + LEASE)
+    return list(Reminder.objects.filter(pk__in=pks).select_related('participation__user', 'participation__event'))
+
+
+def format_date(value):
+    return timezone.localtime(value).strftime('%d.%m.%Y %H:%M')
+
+
+def compose(reminder):
+    """Тема и текст письма"""
+    user = reminder.participation.user
+    event = reminder.participation.event
+    place = 'онлайн' if event.online else f'{event.city}, {event.address}'
+    if reminder.kind == 'start':
+        subject = f'Напоминание: {event.title} - Добрые дела Росатома'
+        text = f'Мероприятие «{event.title}» начнется {format_date(event.start_date)}.\nМесто: {place}.'
+    else:
+        subject = f'Подтвердите участие: {event.title} - Добрые дела Росатома'
+        text = (f'Регистрация на мероприятие «{event.title}» закрывается '
+                f'{format_date(event.registration_deadline)}. Подтвердите, пожалуйста, участие.')
+    message = f'Здравствуйте, {user.first_name}!\n\n{text}\n\nС уважением,\nКоманда "Добрые дела Росатома"'
+    return subject, message, settings.DEFAULT_FROM_EMAIL, [user.email]
+
+
+def process(batch_size=500):
+    """Отправить одну пачку наступивших напоминаний; возвращает число обработанных"""
+    reminders = claim(batch_size)
+    if not reminders:
+        return 0
+    # Письма уходят одним SMTP-соединением; при ошибке строки вернутся в очередь после аренды
+    send_mass_mail([compose(reminder) for reminder in reminders if reminder.participation.user.email])
+    Reminder.objects.filter(pk__in=[reminder.pk for reminder in reminders]).delete()
+    return len(reminders)
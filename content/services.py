@@ -1,9 +1,18 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Count
+from django.contrib.contenttypes.models import ContentType
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from collections import Counter
 from datetime import datetime, timedelta
 import calendar
 
-from .models import News, Event, KnowledgeBase, ContentView, ContentLike
+from accounts.models import User, UserProfile
+from .models import News, Event, KnowledgeBase, EventParticipation, ContentView, ContentLike, LeaderboardEntry
+from . import feeds, recommendations
 
 
 class ContentService:
@@ -12,9 +21,10 @@ class ContentService:
         """Запись просмотра контента"""
         content_type = ContentType.objects.get_for_model(content_object)
 
-        # Увеличиваем счетчик просмотров у объекта
-        content_object.view_count += 1
-        content_object.save(update_fields=['view_count'])
+        # Увеличиваем счетчик просмотров у объекта (если он есть у модели)
+        if hasattr(content_object, 'view_count'):
+            content_object.view_count += 1
+            content_object.save(update_fields=['view_count'])
 
         # Создаем запись о просмотре
         ContentView.objects.create(
@@ -24,6 +34,25 @@ class ContentService:
             ip_address=ContentService.get_client_ip(request)
         )
 
+    @staticmethod
+    def record_cached_view(content_object, request):
+        """Запись просмотра страницы, которую браузер показал из кэша (ответ 304), без сохранения объекта"""
+        model = type(content_object)
+        # Проверяем по классу: у объекта загружен только ключ
+        if hasattr(model, 'view_count'):
+            model.objects.filter(pk=content_object.pk).update(view_count=F('view_count') + 1)
+        ContentView.objects.create(
+            content_type=ContentType.objects.get_for_model(model),
+            object_id=content_object.pk,
+            user=request.user if request.user.is_authenticated else None,
+            ip_address=ContentService.get_client_ip(request)
+        )
+
+    @staticmethod
+    async def arecord_view(content_object, request):
+        """Асинхронная запись просмотра контента"""
+        await sync_to_async(ContentService.record_view)(content_object, request)
+
     @staticmethod
     def get_client_ip(request):
         """Получить IP адрес клиента"""
@@ -63,7 +92,7 @@ class ContentService:
         """Получить популярный контент"""
         return {
             'news': News.objects.filter(status='published').order_by('-view_count')[:limit],
-            'events': Event.objects.filter(status='published').order_by('-view_count')[:limit],
+            'events': Event.objects.filter(status='published').order_by('-current_participants')[:limit],
             'knowledge': KnowledgeBase.objects.filter(is_public=True).order_by('-view_count')[:limit],
         }
 
@@ -143,6 +172,19 @@ class EventService:
             start_date__gte=timezone.now()
         ).order_by('start_date')[:limit]
 
+    @staticmethod
+    def get_recommended_events(user, limit=5):
+        """Рекомендованные мероприятия по навыкам, интересам, городу и доступным дням"""
+        profile = UserProfile.objects.filter(user=user).only('available_weekdays').first()
+        # Кэшируем запас кандидатов: часть могла начаться или уже выбрана пользователем
+        event_ids = recommendations.recommend(user, profile, limit * 2)
+        if not event_ids:
+            return []
+        events = (Event.objects.filter(pk__in=event_ids, status='published', start_date__gte=timezone.now())
+                  .exclude(pk__in=EventParticipation.objects.filter(user=user).values('event')))
+        events = {event.pk: event for event in events}
+        return [events[pk] for pk in event_ids if pk in events][:limit]
+
     @staticmethod
     def get_user_events(user, status=None):
         """Получить мероприятия пользователя"""
@@ -169,6 +211,41 @@ class EventService:
             return False
 
 
+class LifecycleService:
+    """Периодический перевод отживших записей из опубликованных в завершенные и архивные"""
+
+    @staticmethod
+    def transition(queryset, status, now, batch_size=1000):
+        """Обновить статус пачками по первичному ключу, чтобы не держать долгих блокировок"""
+        total = 0
+        while True:
+            pks = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+            if pks:
+                total += queryset.filter(pk__in=pks).update(status=status, updated_at=now)
+            if len(pks) < batch_size:
+                return total
+
+    @staticmethod
+    def complete_events(now=None, batch_size=1000):
+        """Перевести закончившиеся мероприятия в завершенные"""
+        now = now or timezone.now()
+        ended = Event.objects.filter(status='published', end_date__lt=now)
+        return LifecycleService.transition(ended, 'completed', now, batch_size)
+
+    @staticmethod
+    def archive_news(now=None, batch_size=1000):
+        """Перевести в архив новости старше NEWS_ARCHIVE_AFTER_DAYS"""
+        now = now or timezone.now()
+        expired = News.objects.filter(
+            status='published', published_at__lt=now - timedelta(days=settings.NEWS_ARCHIVE_AFTER_DAYS)
+        )
+        archived = LifecycleService.transition(expired, 'archived', now, batch_size)
+        if archived:
+            # UPDATE обходит сигналы, поэтому кэш лент сбрасываем явно
+            feeds.invalidate()
+        return archived
+
+
 class NewsService:
     @staticmethod
     def get_latest_news(limit=5):
@@ -218,4 +295,225 @@ class KnowledgeBaseService:
             'category'
         ).annotate(
             count=Count('id')
-        ).order_by('-count')
\ No newline at end of file
+        ).order_by('-count')
+
+
+class VolunteerStatsService:
+    """Счетчики User.events_participated и User.total_volunteer_hours"""
+
+    @staticmethod
+    def contribution(status, volunteer_hours):
+        """Вклад одного участия в статистику: (мероприятий, часов)"""
+        if status != 'attended':
+            return 0, 0
+        return 1, volunteer_hours or 0
+
+    @staticmethod
+    def apply_delta(user_id, events, hours):
+        """Атомарно изменить счетчики пользователя на разницу"""
+        if not events and not hours:
+            return
+        User.objects.filter(pk=user_id).update(
+            events_participated=Greatest(F('events_participated') + events, 0),
+            total_volunteer_hours=Greatest(F('total_volunteer_hours') + hours, 0),
+        )
+
+    @staticmethod
+    def actual_stats():
+        """Подзапросы с фактической статистикой пользователя по участиям"""
+        attended = EventParticipation.objects.filter(user=OuterRef('pk'), status='attended').order_by().values('user')
+        events = attended.annotate(total=Count('pk')).values('total')
+        hours = attended.annotate(total=Sum('volunteer_hours')).values('total')
+        return {
+            'events_participated': Coalesce(Subquery(events, output_field=IntegerField()), Value(0)),
+            'total_volunteer_hours': Coalesce(Subquery(hours, output_field=IntegerField()), Value(0)),
+        }
+
+    @staticmethod
+    def recompute(chunk_size=1000, dry_run=False):
+        """
+        Пересчитать счетчики всех пользователей порциями по первичному ключу.
+        Обновляются только разошедшиеся строки; возвращает (проверено, исправлено).
+        """
+        actual = VolunteerStatsService.actual_stats()
+        checked = fixed = 0
+        last_pk = 0
+        while True:
+            chunk = list(User.objects.filter(pk__gt=last_pk).order_by('pk')
+                         .values_list('pk', flat=True)[:chunk_size])
+            if not chunk:
+                return checked, fixed
+            last_pk = chunk[-1]
+            checked += len(chunk)
+
+            drifted = list(
+                User.objects.filter(pk__in=chunk)
+                .annotate(actual_events=actual['events_participated'], actual_hours=actual['total_volunteer_hours'])
+                .exclude(events_participated=F('actual_events'), total_volunteer_hours=F('actual_hours'))
+                .values_list('pk', flat=True)
+            )
+            fixed += len(drifted)
+            if drifted and not dry_run:
+                User.objects.filter(pk__in=drifted).update(**actual)
+
+
+class LeaderboardService:
+    """Рейтинги волонтеров по часам в разрезе города и периода"""
+    CURSOR_SALT = 'content.leaderboard'
+
+    @staticmethod
+    def period_starts(moment):
+        """Начало месяца, года и "всего времени" для даты мероприятия"""
+        day = timezone.localtime(moment).date() if isinstance(moment, datetime) else moment
+        return [
+            ('month', day.replace(day=1)),
+            ('year', day.replace(month=1, day=1)),
+            ('all', LeaderboardEntry.ALL_TIME),
+        ]
+
+    @staticmethod
+    def keys(city, moment):
+        """Все рейтинги, в которые попадает участие: город и "все города" по каждому периоду"""
+        return [
+            (board_city, period, start)
+            for board_city in (city, LeaderboardEntry.ALL_CITIES)
+            for period, start in LeaderboardService.period_starts(moment)
+        ]
+
+    @staticmethod
+    def apply_delta(user_id, event_id, events, hours):
+        """Изменить позиции пользователя во всех рейтингах мероприятия на разницу"""
+        if not events and not hours:
+            return
+        event = Event.objects.filter(pk=event_id).values('city', 'start_date').first()
+        if event is None:
+            return
+        LeaderboardService.apply_to_keys(user_id, LeaderboardService.keys(event['city'], event['start_date']),
+                                         events, hours)
+
+    @staticmethod
+    def move_event(event_id, previous, current):
+        """
+        Перенести вклад участников мероприятия из рейтингов прежних (город, дата начала)
+        в рейтинги новых; рейтинги, общие для обоих, не меняются
+        """
+        previous_keys = LeaderboardService.keys(*previous)
+        current_keys = LeaderboardService.keys(*current)
+        removed = [key for key in previous_keys if key not in current_keys]
+        added = [key for key in current_keys if key not in previous_keys]
+        if not removed and not added:
+            return
+        attended = (EventParticipation.objects.filter(event_id=event_id, status='attended')
+                    .values_list('user_id', 'volunteer_hours'))
+        for user_id, volunteer_hours in attended.iterator():
+            events, hours = VolunteerStatsService.contribution('attended', volunteer_hours)
+            LeaderboardService.apply_to_keys(user_id, removed, -events, -hours)
+            LeaderboardService.apply_to_keys(user_id, added, events, hours)
+
+    @staticmethod
+    def apply_to_keys(user_id, keys, events, hours):
+        """Изменить записи пользователя в рейтингах keys [(город, период, начало)] на разницу"""
+        for city, period, start in keys:
+            entry = LeaderboardEntry.objects.filter(user_id=user_id, city=city, period=period, period_start=start)
+            changes = {
+                'hours': Greatest(F('hours') + hours, 0),
+                'events': Greatest(F('events') + events, 0),
+            }
+            if entry.update(**changes) or hours < 0 or events < 0:
+                continue
+            # Строки еще нет; при гонке с другим запросом создаст ее тот, кто успеет первым
+            try:
+                with transaction.atomic():
+                    LeaderboardEntry.objects.create(user_id=user_id, city=city, period=period,
+                                                    period_start=start, hours=hours, events=events)
+            except IntegrityError:
+                entry.update(**changes)
+
+    @staticmethod
+    def rebuild(batch_size=1000):
+        """Пересобрать все рейтинги по таблице участий"""
+        totals = Counter()
+        attended = (EventParticipation.objects.filter(status='attended')
+                    .values_list('user_id', 'event__city', 'event__start_date', 'volunteer_hours'))
+        for user_id, city, start_date, hours in attended.iterator(chunk_size=batch_size):
+            for key in LeaderboardService.keys(city, start_date):
+                totals[user_id, *key, 'hours'] += hours or 0
+                totals[user_id, *key, 'events'] += 1
+
+        entries = {}
+        for (user_id, city, period, start, field), value in totals.items():
+            entry = entries.setdefault((user_id, city, period, start), LeaderboardEntry(
+                user_id=user_id, city=city, period=period, period_start=start
+            ))
+            setattr(entry, field, value)
+
+        with transaction.atomic():
+            LeaderboardEntry.objects.all().delete()
+            LeaderboardEntry.objects.bulk_create(entries.values(), batch_size=batch_size)
+        return len(entries)
+
+    @staticmethod
+    def get_board(city=LeaderboardEntry.ALL_CITIES, period='month', moment=None):
+        """QuerySet рейтинга, упорядоченный по индексу leaderboard_rank_idx"""
+        start = dict(LeaderboardService.period_starts(moment or timezone.now()))[period]
+        return (LeaderboardEntry.objects.filter(city=city, period=period, period_start=start, hours__gt=0)
+                .order_by('-hours', 'user_id'))
+
+    @staticmethod
+    def encode_cursor(entry):
+        position = [entry.hours, entry.user_id, entry.position, entry.rank]
+        return signing.dumps(position, salt=LeaderboardService.CURSOR_SALT)
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """(часы, id пользователя, позиция, место) последней записи страницы или None"""
+        try:
+            position = signing.loads(cursor, salt=LeaderboardService.CURSOR_SALT)
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+        if not isinstance(position, list) or len(position) != 4 or not all(isinstance(v, int) for v in position):
+            return None
+        return position
+
+    @staticmethod
+    def get_page(city=LeaderboardEntry.ALL_CITIES, period='month', moment=None, cursor=None, per_page=50):
+        """(страница рейтинга, курсор следующей страницы или None)
+
+        Страницы листаются по индексу leaderboard_rank_idx от (часы, id) последней записи без OFFSET.
+        Место rank (одинаковое при равных часах) считается по позиции записи: позиция и место последней
+        записи передаются в подписанном курсоре, поэтому отдельный COUNT не нужен.
+        """
+        board = LeaderboardService.get_board(city, period, moment).select_related('user')
+        position, rank, previous_hours = 0, 0, None
+        last = LeaderboardService.decode_cursor(cursor) if cursor else None
+        if last:
+            previous_hours, user_id, position, rank = last
+            board = board.filter(Q(hours__lt=previous_hours) | Q(hours=previous_hours, user_id__gt=user_id))
+
+        # Одна лишняя запись показывает, есть ли следующая страница
+        entries = list(board[:per_page + 1])
+        next_cursor = None
+        for entry in entries[:per_page]:
+            position += 1
+            if entry.hours != previous_hours:
+                rank = position
+            entry.position, entry.rank = position, rank
+            previous_hours = entry.hours
+        if len(entries) > per_page:
+            entries = entries[:per_page]
+            next_cursor = LeaderboardService.encode_cursor(entries[-1])
+        return entries, next_cursor
+
+    @staticmethod
+    def get_ranks(user, city=LeaderboardEntry.ALL_CITIES, moment=None):
+        """Места пользователя во всех рейтингах периода одним запросом: {период: запись с rank}"""
+        periods = Q()
+        for period, start in LeaderboardService.period_starts(moment or timezone.now()):
+            periods |= Q(period=period, period_start=start)
+        higher = (LeaderboardEntry.objects
+                  .filter(city=OuterRef('city'), period=OuterRef('period'),
+                          period_start=OuterRef('period_start'), hours__gt=OuterRef('hours'))
+                  .order_by().values('period').annotate(total=Count('pk')).values('total'))
+        entries = (LeaderboardEntry.objects.filter(periods, user=user, city=city, hours__gt=0)
+                   .annotate(rank=Coalesce(Subquery(higher, output_field=IntegerField()), Value(0)) + 1))
+        return {entry.period: entry for entry in entries}
@@ -1,21 +1,174 @@
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.contrib.contenttypes.models import ContentType
-from .models import Event, EventParticipation
+from organizations.models import NKO
+from .models import News, Event, KnowledgeBase, EventParticipation, Comment
+from .services import VolunteerStatsService, LeaderboardService
+from . import feeds, moderation, recommendations, related, reminders
 
 @receiver(post_save, sender=EventParticipation)
 def update_event_participants(sender, instance, created, **kwargs):
     """Обновление счетчика участников при изменении участия"""
     if created:
         instance.event.current_participants += 1
-        instance.event.save()
+        instance.event.save(update_fields=['current_participants'])
     elif instance.status == 'cancelled':
         instance.event.current_participants = max(0, instance.event.current_participants - 1)
-        instance.event.save()
+        instance.event.save(update_fields=['current_participants'])
 
 @receiver(pre_delete, sender=EventParticipation)
 def decrease_event_participants(sender, instance, **kwargs):
     """Уменьшение счетчика участников при удалении участия"""
     if instance.status != 'cancelled':
         instance.event.current_participants = max(0, instance.event.current_participants - 1)
-        instance.event.save()
\ No newline at end of file
+        instance.event.save(update_fields=['current_participants'])
+
+
+@receiver(pre_save, sender=EventParticipation)
+def remember_participation_stats(sender, instance, **kwargs):
+    """Запомнить статус и вклад участия в статистику до сохранения"""
+    instance._previous_contribution = (0, 0)
+    instance._previous_status = None
+    if instance.pk and not instance._state.adding:
+        previous = (EventParticipation.objects.filter(pk=instance.pk)
+                    .values_list('status', 'volunteer_hours').first())
+        if previous:
+            instance._previous_contribution = VolunteerStatsService.contribution(*previous)
+            instance._previous_status = previous[0]
+
+
+@receiver(post_save, sender=EventParticipation)
+def update_volunteer_stats(sender, instance, **kwargs):
+    """Обновление статистики волонтера при смене статуса или часов"""
+    events, hours = VolunteerStatsService.contribution(instance.status, instance.volunteer_hours)
+    previous_events, previous_hours = getattr(instance, '_previous_contribution', (0, 0))
+    VolunteerStatsService.apply_delta(instance.user_id, events - previous_events, hours - previous_hours)
+    LeaderboardService.apply_delta(instance.user_id, instance.event_id,
+                                   events - previous_events, hours - previous_hours)
+
+
+@receiver(post_delete, sender=EventParticipation)
+def decrease_volunteer_stats(sender, instance, **kwargs):
+    """Уменьшение статистики волонтера при удалении участия"""
+    events, hours = VolunteerStatsService.contribution(instance.status, instance.volunteer_hours)
+    VolunteerStatsService.apply_delta(instance.user_id, -events, -hours)
+    LeaderboardService.apply_delta(instance.user_id, instance.event_id, -events, -hours)
+
+
+def get_recommendation_data(instance):
+    # Читаем из __dict__, чтобы не загружать отложенные поля
+    return tuple(instance.__dict__.get(field) for field in sorted(recommendations.INDEXED_FIELDS))
+
+
+@receiver(post_init, sender=Event)
+def remember_recommendation_data(sender, instance, **kwargs):
+    """Запомнить поля, по которым построен индекс рекомендаций"""
+    instance._previous_recommendation_data = get_recommendation_data(instance)
+
+
+@receiver(post_save, sender=Event)
+def invalidate_recommendations(sender, instance, created, update_fields=None, **kwargs):
+    """Сброс индекса рекомендаций, если изменились данные, по которым он построен"""
+    if update_fields is not None and not recommendations.INDEXED_FIELDS & set(update_fields):
+        return
+    # Полное сохранение (например, счетчика участников) без изменения этих полей индекс не сбрасывает
+    data = get_recommendation_data(instance)
+    if created or data != instance._previous_recommendation_data:
+        recommendations.invalidate()
+    instance._previous_recommendation_data = data
+
+
+@receiver(post_delete, sender=Event)
+def invalidate_recommendations_on_delete(sender, instance, **kwargs):
+    recommendations.invalidate()
+
+
+@receiver(post_save, sender=News)
+@receiver(post_save, sender=KnowledgeBase)
+def update_related_content(sender, instance, update_fields=None, **kwargs):
+    """Пересчет похожих материалов при изменении текста или публикации"""
+    # Сохранения счетчиков (view_count и т.п.) индекс не затрагивают
+    if update_fields is None or related.INDEXED_FIELDS & set(update_fields):
+        related.update(instance)
+
+
+@receiver(post_delete, sender=News)
+@receiver(post_delete, sender=KnowledgeBase)
+def remove_related_content(sender, instance, **kwargs):
+    related.remove(instance)
+
+
+@receiver(post_init, sender=News)
+def remember_news_feed_scope(sender, instance, **kwargs):
+    """Запомнить статус, город и НКО новости, чтобы при переносе сбросить и прежние ленты"""
+    instance._previous_feed_scope = tuple(instance.__dict__.get(field) for field in ('status', 'city', 'nko_id'))
+
+
+@receiver(post_save, sender=News)
+def invalidate_news_feeds(sender, instance, update_fields=None, **kwargs):
+    """Сброс кэша лент при публикации, правке или снятии новости"""
+    if update_fields is not None and not feeds.FEED_FIELDS & set(update_fields):
+        return
+    status, city, nko_id = instance._previous_feed_scope
+    # Черновики в ленты не попадают, их правки кэш не трогают
+    if 'published' in (status, instance.status):
+        feeds.invalidate(*feeds.get_scopes(city, nko_id), *feeds.get_scopes(instance.city, instance.nko_id))
+    instance._previous_feed_scope = (instance.status, instance.city, instance.nko_id)
+
+
+@receiver(post_delete, sender=News)
+def invalidate_news_feeds_on_delete(sender, instance, **kwargs):
+    if instance.status == 'published':
+        feeds.invalidate(*feeds.get_scopes(instance.city, instance.nko_id))
+
+
+@receiver(post_save, sender=EventParticipation)
+def schedule_reminders(sender, instance, created, **kwargs):
+    """Планирование напоминаний при регистрации и смене статуса участия"""
+    if created or instance.status != getattr(instance, '_previous_status', None):
+        reminders.schedule(instance, created)
+
+
+@receiver(post_init, sender=Event)
+def remember_event_schedule(sender, instance, **kwargs):
+    """Запомнить даты и статус мероприятия, чтобы при сохранении понять, сдвинулись ли напоминания"""
+    # Читаем из __dict__, чтобы не загружать отложенные поля
+    instance._previous_schedule = tuple(instance.__dict__.get(field) for field in reminders.SCHEDULE_FIELDS)
+
+
+@receiver(post_save, sender=Event)
+def reschedule_reminders(sender, instance, created, update_fields=None, **kwargs):
+    """Пересчет напоминаний участников при переносе или отмене мероприятия"""
+    schedule = tuple(getattr(instance, field) for field in reminders.SCHEDULE_FIELDS)
+    changed = update_fields is None or set(reminders.SCHEDULE_FIELDS) & set(update_fields)
+    if not created and changed and schedule != instance._previous_schedule:
+        reminders.schedule_event(instance)
+    instance._previous_schedule = schedule
+
+
+@receiver(post_init, sender=Event)
+def remember_leaderboard_scope(sender, instance, **kwargs):
+    """Запомнить город и дату мероприятия, по которым его участия учтены в рейтингах"""
+    # Читаем из __dict__, чтобы не загружать отложенные поля
+    instance._previous_leaderboard_scope = tuple(instance.__dict__.get(field) for field in ('city', 'start_date'))
+
+
+@receiver(post_save, sender=Event)
+def move_leaderboard_entries(sender, instance, created, update_fields=None, **kwargs):
+    """Перенос часов участников в рейтинги нового города и периода при переносе мероприятия"""
+    if update_fields is not None and not {'city', 'start_date'} & set(update_fields):
+        return
+    scope = (instance.city, instance.start_date)
+    if not created and scope != instance._previous_leaderboard_scope:
+        LeaderboardService.move_event(instance.pk, instance._previous_leaderboard_scope, scope)
+    instance._previous_leaderboard_scope = scope
+
+
+@receiver(post_save, sender=News)
+@receiver(post_save, sender=Event)
+@receiver(post_save, sender=NKO)
+@receiver(post_save, sender=Comment)
+def invalidate_moderation_counts(sender, instance, **kwargs):
+    """Новая запись в очереди модерации сразу попадает в счетчики"""
+    if moderation.is_pending(instance):
+        moderation.invalidate_counts()
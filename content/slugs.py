@@ -0,0 +1,94 @@
+"""
+Уникальные slug для материалов с русскими заголовками.
+
+Заголовок транслитерируется ("Субботник в парке" -> "subbotnik-v-parke"),
+после чего занятые варианты основы (основа, основа-2, основа-3, ...)
+читаются одним запросом slug LIKE 'основа%' по уникальному индексу и
+выбирается первый свободный номер. SlugAllocator запоминает занятые номера,
+поэтому при импорте пачки новостей на каждую основу уходит один запрос.
+"""
+import re
+
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y',
+    'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+TRANSLIT_TABLE = str.maketrans(TRANSLIT)
+
+# Запас под суффикс "-<номер>"
+SUFFIX_LENGTH = 8
+# Сколько раз пытаться сохранить объект, если параллельный запрос занял тот же slug
+SAVE_ATTEMPTS = 5
+
+
+def transliterate(text):
+    return text.lower().translate(TRANSLIT_TABLE)
+
+
+def make_base(text, max_length, default='item'):
+    """Основа slug: транслитерация, обрезанная по границе слова с запасом под суффикс"""
+    base = slugify(transliterate(text))
+    limit = max_length - SUFFIX_LENGTH
+    if len(base) > limit:
+        base = base[:limit].rsplit('-', 1)[0] if '-' in base[:limit] else base[:limit]
+    return base.strip('-') or default
+
+
+class SlugAllocator:
+    """Выдает свободные slug для модели, запоминая уже занятые"""
+
+    def __init__(self, model, field='slug', default=None):
+        self.model = model
+        self.field = field
+        self.max_length = model._meta.get_field(field).max_length
+        self.default = default or model._meta.model_name
+        # основа -> (занятые номера, первый номер, который еще стоит проверить)
+        self.reserved = {}
+
+    def load(self, base):
+        """Занятые номера основы одним запросом по префиксу; 1 - сама основа"""
+        pattern = re.compile(rf'{re.escape(base)}(?:-(\d+))?')
+        slugs = self.model._default_manager.filter(**{f'{self.field}__startswith': base}).values_list(
+            self.field, flat=True)
+        taken = set()
+        for slug in slugs:
+            match = pattern.fullmatch(slug)
+            if match:
+                taken.add(int(match.group(1) or 1))
+        return taken
+
+    def allocate(self, text):
+        base = make_base(text, self.max_length, self.default)
+        if base not in self.reserved:
+            self.reserved[base] = (self.load(base), 1)
+        taken, number = self.reserved[base]
+        while number in taken:
+            number += 1
+        taken.add(number)
+        self.reserved[base] = (taken, number + 1)
+        return base if number == 1 else f'{base}-{number}'
+
+
+def save_with_unique_slug(instance, save, text, field='slug'):
+    """
+    Сохранить объект, подобрав свободный slug по тексту. Уникальность
+    гарантирует индекс: если параллельный запрос успел занять тот же slug,
+    сохранение откатывается до точки сохранения и повторяется со свежим списком.
+    """
+    for attempt in range(SAVE_ATTEMPTS):
+        slug = SlugAllocator(type(instance), field).allocate(text)
+        setattr(instance, field, slug)
+        try:
+            with transaction.atomic():
+                save()
+            return
+        except IntegrityError:
+            setattr(instance, field, '')
+            taken = type(instance)._default_manager.filter(**{field: slug}).exists()
+            if not taken or attempt == SAVE_ATTEMPTS - 1:
+                raise
@@ -1,3 +1,1124 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.contenttypes.models import ContentType
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User, UserProfile
+from cities import index as city_index
+from organizations.models import NKO, NKOMembership
+from dobro.benchmarks import compare, percentile, run_benchmarks
+from dobro.middleware import QueryInstrumentationMiddleware, QueryStats
+from dobro.testing import (QueryBudgetMixin, create_user, create_users, create_news, create_event,
+                           create_material, create_comments, create_nko)
+from .models import (News, Event, KnowledgeBase, EventParticipation, ContentLike, LeaderboardEntry, ContentSignature, RelatedContent,
+                     Reminder, Comment, ContentView)
+from .services import EventService, LeaderboardService, LifecycleService
+from . import exports, ical, moderation, related, reminders
+from .slugs import SlugAllocator, transliterate
+
+
+class BenchmarkTest(TestCase):
+    def test_run_benchmarks_measures_every_case(self):
+        results = run_benchmarks([1], repeat=1, flush=False)
+
+        self.assertIn('1:NKOService.get_nko_stats', results)
+        self.assertIn('1:VerificationService.verify_email_code', results)
+        self.assertIn('1:view:nko_detail', results)
+        for result in results.values():
+            self.assertEqual(set(result), {'p50_ms', 'p95_ms', 'queries', 'runs'})
+        self.assertGreater(results['1:view:news_list']['queries'], 0)
+        self.assertEqual(results['1:async_view:news_list']['queries'], results['1:view:news_list']['queries'])
+
+    def test_compare_detects_regressions(self):
+        baseline = {'1:view:news_list': {'p50_ms': 2.0, 'p95_ms': 4.0, 'queries': 3, 'runs': 20}}
+
+        self.assertEqual(compare({'1:view:news_list': {'p95_ms': 4.5, 'queries': 3}}, baseline), [])
+        self.assertEqual(len(compare({'1:view:news_list': {'p95_ms': 9.0, 'queries': 3}}, baseline)), 1)
+        self.assertEqual(len(compare({'1:view:news_list': {'p95_ms': 4.0, 'queries': 4}}, baseline)), 1)
+        self.assertEqual(compare({'1:view:event_list': {'p95_ms': 100.0, 'queries': 50}}, baseline), [])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile([7], 95), 7)
+
+
+class VolunteerStatsTest(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.event = create_event()
+
+    def assertStats(self, events, hours, user=None):
+        user = user or self.user
+        user.refresh_from_db(fields=['events_participated', 'total_volunteer_hours'])
+        self.assertEqual((user.events_participated, user.total_volunteer_hours), (events, hours))
+
+    def test_counters_follow_participation_changes(self):
+        participation = EventParticipation.objects.create(user=self.user, event=self.event)
+        self.assertStats(0, 0)
+
+        participation.status = 'attended'
+        participation.volunteer_hours = 4
+        participation.save()
+        self.assertStats(1, 4)
+
+        participation.volunteer_hours = 6
+        participation.save()
+        self.assertStats(1, 6)
+
+        participation.status = 'no_show'
+        participation.save()
+        self.assertStats(0, 0)
+
+        EventParticipation.objects.create(user=self.user, event=create_event(), status='attended',
+                                          volunteer_hours=3).delete()
+        self.assertStats(0, 0)
+
+    def test_recompute_repairs_drift(self):
+        users = [create_user() for _ in range(5)]
+        for user in users:
+            EventParticipation.objects.create(user=user, event=self.event, status='attended', volunteer_hours=2)
+        User.objects.filter(pk__in=[users[0].pk, users[3].pk]).update(events_participated=7)
+
+        out = io.StringIO()
+        call_command('recompute_volunteer_stats', chunk_size=2, dry_run=True, stdout=out)
+        self.assertIn('найдено расхождений: 2', out.getvalue())
+        self.assertStats(7, 2, users[0])
+
+        call_command('recompute_volunteer_stats', chunk_size=2, stdout=io.StringIO())
+        for user in users:
+            self.assertStats(1, 2, user)
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        self.event = create_event(city='Саров')
+        self.other_city_event = create_event(city='Озерск', start_date=self.event.start_date)
+
+    def attend(self, event, hours, user=None):
+        user = user or create_user()
+        EventParticipation.objects.create(user=user, event=event, status='attended', volunteer_hours=hours)
+        return user
+
+    def board_rows(self):
+        return sorted(LeaderboardEntry.objects.values_list('user', 'city', 'period', 'period_start', 'hours', 'events'))
+
+    def test_signals_update_every_board(self):
+        user = self.attend(self.event, 5)
+        self.attend(self.other_city_event, 2, user=user)
+
+        self.assertEqual(LeaderboardEntry.objects.filter(user=user).count(), 9)
+        self.assertEqual(LeaderboardService.get_board('Саров', 'year', self.event.start_date).get().hours, 5)
+        self.assertEqual(LeaderboardService.get_board('', 'all').get().hours, 7)
+
+        EventParticipation.objects.filter(user=user, event=self.event).get().delete()
+        self.assertEqual(LeaderboardService.get_board('', 'month', self.event.start_date).get().hours, 2)
+        self.assertFalse(LeaderboardService.get_board('Саров', 'month', self.event.start_date).exists())
+
+    def test_ranks_share_place_on_ties(self):
+        first = self.attend(self.event, 8)
+        second = self.attend(self.event, 5)
+        third = self.attend(self.event, 5)
+        last = self.attend(self.event, 1)
+
+        page, cursor = LeaderboardService.get_page('Саров', 'month', self.event.start_date, per_page=2)
+        self.assertEqual([(entry.user_id, entry.rank) for entry in page], [(first.pk, 1), (second.pk, 2)])
+        # Место на следующей странице выводится из курсора, без COUNT
+        with self.assertNumQueries(1):
+            page, cursor = LeaderboardService.get_page('Саров', 'month', self.event.start_date, cursor, per_page=2)
+        self.assertEqual([(entry.user_id, entry.rank) for entry in page], [(third.pk, 2), (last.pk, 4)])
+        self.assertIsNone(cursor)
+        # Поддельный курсор открывает первую страницу
+        page, _ = LeaderboardService.get_page('Саров', 'month', self.event.start_date, 'подделка', per_page=2)
+        self.assertEqual(page[0].user_id, first.pk)
+
+        with self.assertNumQueries(1):
+            ranks = LeaderboardService.get_ranks(second, 'Саров', self.event.start_date)
+        self.assertEqual({period: entry.rank for period, entry in ranks.items()}, {'month': 2, 'year': 2, 'all': 2})
+        self.assertEqual(LeaderboardService.get_ranks(first, moment=self.event.start_date)['year'].rank, 1)
+
+    def test_rebuild_matches_incremental_updates(self):
+        user = self.attend(self.event, 4)
+        self.attend(self.other_city_event, 3, user=user)
+        self.attend(self.event, 6)
+        incremental = self.board_rows()
+
+        LeaderboardEntry.objects.update(hours=0)
+        call_command('rebuild_leaderboards', stdout=io.StringIO())
+        self.assertEqual(self.board_rows(), incremental)
+
+    def test_leaderboard_page_requires_coordinator(self):
+        self.attend(self.event, 4)
+        url = reverse('content:leaderboard')
+
+        self.client.force_login(create_user())
+        self.assertRedirects(self.client.get(url), reverse('home'), fetch_redirect_response=False)
+
+        self.client.force_login(create_user(role='corporate_coordinator'))
+        response = self.client.get(url, {'period': 'all', 'city': 'Саров'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['entries']), 1)
+        # Город из запроса приводится к названию из справочника, как в фильтрах списков
+        response = self.client.get(url, {'period': 'all', 'city': ' саров'})
+        self.assertEqual(response.context['selected_city'], 'Саров')
+        self.assertEqual(len(response.context['entries']), 1)
+
+    def test_moved_event_moves_entries(self):
+        user = self.attend(self.event, 4)
+        self.attend(self.event, 2)
+        self.event.city = 'Озерск'
+        self.event.start_date += timedelta(days=40)
+        self.event.save()
+
+        self.assertFalse(LeaderboardService.get_board('Саров', 'all').exists())
+        self.assertEqual(LeaderboardService.get_board('Озерск', 'month', self.event.start_date).first().user, user)
+        moved = [row for row in self.board_rows() if row[4] or row[5]]
+        call_command('rebuild_leaderboards', stdout=io.StringIO())
+        self.assertEqual(self.board_rows(), moved)
+
+        # Сохранение без переноса рейтинги не трогает
+        event = Event.objects.get(pk=self.event.pk)
+        with self.assertNumQueries(1):
+            event.save(update_fields=['title'])
+
+
+class RecommendationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Ближайший понедельник и вторник в 12:00 по местному времени
+        today = timezone.localtime().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.monday = today + timedelta(days=7 - today.weekday())
+        self.tuesday = self.monday + timedelta(days=1)
+        self.user = create_user(skills='Фотография, первая помощь', interests='экология', city='Саров')
+
+    def test_ranks_by_skills_and_interests(self):
+        photo = create_event(description='Нужны фотографы для репортажа', start_date=self.monday)
+        ecology = create_event(description='Субботник и экологический урок', start_date=self.monday)
+        create_event(description='Турнир по шахматам', start_date=self.monday)
+
+        events = EventService.get_recommended_events(self.user)
+        self.assertEqual(events, [photo, ecology])
+
+    def test_filters_city_weekdays_and_registered_events(self):
+        online = create_event(description='Фотография онлайн', city='Москва', online=True, start_date=self.monday)
+        create_event(description='Фотография в другом городе', city='Москва', start_date=self.monday)
+        create_event(description='Фотография во вторник', start_date=self.tuesday)
+        registered = create_event(description='Фотография, уже записан', start_date=self.monday)
+        EventParticipation.objects.create(user=self.user, event=registered)
+        UserProfile.objects.filter(user=self.user).update(available_weekdays='пн,сб')
+
+        self.assertEqual(EventService.get_recommended_events(self.user), [online])
+
+    def test_cached_until_events_change(self):
+        event = create_event(description='Фотография на празднике', start_date=self.monday)
+        self.assertEqual(EventService.get_recommended_events(self.user), [event])
+
+        with self.assertNumQueries(2):
+            EventService.get_recommended_events(self.user)
+
+        # Полное сохранение без изменения проиндексированных полей и регистрация кэш не сбрасывают
+        event.save()
+        self.client.force_login(create_user())
+        self.client.post(reverse('content:event_register', args=[event.pk]))
+        with self.assertNumQueries(2):
+            EventService.get_recommended_events(self.user)
+
+        event.description = 'Турнир по шахматам'
+        event.save()
+        self.assertEqual(EventService.get_recommended_events(self.user), [])
+
+
+class RelatedContentTest(TestCase):
+    ECOLOGY = 'Волонтеры убрали мусор в парке, посадили деревья и провели экологический урок для школьников'
+    CHESS = 'Шахматный турнир среди студентов собрал двадцать участников из трех городов области'
+
+    def related_titles(self, instance):
+        return [item.title for item in related.get_related(type(instance), pk=instance.pk)]
+
+    def test_related_items_share_vocabulary(self):
+        first = create_news(title='Субботник в парке', content=self.ECOLOGY)
+        second = create_material(title='Как провести субботник', content=self.ECOLOGY + ' Возьмите перчатки.')
+        chess = create_news(title='Шахматы', content=self.CHESS)
+
+        self.assertEqual(self.related_titles(first), ['Как провести субботник'])
+        self.assertEqual(self.related_titles(second), ['Субботник в парке'])
+        self.assertEqual(self.related_titles(chess), [])
+
+        response = self.client.get(reverse('content:news_detail', args=[first.slug]))
+        self.assertEqual([item.url for item in response.context['related_content']],
+                         [reverse('content:knowledge_base_detail', args=[second.pk])])
+
+    def test_batch_matches_rebuild(self):
+        create_news(title='Субботник', content=self.ECOLOGY)
+        create_material(title='Шахматы', content=self.CHESS)
+        author = create_user()
+        materials = KnowledgeBase.objects.bulk_create([
+            KnowledgeBase(title=f'Памятка {i}', content=f'{self.ECOLOGY} Памятка номер {i}.', category='guide',
+                          author=author)
+            for i in range(3)
+        ] + [KnowledgeBase(title='Закрытая', content=self.ECOLOGY, category='guide', author=author, is_public=False)])
+        # Число запросов не зависит от размера пачки
+        with self.assertNumQueries(8):
+            self.assertEqual(related.add_many(materials), 3)
+        self.assertEqual(len(related.get_related(News, title='Субботник')), 3)
+        batch = set(RelatedContent.objects.values_list('object_id', 'related_id', 'similarity'))
+
+        call_command('build_related_content', stdout=io.StringIO())
+        self.assertEqual(set(RelatedContent.objects.values_list('object_id', 'related_id', 'similarity')), batch)
+
+    def test_weakly_similar_texts_are_not_candidates(self):
+        # Общие слова есть, но сходство около 0.25 - ниже порога LSH
+        other = 'Волонтеры провели урок для школьников о шахматах и собрали двадцать участников из трех городов'
+        first, second = (related.minhash(related.shingles(text)) for text in (self.ECOLOGY, other))
+        self.assertGreater(related.similarity(first, second), related.MIN_SIMILARITY)
+        self.assertFalse(set(related.get_buckets(first)) & set(related.get_buckets(second)))
+
+    def test_index_follows_publication_and_deletion(self):
+        first = create_news(title='Субботник в парке', content=self.ECOLOGY)
+        draft = create_news(title='Черновик', content=self.ECOLOGY, status='draft')
+        self.assertEqual(self.related_titles(first), [])
+
+        draft.status = 'published'
+        draft.save()
+        self.assertEqual(self.related_titles(first), ['Черновик'])
+
+        draft.delete()
+        self.assertEqual(self.related_titles(first), [])
+        self.assertFalse(ContentSignature.objects.filter(object_id=draft.pk, title='Черновик').exists())
+
+    def test_rebuild_matches_incremental_updates(self):
+        for i in range(4):
+            create_news(title=f'Субботник {i}', content=f'{self.ECOLOGY} Отчет номер {i}.')
+        create_material(title='Шахматы', content=self.CHESS)
+        incremental = set(RelatedContent.objects.values_list('object_id', 'related_id', 'similarity'))
+
+        call_command('build_related_content', stdout=io.StringIO())
+        self.assertEqual(set(RelatedContent.objects.values_list('object_id', 'related_id', 'similarity')),
+                         incremental)
+
+
+class SlugTest(TestCase):
+    def test_transliterated_slugs_get_numbered(self):
+        self.assertEqual(transliterate('Щедрый Ёжик'), 'shchedryy ezhik')
+        slugs = [create_news(title='Субботник в парке', slug='').slug for _ in range(3)]
+        self.assertEqual(slugs, ['subbotnik-v-parke', 'subbotnik-v-parke-2', 'subbotnik-v-parke-3'])
+        self.assertEqual(create_news(title='!!!', slug='').slug, 'news')
+        self.assertLessEqual(len(create_news(title='Очень длинный заголовок ' * 20, slug='').slug), 200)
+
+    def test_allocator_reserves_batch_with_one_query(self):
+        for slug in ['subbotnik', 'subbotnik-3', 'subbotnik-v-parke', 'subbotnik-2024']:
+            create_news(slug=slug)
+        allocator = SlugAllocator(News)
+        with self.assertNumQueries(1):
+            slugs = [allocator.allocate('Субботник') for _ in range(3)]
+        self.assertEqual(slugs, ['subbotnik-2', 'subbotnik-4', 'subbotnik-5'])
+
+    def test_save_retries_when_slug_is_taken_concurrently(self):
+        create_news(slug='subbotnik')
+        # Параллельный запрос занял slug между чтением занятых вариантов и вставкой
+        with mock.patch.object(SlugAllocator, 'load', side_effect=[set(), {1}]):
+            news = create_news(title='Субботник', slug='')
+        self.assertEqual(news.slug, 'subbotnik-2')
+
+
+class ReminderTest(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.event = create_event(start_date=self.now + timedelta(days=3),
+                                  registration_deadline=self.now + timedelta(days=2))
+        self.user = create_user(email='volunteer@example.com')
+        self.participation = EventParticipation.objects.create(user=self.user, event=self.event)
+
+    def schedule(self):
+        return dict(Reminder.objects.values_list('kind', 'due_at'))
+
+    def test_participation_changes_update_schedule(self):
+        self.assertEqual(self.schedule(), {
+            'start': self.event.start_date - reminders.START_NOTICE,
+            'deadline': self.event.registration_deadline - reminders.DEADLINE_NOTICE,
+        })
+        self.participation.status = 'confirmed'
+        self.participation.save()
+        self.assertEqual(set(self.schedule()), {'start'})
+        self.participation.status = 'cancelled'
+        self.participation.save()
+        self.assertEqual(self.schedule(), {})
+
+    def test_event_changes_update_schedule(self):
+        self.event.save(update_fields=['current_participants'])
+        self.event.start_date += timedelta(days=1)
+        self.event.save()
+        self.assertEqual(self.schedule()['start'], self.event.start_date - reminders.START_NOTICE)
+
+        self.event.status = 'cancelled'
+        self.event.save()
+        self.assertEqual(self.schedule(), {})
+
+    def test_process_sends_due_reminders(self):
+        soon = create_event(title='Субботник', start_date=self.now + timedelta(hours=2))
+        EventParticipation.objects.create(user=self.user, event=soon)
+        self.assertEqual(len(reminders.claim(10, self.now - timedelta(minutes=1))), 0)
+
+        call_command('send_reminders', once=True, stdout=io.StringIO())
+        self.assertEqual([message.subject for message in mail.outbox],
+                         ['Напоминание: Субботник - Добрые дела Росатома'])
+        self.assertEqual(mail.outbox[0].to, ['volunteer@example.com'])
+        self.assertEqual(set(self.schedule()), {'start', 'deadline'})
+        self.assertEqual(reminders.next_due(), self.event.registration_deadline - reminders.DEADLINE_NOTICE)
+
+    def test_claimed_reminders_are_hidden_until_lease_expires(self):
+        Reminder.objects.update(due_at=self.now)
+        self.assertEqual(len(reminders.claim(1, self.now)), 1)
+        self.assertEqual(len(reminders.claim(10, self.now)), 1)
+        self.assertEqual(len(reminders.claim(10, self.now + reminders.LEASE)), 2)
+
+    def test_rebuild_matches_incremental_updates(self):
+        incremental = set(Reminder.objects.values_list('participation', 'kind', 'due_at'))
+        self.assertEqual(reminders.rebuild(), 2)
+        self.assertEqual(set(Reminder.objects.values_list('participation', 'kind', 'due_at')), incremental)
+
+
+class LifecycleTest(TestCase):
+    def test_transition_moves_only_expired_rows(self):
+        now = timezone.now()
+        ended = create_event(start_date=now - timedelta(days=2))
+        ongoing = create_event(start_date=now - timedelta(hours=1))
+        old = create_news(published_at=now - timedelta(days=400))
+        fresh = create_news()
+
+        with self.assertNumQueries(2):
+            self.assertEqual(LifecycleService.complete_events(now, batch_size=10), 1)
+        call_command('transition_content', stdout=io.StringIO())
+
+        statuses = dict(Event.objects.values_list('pk', 'status'))
+        self.assertEqual((statuses[ended.pk], statuses[ongoing.pk]), ('completed', 'published'))
+        statuses = dict(News.objects.values_list('pk', 'status'))
+        self.assertEqual((statuses[old.pk], statuses[fresh.pk]), ('archived', 'published'))
+
+    def test_completed_and_archived_stay_reachable(self):
+        event = create_event(start_date=timezone.now() - timedelta(days=2), status='completed')
+        news = create_news(status='archived')
+
+        self.assertEqual(self.client.get(reverse('content:event_detail', args=[event.pk])).status_code, 200)
+        response = self.client.get(reverse('content:event_list'), {'timeframe': 'past'})
+        self.assertEqual(list(response.context['events']), [event])
+        self.assertEqual(self.client.get(reverse('content:news_detail', args=[news.slug])).status_code, 200)
+        response = self.client.get(reverse('content:news_list'))
+        self.assertNotIn(news, response.context['news'])
+
+
+class IcalFeedTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.event = create_event(title='Субботник, уборка; парк', city='Озерск')
+        self.cancelled = create_event(city='Озерск', status='cancelled')
+        create_event(city='Озерск', status='draft')
+        create_event(city='Озерск', start_date=now - ical.HISTORY - timedelta(days=1))
+        create_event(city='Саров')
+        self.url = reverse('content:events_ical_city', args=['Озерск'])
+        # Индекс городов, по которому приводится город из адреса, строится один раз на процесс
+        city_index.get_index()
+
+    def get_feed(self, url, **headers):
+        response = self.client.get(url, **headers)
+        body = b''.join(response.streaming_content).decode() if response.status_code == 200 else ''
+        return response, body
+
+    def test_feed_lists_city_events(self):
+        with self.assertNumQueries(2):
+            response, body = self.get_feed(self.url)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+        self.assertIn('SUMMARY:Субботник\\, уборка\\; парк\r\n', body)
+        self.assertIn(f'UID:event-{self.cancelled.pk}@testserver\r\nDTSTAMP', body)
+        self.assertEqual(body.count('STATUS:CANCELLED'), 1)
+
+    async def test_asgi_streams_chunks(self):
+        user = await User.objects.acreate(username='subscriber')
+        await EventParticipation.objects.abulk_create(
+            EventParticipation(user=user, event=event) for event in (self.event, self.cancelled)
+        )
+        response = await self.async_client.get(reverse('content:events_ical_my', args=[ical.user_token(user)]))
+        # Под ASGI лента отдается асинхронным итератором, а не собирается целиком до первого байта
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 2)
+
+    def test_unchanged_feed_answers_not_modified(self):
+        response, _ = self.get_feed(self.url)
+        with self.assertNumQueries(1):
+            cached, _ = self.get_feed(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        cached, _ = self.get_feed(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+
+        self.cancelled.delete()
+        changed, _ = self.get_feed(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_personal_feed_uses_signed_token(self):
+        user = create_user()
+        EventParticipation.objects.create(user=user, event=self.event)
+        response, body = self.get_feed(reverse('content:events_ical_my', args=[ical.user_token(user)]))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        response, _ = self.get_feed(reverse('content:events_ical_my', args=[f'{user.pk}:forged']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_long_lines_are_folded(self):
+        line = 'DESCRIPTION:' + 'Волонтеры ' * 30
+        folded = ical.fold(line)
+        self.assertTrue(all(len(part.encode()) <= 75 for part in folded.split('\r\n')))
+        self.assertEqual(folded.replace('\r\n ', '').rstrip('\r\n'), line)
+
+
+class NewsFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.nko = create_nko(name='Зеленый город')
+        self.news = create_news(title='Субботник в Озерске', city='Озерск', nko=self.nko)
+        create_news(title='Концерт в Сарове', city='Саров')
+        create_news(title='Черновик', city='Озерск', status='draft')
+        self.url = reverse('content:news_feed_city', args=['rss', 'Озерск'])
+
+    def test_feeds_by_city_and_nko(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/rss+xml; charset=utf-8')
+        self.assertContains(response, 'Субботник в Озерске')
+        self.assertNotContains(response, 'Концерт в Сарове')
+        self.assertNotContains(response, 'Черновик')
+
+        response = self.client.get(reverse('content:news_feed_nko', args=['atom', self.nko.pk]))
+        self.assertEqual(response['Content-Type'], 'application/atom+xml; charset=utf-8')
+        self.assertContains(response, '<title>Новости: Зеленый город</title>')
+        self.assertContains(response, 'Субботник в Озерске')
+        self.assertEqual(self.client.get(reverse('content:news_feed', args=['json'])).status_code, 404)
+
+    def test_feed_is_cached_until_publish_in_scope(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).content, first.content)
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        create_news(title='Новость другого города', city='Саров')
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+        create_news(title='Вторая новость Озерска', city='Озерск')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Вторая новость Озерска')
+
+        self.news.status = 'archived'
+        self.news.save()
+        self.assertNotContains(self.client.get(self.url), 'Субботник в Озерске')
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        self.author = create_user()
+        published_at = timezone.now() - timedelta(hours=1)
+        # Одинаковая дата публикации: порядок страниц держится на pk
+        self.news = [create_news(author=self.author, city='Озерск', published_at=published_at, content='Длинный текст')
+                     for _ in range(5)]
+        create_news(author=self.author, city='Саров')
+        create_news(author=self.author, city='Озерск', status='draft')
+
+    def test_news_cursor_pages(self):
+        url = reverse('api:news_list')
+        seen = []
+        params = {'city': 'Озерск', 'limit': 2}
+        with self.assertNumQueries(3):
+            while url:
+                data = self.client.get(url, params).json()
+                seen.extend(item['id'] for item in data['results'])
+                url, params = data['next'], None
+        self.assertEqual(seen, sorted((news.pk for news in self.news), reverse=True))
+
+        response = self.client.get(reverse('api:news_list'), {'cursor': 'подделка'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_sparse_fields(self):
+        item = self.client.get(reverse('api:news_list'), {'city': 'Озерск'}).json()['results'][0]
+        self.assertIn('title', item)
+        self.assertNotIn('content', item)
+
+        item = self.client.get(reverse('api:news_list'), {'city': 'Озерск', 'fields': 'content'}).json()['results'][0]
+        self.assertEqual(item, {'id': self.news[-1].pk, 'content': 'Длинный текст'})
+
+        detail = self.client.get(reverse('api:news_detail', args=[self.news[0].slug])).json()
+        self.assertEqual(detail['content'], 'Длинный текст')
+        self.assertIsNone(detail['cover_image'])
+
+        response = self.client.get(reverse('api:news_list'), {'fields': 'title,author'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('author', response.json()['error'])
+
+    def test_etag(self):
+        url = reverse('api:news_detail', args=[self.news[0].slug])
+        first = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        self.news[0].title = 'Новый заголовок'
+        self.news[0].save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        draft = News.objects.get(status='draft')
+        self.assertEqual(self.client.get(reverse('api:news_detail', args=[draft.slug])).status_code, 404)
+
+    def test_event_timeframes_and_other_resources(self):
+        now = timezone.now()
+        upcoming = create_event(city='Озерск')
+        past = create_event(start_date=now - timedelta(days=3), end_date=now - timedelta(days=2), status='completed')
+        url = reverse('api:event_list')
+        self.assertEqual([item['id'] for item in self.client.get(url).json()['results']], [upcoming.pk])
+        self.assertEqual([item['id'] for item in self.client.get(url, {'timeframe': 'past'}).json()['results']],
+                         [past.pk])
+        self.assertEqual(self.client.get(url, {'timeframe': 'soon'}).status_code, 400)
+
+        material = create_material(category='law')
+        create_material(category='guide')
+        data = self.client.get(reverse('api:knowledge_list'), {'category': 'law'}).json()
+        self.assertEqual([item['id'] for item in data['results']], [material.pk])
+
+        nko = create_nko(city='Озерск')
+        create_nko(city='Озерск', status='pending')
+        data = self.client.get(reverse('api:nko_list'), {'city': 'Озерск', 'fields': 'name'}).json()
+        self.assertEqual(data['results'], [{'id': nko.pk, 'name': nko.name}])
+
+
+class ParticipantExportTest(TestCase):
+    def setUp(self):
+        self.organizer = create_user()
+        self.nko = create_nko()
+        self.event = create_event(created_by=self.organizer, nko=self.nko)
+        self.volunteer = create_user(first_name='Анна', last_name='Смирнова', phone='+7 900 000-00-00')
+        EventParticipation.objects.create(user=self.volunteer, event=self.event, status='attended', volunteer_hours=4)
+        EventParticipation.objects.bulk_create(
+            EventParticipation(user=user, event=self.event) for user in create_users(30)
+        )
+
+    def test_csv_streams_all_rows(self):
+        self.client.force_login(self.organizer)
+        response = self.client.get(reverse('content:event_participants_export', args=[self.event.pk, 'csv']))
+        self.assertTrue(response.streaming)
+        with mock.patch.object(exports, 'CHUNK_SIZE', 7):
+            text = b''.join(response.streaming_content).decode()
+        rows = list(csv.reader(io.StringIO(text.lstrip('\ufeff'))))
+        self.assertEqual(rows[0][:3], ['Фамилия', 'Имя', 'Email'])
+        self.assertEqual(len(rows), 32)
+        self.assertEqual(rows[1][:2], ['Смирнова', 'Анна'])
+        # Телефон начинается с + и выгружается как текст, а не формула
+        self.assertEqual(rows[1][3:7], ["'+7 900 000-00-00", 'Саров', 'Принял участие', '4'])
+
+    def test_formulas_are_escaped_in_csv(self):
+        User.objects.filter(pk=self.volunteer.pk).update(first_name='=HYPERLINK("http://x")', last_name='@SUM(1)')
+        row = next(exports.get_rows(self.event))
+        self.assertEqual(row[:2], ['@SUM(1)', '=HYPERLINK("http://x")'])
+        csv_row = next(csv.reader([list(exports.render_csv([row]))[1]]))
+        self.assertEqual(csv_row[:2], ["'@SUM(1)", '\'=HYPERLINK("http://x")'])
+        # Inline-строка XLSX формулой не считается, апостроф был бы виден в ячейке
+        self.assertIn('<t>@SUM(1)</t>', exports.xlsx_row(row))
+
+    async def test_asgi_streams_chunks(self):
+        await self.async_client.aforce_login(self.organizer)
+        url = reverse('content:event_participants_export', args=[self.event.pk, 'csv'])
+        with mock.patch.object(exports, 'CHUNK_SIZE', 7):
+            response = await self.async_client.get(url)
+            # Под ASGI содержимое - асинхронный итератор, куски не собираются в список заранее
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 6)
+        self.assertEqual(b''.join(chunks).decode().count('\r\n'), 32)
+
+    def test_xlsx_is_a_valid_workbook(self):
+        self.client.force_login(self.organizer)
+        response = self.client.get(reverse('content:event_participants_export', args=[self.event.pk, 'xlsx']))
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 32)
+        self.assertIn('<t>Смирнова</t>', sheet)
+        self.assertIn('<t>+7 900 000-00-00</t>', sheet)
+        self.assertIn('<c><v>4</v></c>', sheet)
+
+    def test_access(self):
+        url = reverse('content:event_participants_export', args=[self.event.pk, 'csv'])
+        self.client.force_login(self.volunteer)
+        self.assertRedirects(self.client.get(url), reverse('content:event_detail', args=[self.event.pk]),
+                             fetch_redirect_response=False)
+
+        # Координатор НКО-организатора
+        NKOMembership.objects.create(user=self.volunteer, nko=self.nko, role='coordinator', status='approved')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url.replace('.csv', '.pdf')).status_code, 404)
+
+
+class BulkImportTest(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.nko = create_nko()
+        start = timezone.now() + timedelta(days=10)
+        event = {'description': 'Уборка парка', 'event_type': 'volunteer', 'city': 'Озерск', 'address': 'Парк',
+                 'start_date': start.isoformat(), 'end_date': (start + timedelta(hours=3)).isoformat()}
+        rows = [{**event, 'title': f'Субботник {i}', 'nko': self.nko.pk, 'status': 'published'} for i in range(5)]
+        rows[1]['end_date'] = rows[1]['start_date']
+        rows[3]['nko'] = 0
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'events.jsonl')
+        with open(self.path, 'w') as file:
+            file.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+            file.write('не json\n')
+
+    def import_events(self, **options):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_data', 'events', self.path, user=self.user.username, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_rows_are_validated_by_form(self):
+        # По запросу на пачку к справочнику городов, в первой пачке город еще и добавляется
+        with self.assertNumQueries(18):
+            out, err = self.import_events(batch_size=2)
+        self.assertIn('Создано: 3 из 6, ошибок: 3', out)
+        self.assertIn('Строка 2: Дата окончания должна быть позже даты начала', err)
+        self.assertIn('Строка 4: nko:', err)
+        self.assertIn('Строка 6: Строка не является объектом JSON', err)
+
+        events = Event.objects.filter(city='Озерск')
+        self.assertEqual(events.count(), 3)
+        self.assertEqual(set(events.values_list('created_by', 'nko', 'status')),
+                         {(self.user.pk, self.nko.pk, 'published')})
+
+    def test_resume_from_checkpoint(self):
+        with open(self.path + '.checkpoint', 'w') as file:
+            json.dump({'kind': 'events', 'line': 3}, file)
+        out, _ = self.import_events()
+        self.assertIn('Продолжаем после строки 3', out)
+        self.assertEqual(list(Event.objects.filter(city='Озерск').values_list('title', flat=True)), ['Субботник 4'])
+        with open(self.path + '.checkpoint') as file:
+            self.assertEqual(json.load(file)['line'], 6)
+
+        # Повторный запуск ничего не дублирует
+        self.import_events()
+        self.assertEqual(Event.objects.filter(city='Озерск').count(), 1)
+
+    def test_missing_fields_get_model_defaults(self):
+        path = os.path.join(os.path.dirname(self.path), 'materials.csv')
+        with open(path, 'w') as file:
+            file.write('title,content,category\nПамятка волонтеру,Текст,guide\n')
+        call_command('import_data', 'knowledge', path, user=self.user.username, stdout=io.StringIO())
+        material = KnowledgeBase.objects.get(title='Памятка волонтеру')
+        self.assertEqual((material.difficulty_level, material.is_public, material.author), ('beginner', True, self.user))
+
+    def test_knowledge_import_updates_related_content(self):
+        news = create_news(title='Субботник в парке', content=RelatedContentTest.ECOLOGY)
+        path = os.path.join(os.path.dirname(self.path), 'materials.jsonl')
+        with open(path, 'w') as file:
+            row = {'title': 'Как провести субботник', 'content': RelatedContentTest.ECOLOGY, 'category': 'guide'}
+            file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        call_command('import_data', 'knowledge', path, user=self.user.username, stdout=io.StringIO())
+        self.assertEqual([item.title for item in related.get_related(News, pk=news.pk)], ['Как провести субботник'])
+
+
+class ModerationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.moderator = create_user(role='moderator')
+        self.news = create_news(status='pending', published_at=None)
+        self.event = create_event(status='pending')
+        self.nko = create_nko(status='pending')
+        self.comment = create_comments(self.news, [create_user()])[0]
+        Comment.objects.filter(pk=self.comment.pk).update(is_approved=False)
+        create_news()
+        # Одинаковое время поступления: порядок определяется типом и id
+        moment = timezone.now() - timedelta(days=1)
+        for model in (News, Event, NKO, Comment):
+            model.objects.update(created_at=moment)
+
+    def test_page_is_ordered_and_paginated_across_kinds(self):
+        first, cursor = moderation.get_page(limit=3)
+        self.assertEqual([(item['kind'], item['id']) for item in first],
+                         [('comment', self.comment.pk), ('event', self.event.pk), ('news', self.news.pk)])
+        self.assertEqual(first[0]['label'], 'Комментарий')
+        self.assertEqual(first[1]['admin_url'], reverse('admin:content_event_change', args=[self.event.pk]))
+
+        second, cursor = moderation.get_page(cursor, limit=3)
+        self.assertEqual([(item['kind'], item['id']) for item in second], [('nko', self.nko.pk)])
+        self.assertIsNone(cursor)
+
+        items, _ = moderation.get_page(kinds=['nko', 'news'])
+        self.assertEqual([item['kind'] for item in items], ['news', 'nko'])
+        self.assertEqual(len(moderation.get_page('подделка')[0]), 4)
+
+    def test_decide_updates_each_model_once(self):
+        selected = moderation.parse_items([f'news:{self.news.pk}', f'event:{self.event.pk}',
+                                           f'comment:{self.comment.pk}', 'nko:abc', 'user:1'])
+        self.assertEqual(set(selected), {'news', 'event', 'comment'})
+        self.assertEqual(moderation.decide('approve', selected), 3)
+
+        self.news.refresh_from_db()
+        self.assertEqual(self.news.status, 'published')
+        self.assertIsNotNone(self.news.published_at)
+        self.assertEqual(Event.objects.get(pk=self.event.pk).status, 'published')
+        self.assertTrue(Comment.objects.get(pk=self.comment.pk).is_approved)
+        # Уже решенное повторно не меняется
+        self.assertEqual(moderation.decide('reject', selected), 0)
+
+    def test_reject(self):
+        with self.assertNumQueries(4):
+            changed = moderation.decide('reject', {'nko': [self.nko.pk], 'comment': [self.comment.pk]})
+        self.assertEqual(changed, 2)
+        self.assertEqual(NKO.objects.get(pk=self.nko.pk).status, 'rejected')
+        comment = Comment.objects.get(pk=self.comment.pk)
+        self.assertEqual((comment.is_approved, comment.is_deleted), (False, True))
+
+    def test_counts_are_cached(self):
+        expected = {'news': 1, 'event': 1, 'nko': 1, 'comment': 1, 'total': 4}
+        self.assertEqual(moderation.get_counts(), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(moderation.get_counts(), expected)
+
+        create_event(status='pending')
+        self.assertEqual(moderation.get_counts()['event'], 2)
+        moderation.decide('approve', {'nko': [self.nko.pk]})
+        self.assertEqual(moderation.get_counts()['total'], 4)
+
+    def test_view(self):
+        url = reverse('content:moderation')
+        self.client.force_login(create_user())
+        self.assertRedirects(self.client.get(url), reverse('home'), fetch_redirect_response=False)
+
+        self.client.force_login(self.moderator)
+        response = self.client.get(url)
+        self.assertContains(response, 'Модерация (4)')
+        self.assertContains(response, f'value="event:{self.event.pk}"')
+
+        response = self.client.post(url + '?kind=event', {'action': 'reject', 'items': [f'event:{self.event.pk}']})
+        self.assertRedirects(response, url + '?kind=event', fetch_redirect_response=False)
+        self.assertEqual(Event.objects.get(pk=self.event.pk).status, 'draft')
+        self.assertContains(self.client.get(url + '?kind=event'), 'Очередь пуста')
+
+    def test_async_pages_show_counts_with_cold_cache(self):
+        news = News.objects.filter(status='published').get()
+        pages = [
+            reverse('content:news_list'),
+            reverse('content:news_detail', args=[news.slug]),
+            reverse('content:event_list'),
+            reverse('content:event_detail', args=[create_event().pk]),
+            reverse('content:knowledge_base_list'),
+            reverse('content:knowledge_base_detail', args=[create_material().pk]),
+            reverse('content:calendar'),
+            reverse('organizations:nko_list'),
+        ]
+        self.client.force_login(self.moderator)
+        for url in pages:
+            with self.subTest(url=url):
+                # Счетчики читаются из БД до рендеринга, а не шаблоном внутри асинхронной страницы
+                cache.clear()
+                self.assertContains(self.client.get(url), 'Модерация (4)')
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.news = create_news()
+        self.url = reverse('content:news_detail', args=[self.news.slug])
+
+    def test_unchanged_news_is_not_rendered(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        # Запрос версии, счетчик и запись просмотра
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(News.objects.get(pk=self.news.pk).view_count, 2)
+        self.assertEqual(ContentView.objects.filter(object_id=self.news.pk).count(), 2)
+
+    def test_comments_change_version(self):
+        etag = self.client.get(self.url)['ETag']
+        comment = create_comments(self.news, [create_user()])[0]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        comment.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_event_participants_change_version(self):
+        event = create_event()
+        url = reverse('content:event_detail', args=[event.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        EventParticipation.objects.create(user=create_user(), event=event)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_author_names_change_version(self):
+        author = create_user()
+        create_comments(self.news, [author])
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        author.first_name = 'Новое имя'
+        author.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новое имя')
+
+    def test_participant_names_change_version(self):
+        event = create_event()
+        user = create_user()
+        EventParticipation.objects.create(user=user, event=event)
+        url = reverse('content:event_detail', args=[event.pk])
+        etag = self.client.get(url)['ETag']
+        user.last_name = 'Новая фамилия'
+        user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новая фамилия')
+
+    def test_related_titles_change_version(self):
+        text = RelatedContentTest.ECOLOGY
+        news = create_news(title='Субботник в парке', content=text)
+        material = create_material(title='Как провести субботник', content=text)
+        url = reverse('content:news_detail', args=[news.slug])
+        etag = self.client.get(url)['ETag']
+        material.title = 'Памятка к субботнику'
+        material.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Памятка к субботнику')
+
+    def test_view_count_is_not_cached(self):
+        # Счетчик меняется при каждом просмотре и в версию не входит
+        self.assertNotContains(self.client.get(self.url), 'просмотров')
+        self.client.force_login(create_user())
+        self.assertContains(self.client.get(self.url), 'просмотров')
+
+    def test_authenticated_pages_are_always_rendered(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(create_user())
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertIn('Cookie', response['Vary'])
+
+
+class ContentQueryBudgetTest(QueryBudgetMixin, TestCase):
+    def test_home(self):
+        self.assertQueryBudget(0, lambda size: reverse('home'))
+
+    def test_news_list(self):
+        def populate(size):
+            author = create_user()
+            for _ in range(size):
+                create_news(author=author)
+            return reverse('content:news_list')
+
+        self.assertQueryBudget(2, populate)
+
+    def test_news_detail(self):
+        def populate(size):
+            news = create_news()
+            create_comments(news, create_users(size), with_replies=True)
+            return reverse('content:news_detail', args=[news.slug])
+
+        # Включая запрос версии страницы для условного GET
+        self.assertQueryBudget(7, populate)
+
+    def test_event_list(self):
+        def populate(size):
+            author = create_user()
+            for _ in range(size):
+                create_event(created_by=author)
+            return reverse('content:event_list')
+
+        self.assertQueryBudget(1, populate)
+
+    def test_event_detail(self):
+        def populate(size):
+            event = create_event()
+            EventParticipation.objects.bulk_create(
+                EventParticipation(user=user, event=event) for user in create_users(size)
+            )
+            self.client.force_login(create_user())
+            return reverse('content:event_detail', args=[event.pk])
+
+        self.assertQueryBudget(5, populate)
+
+    def test_event_register(self):
+        def populate(size):
+            event = create_event()
+            EventParticipation.objects.bulk_create(
+                EventParticipation(user=user, event=event) for user in create_users(size)
+            )
+            self.client.force_login(create_user())
+            return reverse('content:event_register', args=[event.pk])
+
+        self.assertQueryBudget(7, populate, status=302)
+
+    def test_knowledge_base_list(self):
+        def populate(size):
+            author = create_user()
+            for _ in range(size):
+                create_material(author=author)
+            return reverse('content:knowledge_base_list')
+
+        self.assertQueryBudget(1, populate)
+
+    def test_knowledge_base_detail(self):
+        def populate(size):
+            material = create_material()
+            create_comments(material, create_users(size))
+            return reverse('content:knowledge_base_detail', args=[material.pk])
+
+        self.assertQueryBudget(5, populate)
+
+    def test_calendar(self):
+        def populate(size):
+            author = create_user()
+            start = timezone.now().replace(day=1, hour=12)
+            for i in range(size):
+                create_event(created_by=author, start_date=start + timedelta(hours=i))
+            return reverse('content:calendar')
+
+        self.assertQueryBudget(1, populate)
+
+    def test_like_content(self):
+        def populate(size):
+            news = create_news()
+            content_type = ContentType.objects.get_for_model(News)
+            ContentLike.objects.bulk_create(
+                ContentLike(content_type=content_type, object_id=news.pk, user=user)
+                for user in create_users(size)
+            )
+            self.client.force_login(create_user())
+            return reverse('content:like_content', args=['news', news.pk])
+
+        self.assertQueryBudget(7, populate, status=302)
+
+
+class AsyncViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.news = create_news(author=cls.user)
+        create_comments(cls.news, create_users(3), with_replies=True)
+        cls.event = create_event(created_by=cls.user)
+        EventParticipation.objects.create(user=cls.user, event=cls.event)
+
+    async def test_news_detail_records_view(self):
+        response = await self.async_client.get(reverse('content:news_detail', args=[self.news.slug]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['comments']), 3)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        await self.news.arefresh_from_db()
+        self.assertEqual(self.news.view_count, 1)
+
+    async def test_event_detail_shows_participation(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('content:event_detail', args=[self.event.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.context['user_participation'])
+
+    async def test_news_list_out_of_range_page(self):
+        response = await self.async_client.get(reverse('content:news_list'), {'page': 99})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['news'].number, 1)
+        self.assertEqual(list(response.context['news']), [self.news])
+
+
+class QueryInstrumentationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = create_users(3)
+
+    def get(self, view):
+        """(запрос, ответ) страницы, которая вызывает view() под QueryInstrumentationMiddleware"""
+        def get_response(request):
+            view()
+            return HttpResponse()
+
+        request = RequestFactory().get('/page/')
+        return request, QueryInstrumentationMiddleware(get_response)(request)
+
+    def select_growing_in_lists(self):
+        # Один и тот же запрос со списками IN разной длины
+        for size in range(1, len(self.users) + 1):
+            list(User.objects.filter(pk__in=[user.pk for user in self.users[:size]]))
+
+    def test_in_lists_are_grouped(self):
+        def execute(sql, params, many, context):
+            return None
+
+        stats = QueryStats()
+        for size in (1, 2, 3):
+            stats(execute, f"SELECT * FROM t WHERE id IN ({', '.join(['%s'] * size)})", [0] * size, False, {})
+        stats(execute, 'SELECT 1', (), False, {})
+
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(stats.repeated(2), [('SELECT * FROM t WHERE id IN (...)', 3)])
+        self.assertEqual(stats.repeated(3), [])
+
+    @override_settings(SQL_INSTRUMENTATION={'NPLUSONE_THRESHOLD': 2})
+    def test_repeated_queries_are_logged(self):
+        with self.assertLogs('dobro.sql', 'WARNING') as logs:
+            request, _ = self.get(self.select_growing_in_lists)
+        self.assertEqual(request.query_stats.count, 3)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('Possible N+1 on GET /page/: query executed 3 times', logs.output[0])
+        self.assertIn('IN (...)', logs.output[0])
+
+    def test_query_budget(self):
+        with override_settings(SQL_INSTRUMENTATION={'QUERY_BUDGET': 2}), self.assertLogs('dobro.sql') as logs:
+            self.get(self.select_growing_in_lists)
+        self.assertIn('GET /page/: 3 SQL queries', logs.output[0])
+
+        with override_settings(SQL_INSTRUMENTATION={'QUERY_BUDGET': 3}), self.assertNoLogs('dobro.sql'):
+            self.get(self.select_growing_in_lists)
+
+    def test_sampling(self):
+        config = {'QUERY_BUDGET': 0, 'SAMPLE_RATE': 0.5, 'SERVER_TIMING': True}
+        with override_settings(SQL_INSTRUMENTATION=config), mock.patch('dobro.middleware.random.random') as rand:
+            rand.return_value = 0.7
+            with self.assertNoLogs('dobro.sql'):
+                request, response = self.get(self.select_growing_in_lists)
+            self.assertFalse(hasattr(request, 'query_stats'))
+            self.assertNotIn('Server-Timing', response)
+
+            rand.return_value = 0.3
+            with self.assertLogs('dobro.sql'):
+                request, response = self.get(self.select_growing_in_lists)
+            self.assertEqual(request.query_stats.count, 3)
+            self.assertIn('desc="3 queries"', response['Server-Timing'])
+
+    @override_settings(SQL_INSTRUMENTATION={}, DEBUG=False)
+    def test_server_timing_follows_debug_by_default(self):
+        _, response = self.get(lambda: None)
+        self.assertNotIn('Server-Timing', response)
+        with override_settings(DEBUG=True):
+            _, response = self.get(lambda: None)
+        self.assertIn('db;dur=', response['Server-Timing'])
@@ -10,11 +10,21 @@ urlpatterns = [
     # Новости
     path('news/', views.news_list, name='news_list'),
     path('news/<slug:slug>/', views.news_detail, name='news_detail'),
+    path('news/feed/<str:format>/', views.news_feed, name='news_feed'),
+    path('news/feed/<str:format>/city/<str:city>/', views.news_feed, name='news_feed_city'),
+    path('news/feed/<str:format>/nko/<int:pk>/', views.news_feed, name='news_feed_nko'),
 
     # Мероприятия
     path('events/', views.event_list, name='event_list'),
     path('events/<int:pk>/', views.event_detail, name='event_detail'),
     path('events/<int:pk>/register/', views.event_register, name='event_register'),
+    path('events/<int:pk>/participants.<str:format>', views.event_participants_export,
+         name='event_participants_export'),
+
+    # Календарные подписки
+    path('events/ical/city/<str:city>.ics', views.events_ical, name='events_ical_city'),
+    path('events/ical/nko/<int:pk>.ics', views.events_ical, name='events_ical_nko'),
+    path('events/ical/my/<str:token>.ics', views.events_ical, name='events_ical_my'),
 
     # База знаний
     path('knowledge/', views.knowledge_base_list, name='knowledge_base_list'),
@@ -23,6 +33,10 @@ urlpatterns = [
     # Календарь
     path('calendar/', views.calendar_view, name='calendar'),
 
+    # Рейтинг волонтеров
+    path('leaderboard/', views.leaderboard, name='leaderboard'),
+    path('moderation/', views.moderation_queue, name='moderation'),
+
     # Лайки
     path('like/<str:content_type>/<int:object_id>/', views.like_content, name='like_content'),
 ]
\ No newline at end of file
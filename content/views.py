@@ -1,23 +1,38 @@
-from django.shortcuts import render, get_object_or_404, redirect
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.contenttypes.models import ContentType
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Count, Q
+from django.db.models import Count, Q, Prefetch
 from django.core.paginator import Paginator
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import condition
 from datetime import datetime, timedelta
 
-from .models import News, Event, KnowledgeBase, Comment, EventParticipation, ContentView, ContentLike
+from .models import (News, Event, KnowledgeBase, Comment, EventParticipation, ContentView, ContentLike,
+                     LeaderboardEntry, RelatedContent)
 from .forms import NewsForm, EventForm, KnowledgeBaseForm, CommentForm, EventParticipationForm
-from .services import ContentService
+from .services import ContentService, LeaderboardService
+from . import exports, feeds, ical, moderation, related
+from cities.index import acanonical_name, canonical_name
+from organizations.models import NKO
+from dobro import conditional
+from dobro.async_utils import alist, apaginate, aresolve_user, streaming_content
 
 
 def home(request):
     """Главная страница"""
     return render(request, 'content/home.html')
 
-
-def news_list(request):
+async def news_list(request):
     """Список новостей"""
+    await aresolve_user(request)
+    await moderation.aload_counts(request)
     news_list = News.objects.filter(status='published', published_at__lte=timezone.now())
 
     # Фильтрация
@@ -25,6 +40,7 @@ def news_list(request):
     search = request.GET.get('search')
 
     if city:
+        city = await acanonical_name(city)
         news_list = news_list.filter(city=city)
     if search:
         news_list = news_list.filter(
@@ -34,9 +50,7 @@ def news_list(request):
         )
 
     # Пагинация
-    paginator = Paginator(news_list, 10)
-    page_number = request.GET.get('page')
-    news = paginator.get_page(page_number)
+    news = await apaginate(news_list, 10, request.GET.get('page'))
 
     context = {
         'news': news,
@@ -46,15 +60,50 @@ def news_list(request):
     return render(request, 'content/news_list.html', context)
 
 
-def news_detail(request, slug):
+def content_state(model, **lookup):
+    """Версия страницы материала: сам материал, его комментарии с именами авторов и похожие материалы"""
+    content_type = ContentType.objects.get_for_model(model)
+    comments = Comment.objects.filter(content_type=content_type)
+    return conditional.get_state(
+        model.objects.filter(**lookup),
+        comments=conditional.related(comments, version='updated_at'),
+        authors=conditional.related(comments, version='author__updated_at'),
+        # Строки похожих пересоздаются при смене заголовка или ссылки материала, поэтому версия - pk
+        related=conditional.related(RelatedContent.objects.filter(content_type=content_type)),
+    )
+
+
+def record_cached_view(request, content_object):
+    ContentService.record_cached_view(content_object, request)
+
+
+@conditional.condition(
+    lambda request, slug: content_state(News, slug=slug, status__in=News.VISIBLE_STATUSES),
+    not_modified=record_cached_view,
+)
+async def news_detail(request, slug):
     """Детальная страница новости"""
-    news = get_object_or_404(News, slug=slug, status='published')
+    await aresolve_user(request)
+    await moderation.aload_counts(request)
+
+    # Комментарии выбираем по slug через подзапрос, чтобы не ждать загрузки новости
+    comments = Comment.objects.filter(
+        content_type__app_label=News._meta.app_label,
+        content_type__model=News._meta.model_name,
+        object_id__in=News.objects.filter(slug=slug, status__in=News.VISIBLE_STATUSES).values('pk'),
+        is_approved=True,
+        parent__isnull=True,
+    ).select_related('author').prefetch_related(
+        Prefetch('replies', queryset=Comment.objects.filter(is_approved=True).select_related('author'))
+    )
+    news, comments, related_content = await asyncio.gather(
+        aget_object_or_404(News, slug=slug, status__in=News.VISIBLE_STATUSES),
+        alist(comments),
+        alist(related.get_related(News, slug=slug)),
+    )
 
     # Увеличиваем счетчик просмотров
-    ContentService.record_view(news, request)
-
-    # Комментарии
-    comments = news.comments.filter(is_approved=True, parent__isnull=True)
+    await ContentService.arecord_view(news, request)
 
     # Форма комментария
     if request.method == 'POST' and request.user.is_authenticated:
@@ -62,8 +111,9 @@ def news_detail(request, slug):
         if comment_form.is_valid():
             comment = comment_form.save(commit=False)
             comment.author = request.user
-            comment.content_object = news
-            comment.save()
+            comment.content_type = await sync_to_async(ContentType.objects.get_for_model)(news)
+            comment.object_id = news.pk
+            await comment.asave()
             messages.success(request, 'Комментарий добавлен')
             return redirect('content:news_detail', slug=slug)
     else:
@@ -73,20 +123,45 @@ def news_detail(request, slug):
         'news': news,
         'comments': comments,
         'comment_form': comment_form,
+        'related_content': related_content,
     }
     return render(request, 'content/news_detail.html', context)
 
 
-def event_list(request):
+def news_feed(request, format, city=None, pk=None):
+    """RSS/Atom лента новостей (всех, города или НКО) из кэша с поддержкой 304"""
+    if format not in feeds.FEEDS:
+        raise Http404('Неизвестный формат ленты')
+    if city:
+        city = canonical_name(city)
+    content, content_type, etag, last_modified = feeds.get_cached(request, format, city=city, nko_id=pk)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(content, content_type=content_type)
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+async def event_list(request):
     """Список мероприятий"""
-    events = Event.objects.filter(status='published')
+    await aresolve_user(request)
+    await moderation.aload_counts(request)
 
     # Фильтрация
     city = request.GET.get('city')
     event_type = request.GET.get('event_type')
     timeframe = request.GET.get('timeframe', 'upcoming')
 
+    # Прошедшие мероприятия периодически переводятся в завершенные (transition_content)
+    if timeframe == 'past':
+        events = Event.objects.filter(status__in=Event.VISIBLE_STATUSES)
+    else:
+        events = Event.objects.filter(status='published')
+
     if city:
+        city = await acanonical_name(city)
         events = events.filter(city=city)
     if event_type:
         events = events.filter(event_type=event_type)
@@ -103,7 +178,7 @@ def event_list(request):
     events = events.order_by('start_date')
 
     context = {
-        'events': events,
+        'events': await alist(events),
         'selected_city': city,
         'selected_event_type': event_type,
         'selected_timeframe': timeframe,
@@ -112,37 +187,47 @@ def event_list(request):
     return render(request, 'content/event_list.html', context)
 
 
-def event_detail(request, pk):
+@conditional.condition(
+    lambda request, pk: conditional.get_state(
+        Event.objects.filter(pk=pk, status__in=Event.VISIBLE_STATUSES),
+        participants=conditional.related(EventParticipation.objects.all(), 'event_id', version='status_changed_at'),
+        participant_names=conditional.related(EventParticipation.objects.all(), 'event_id', version='user__updated_at'),
+    ),
+    not_modified=record_cached_view,
+)
+async def event_detail(request, pk):
     """Детальная страница мероприятия"""
-    event = get_object_or_404(Event, pk=pk, status='published')
+    user = await aresolve_user(request)
+    await moderation.aload_counts(request)
 
-    # Увеличиваем счетчик просмотров
-    ContentService.record_view(event, request)
+    # Участники
+    participants = EventParticipation.objects.filter(
+        event_id=pk, status__in=['registered', 'confirmed', 'attended']
+    ).select_related('user')
 
-    # Проверяем участие пользователя
-    user_participation = None
-    if request.user.is_authenticated:
-        try:
-            user_participation = EventParticipation.objects.get(user=request.user, event=event)
-        except EventParticipation.DoesNotExist:
-            pass
+    # Мероприятие, участие пользователя и список участников не зависят друг от друга
+    queries = [aget_object_or_404(Event, pk=pk, status__in=Event.VISIBLE_STATUSES), alist(participants)]
+    if user.is_authenticated:
+        queries.append(EventParticipation.objects.filter(user=user, event_id=pk).afirst())
+    event, participants, *user_participation = await asyncio.gather(*queries)
+    user_participation = user_participation[0] if user_participation else None
 
-    # Участники
-    participants = event.eventparticipation_set.filter(status__in=['registered', 'confirmed', 'attended'])
+    # Увеличиваем счетчик просмотров
+    await ContentService.arecord_view(event, request)
 
     # Форма регистрации
-    if request.method == 'POST' and request.user.is_authenticated:
+    if request.method == 'POST' and user.is_authenticated:
         participation_form = EventParticipationForm(request.POST)
         if participation_form.is_valid():
             if not user_participation:
                 participation = participation_form.save(commit=False)
-                participation.user = request.user
+                participation.user = user
                 participation.event = event
-                participation.save()
+                await participation.asave()
 
                 # Увеличиваем счетчик участников
                 event.current_participants += 1
-                event.save()
+                await event.asave(update_fields=['current_participants'])
 
                 messages.success(request, 'Вы успешно зарегистрировались на мероприятие!')
                 return redirect('content:event_detail', pk=pk)
@@ -160,6 +245,61 @@ def event_detail(request, pk):
     return render(request, 'content/event_detail.html', context)
 
 
+def ical_events(request, city=None, pk=None, token=None):
+    """Мероприятия календарной ленты и ее версия (считаются один раз за запрос)"""
+    if not hasattr(request, 'ical_events'):
+        user_id = None
+        if token is not None:
+            user_id = ical.user_from_token(token)
+            if user_id is None:
+                raise Http404('Неверная ссылка на календарь')
+        if city:
+            city = canonical_name(city)
+        request.ical_events = ical.get_events(city=city, nko_id=pk, user_id=user_id)
+        request.ical_state = ical.get_state(request.ical_events)
+    return request.ical_events
+
+
+def ical_etag(request, **kwargs):
+    ical_events(request, **kwargs)
+    return request.ical_state[0]
+
+
+def ical_last_modified(request, **kwargs):
+    ical_events(request, **kwargs)
+    return request.ical_state[1]
+
+
+# Неизменившаяся лента отвечает 304 по одному агрегирующему запросу, не формируя тело
+@condition(etag_func=ical_etag, last_modified_func=ical_last_modified)
+def events_ical(request, city=None, pk=None, token=None):
+    """Календарная подписка (.ics) на мероприятия города, НКО или свои регистрации"""
+    events = ical_events(request, city=city, pk=pk, token=token)
+    if city:
+        name = f'Мероприятия: {city}'
+    elif pk:
+        name = get_object_or_404(NKO.objects.only('name'), pk=pk, is_active=True).name
+    else:
+        name = 'Мои мероприятия'
+
+    response = StreamingHttpResponse(streaming_content(request, ical.render(events, name, request)),
+                                     content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'inline; filename="events.ics"'
+    return response
+
+
+@login_required
+def event_participants_export(request, pk, format):
+    """Потоковая выгрузка участников мероприятия в CSV или XLSX для организаторов"""
+    if format not in exports.FORMATS:
+        raise Http404('Неизвестный формат выгрузки')
+    event = get_object_or_404(Event.objects.only('pk', 'created_by_id', 'nko_id'), pk=pk)
+    if not exports.can_export(request.user, event):
+        messages.error(request, 'Выгрузка участников доступна организаторам мероприятия')
+        return redirect('content:event_detail', pk=pk)
+    return exports.export_response(request, event, format)
+
+
 @login_required
 def event_register(request, pk):
     """Регистрация на мероприятие"""
@@ -188,14 +328,15 @@ def event_register(request, pk):
 
     # Увеличиваем счетчик участников
     event.current_participants += 1
-    event.save()
+    event.save(update_fields=['current_participants'])
 
     messages.success(request, 'Вы успешно зарегистрировались на мероприятие!')
     return redirect('content:event_detail', pk=pk)
 
-
-def knowledge_base_list(request):
+async def knowledge_base_list(request):
     """Список материалов базы знаний"""
+    await aresolve_user(request)
+    await moderation.aload_counts(request)
     materials = KnowledgeBase.objects.filter(is_public=True)
 
     # Фильтрация
@@ -217,7 +358,7 @@ def knowledge_base_list(request):
     materials = materials.order_by('-created_at')
 
     context = {
-        'materials': materials,
+        'materials': await alist(materials),
         'categories': KnowledgeBase.CATEGORY_CHOICES,
         'difficulty_levels': KnowledgeBase._meta.get_field('difficulty_level').choices,
         'selected_category': category,
@@ -227,26 +368,39 @@ def knowledge_base_list(request):
     return render(request, 'content/knowledge_base_list.html', context)
 
 
-def knowledge_base_detail(request, pk):
+@conditional.condition(
+    # Скачивание файла увеличивает счетчик, поэтому такой запрос выполняется всегда
+    lambda request, pk: None if 'download' in request.GET else content_state(KnowledgeBase, pk=pk, is_public=True),
+    not_modified=record_cached_view,
+)
+async def knowledge_base_detail(request, pk):
     """Детальная страница материала базы знаний"""
-    material = get_object_or_404(KnowledgeBase, pk=pk, is_public=True)
+    await aresolve_user(request)
+    await moderation.aload_counts(request)
+    material, related_content = await asyncio.gather(
+        aget_object_or_404(KnowledgeBase, pk=pk, is_public=True),
+        alist(related.get_related(KnowledgeBase, pk=pk)),
+    )
 
     # Увеличиваем счетчик просмотров
-    ContentService.record_view(material, request)
+    await ContentService.arecord_view(material, request)
 
     # Увеличиваем счетчик скачиваний если запрошен файл
     if 'download' in request.GET and material.attached_file:
         material.download_count += 1
-        material.save()
+        await material.asave(update_fields=['download_count'])
 
     context = {
         'material': material,
+        'related_content': related_content,
     }
     return render(request, 'content/knowledge_base_detail.html', context)
 
 
-def calendar_view(request):
+async def calendar_view(request):
     """Страница календаря мероприятий"""
+    await aresolve_user(request)
+    await moderation.aload_counts(request)
     year = request.GET.get('year')
     month = request.GET.get('month')
 
@@ -262,11 +416,11 @@ def calendar_view(request):
     start_of_month = selected_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     end_of_month = (start_of_month + timedelta(days=32)).replace(day=1) - timedelta(days=1)
 
-    events = Event.objects.filter(
-        status='published',
+    events = await alist(Event.objects.filter(
+        status__in=Event.VISIBLE_STATUSES,
         start_date__gte=start_of_month,
         start_date__lte=end_of_month
-    ).order_by('start_date')
+    ).order_by('start_date'))
 
     # Формируем календарь
     calendar_data = ContentService.get_calendar_data(selected_date, events)
@@ -305,4 +459,64 @@ def like_content(request, content_type, object_id):
         messages.error(request, 'Ошибка при добавлении лайка')
 
     # Возвращаем на предыдущую страницу
-    return redirect(request.META.get('HTTP_REFERER', 'content:home'))
\ No newline at end of file
+    return redirect(request.META.get('HTTP_REFERER', 'content:home'))
+
+
+@login_required
+def leaderboard(request):
+    """Рейтинг волонтеров по часам для координаторов и модераторов"""
+    if not (request.user.is_corporate_coordinator() or request.user.is_moderator_or_admin()):
+        messages.error(request, 'Рейтинг доступен координаторам и модераторам')
+        return redirect('home')
+
+    city = request.GET.get('city', LeaderboardEntry.ALL_CITIES)
+    if city:
+        city = canonical_name(city)
+    period = request.GET.get('period', 'month')
+    if period not in dict(LeaderboardEntry.PERIOD_CHOICES):
+        period = 'month'
+
+    entries, next_cursor = LeaderboardService.get_page(city, period, cursor=request.GET.get('cursor'))
+    cities = (LeaderboardEntry.objects.exclude(city=LeaderboardEntry.ALL_CITIES)
+              .values_list('city', flat=True).distinct().order_by('city'))
+
+    context = {
+        'entries': entries,
+        'next_cursor': next_cursor,
+        'cities': cities,
+        'periods': LeaderboardEntry.PERIOD_CHOICES,
+        'selected_city': city,
+        'selected_period': period,
+    }
+    return render(request, 'content/leaderboard.html', context)
+
+
+@login_required
+def moderation_queue(request):
+    """Единая очередь модерации новостей, мероприятий, НКО и комментариев"""
+    if not moderation.can_moderate(request.user):
+        messages.error(request, 'Очередь модерации доступна модераторам')
+        return redirect('home')
+
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        selected = moderation.parse_items(request.POST.getlist('items'))
+        if action in ('approve', 'reject') and selected:
+            changed = moderation.decide(action, selected)
+            messages.success(request, f"{'Одобрено' if action == 'approve' else 'Отклонено'}: {changed}")
+        return redirect(request.get_full_path())
+
+    kind = request.GET.get('kind')
+    if kind not in moderation.QUEUES:
+        kind = None
+    items, next_cursor = moderation.get_page(request.GET.get('cursor'), kinds=[kind] if kind else None)
+    counts = moderation.get_counts()
+
+    context = {
+        'items': items,
+        'next_cursor': next_cursor,
+        'counts': counts,
+        'queues': [(name, queue.title, counts[name]) for name, queue in moderation.QUEUES.items()],
+        'selected_kind': kind,
+    }
+    return render(request, 'content/moderation.html', context)
@@ -0,0 +1,296 @@
+"""
+JSON API только для чтения: новости, мероприятия, база знаний и НКО.
+
+Строки читаются через values() без создания моделей. Тяжелые текстовые поля
+отдаются только по запросу (?fields=title,content). Списки листаются курсором
+по ключу сортировки: ?cursor= содержит подписанную пару (значение ключа, pk)
+последней строки, поэтому следующая страница читается по индексу без OFFSET.
+Каждый ответ несет ETag тела, и клиент с совпадающим If-None-Match получает 304.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.http import JsonResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET
+
+from cities.index import acanonical_name
+from content.models import Event, KnowledgeBase, News
+from organizations.models import NKO
+from .async_utils import alist
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+CURSOR_SALT = 'dobro.api'
+
+
+class ApiError(Exception):
+    """Ошибка параметров запроса (ответ 400)"""
+
+
+class Resource:
+    """Ресурс API: набор строк, доступные поля, фильтры и ключ сортировки"""
+    model = None
+    # Поле поиска в адресе объекта
+    lookup = 'pk'
+    # Поля списка по умолчанию
+    fields = ()
+    # Тяжелые поля: в списке только по ?fields=, в объекте - всегда
+    extra_fields = ()
+    # Файловые поля, которые отдаются полной ссылкой
+    file_fields = ()
+    # Ключ сортировки (поле даты) и направление; pk добавляется для однозначности
+    ordering = '-created_at'
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def get_object_queryset(self):
+        return self.get_queryset()
+
+    def filter(self, queryset, params):
+        return queryset
+
+    def get_ordering(self, params):
+        return self.ordering
+
+
+class NewsResource(Resource):
+    model = News
+    lookup = 'slug'
+    fields = ('id', 'title', 'slug', 'excerpt', 'city', 'nko', 'is_featured', 'view_count', 'published_at',
+              'updated_at')
+    extra_fields = ('content', 'cover_image')
+    file_fields = ('cover_image',)
+    ordering = '-published_at'
+
+    def get_queryset(self):
+        # Диапазон частичного индекса news_live_idx
+        return News.objects.filter(status='published', published_at__lte=timezone.now())
+
+    def get_object_queryset(self):
+        return News.objects.filter(status__in=News.VISIBLE_STATUSES)
+
+    def filter(self, queryset, params):
+        if params.get('city'):
+            queryset = queryset.filter(city=params['city'])
+        if params.get('nko'):
+            queryset = queryset.filter(nko_id=parse_int(params['nko'], 'nko'))
+        return queryset
+
+
+class EventResource(Resource):
+    model = Event
+    fields = ('id', 'title', 'event_type', 'status', 'start_date', 'end_date', 'registration_deadline', 'city',
+              'address', 'online', 'online_link', 'nko', 'is_featured', 'max_participants', 'current_participants',
+              'updated_at')
+    extra_fields = ('description', 'requirements', 'what_to_bring', 'contact_info')
+    ordering = 'start_date'
+
+    def get_object_queryset(self):
+        return Event.objects.filter(status__in=Event.VISIBLE_STATUSES)
+
+    def filter(self, queryset, params):
+        # Те же правила, что у списка мероприятий на сайте
+        timeframe = params.get('timeframe', 'upcoming')
+        now = timezone.now()
+        if timeframe == 'upcoming':
+            queryset = queryset.filter(status='published', start_date__gte=now)
+        elif timeframe == 'ongoing':
+            queryset = queryset.filter(status='published', start_date__lte=now, end_date__gte=now)
+        elif timeframe == 'past':
+            queryset = queryset.filter(status__in=Event.VISIBLE_STATUSES, end_date__lt=now)
+        else:
+            raise ApiError('timeframe: ожидается upcoming, ongoing или past')
+
+        if params.get('city'):
+            queryset = queryset.filter(city=params['city'])
+        if params.get('event_type'):
+            queryset = queryset.filter(event_type=params['event_type'])
+        if params.get('nko'):
+            queryset = queryset.filter(nko_id=parse_int(params['nko'], 'nko'))
+        return queryset
+
+    def get_ordering(self, params):
+        # Прошедшие мероприятия - сначала недавние
+        return '-start_date' if params.get('timeframe') == 'past' else self.ordering
+
+
+class KnowledgeBaseResource(Resource):
+    model = KnowledgeBase
+    fields = ('id', 'title', 'excerpt', 'category', 'difficulty_level', 'view_count', 'download_count',
+              'created_at', 'updated_at')
+    extra_fields = ('content', 'attached_file')
+    file_fields = ('attached_file',)
+
+    def get_queryset(self):
+        return KnowledgeBase.objects.filter(is_public=True)
+
+    def filter(self, queryset, params):
+        if params.get('category'):
+            queryset = queryset.filter(category=params['category'])
+        if params.get('difficulty'):
+            queryset = queryset.filter(difficulty_level=params['difficulty'])
+        return queryset
+
+
+class NKOResource(Resource):
+    model = NKO
+    fields = ('id', 'name', 'category', 'city', 'website', 'logo', 'member_count', 'created_at', 'updated_at')
+    extra_fields = ('description', 'mission', 'email', 'phone', 'address', 'social_links', 'cover_image')
+    file_fields = ('logo', 'cover_image')
+
+    def get_queryset(self):
+        return NKO.objects.filter(status='approved', is_active=True)
+
+    def filter(self, queryset, params):
+        if params.get('city'):
+            queryset = queryset.filter(city=params['city'])
+        if params.get('category'):
+            queryset = queryset.filter(category=params['category'])
+        return queryset
+
+
+RESOURCES = {
+    'news': NewsResource(),
+    'events': EventResource(),
+    'knowledge': KnowledgeBaseResource(),
+    'nko': NKOResource(),
+}
+
+
+def parse_int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ApiError(f'{name}: ожидается целое число')
+
+
+def get_fields(resource, params, detail=False):
+    """Запрошенные поля (?fields=) или поля по умолчанию; id возвращается всегда"""
+    allowed = resource.fields + resource.extra_fields
+    if not params.get('fields'):
+        return allowed if detail else resource.fields
+    fields = [name.strip() for name in params['fields'].split(',') if name.strip()]
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ApiError(f"Неизвестные поля: {', '.join(unknown)}. Доступны: {', '.join(allowed)}")
+    return tuple(dict.fromkeys(['id', *fields]))
+
+
+def encode_cursor(value, pk):
+    return signing.dumps([value.isoformat(), pk], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    """(значение ключа сортировки, pk) из курсора"""
+    try:
+        value, pk = signing.loads(cursor, salt=CURSOR_SALT)
+        value = parse_datetime(value)
+    except (signing.BadSignature, TypeError, ValueError):
+        value = None
+    if value is None or not isinstance(pk, int):
+        raise ApiError('cursor: неверный курсор')
+    return value, pk
+
+
+def seek(queryset, ordering, cursor):
+    """Строки после курсора в порядке (ordering, pk)"""
+    field = ordering.lstrip('-')
+    value, pk = decode_cursor(cursor)
+    op = 'lt' if ordering.startswith('-') else 'gt'
+    return queryset.filter(Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'pk__{op}': pk}))
+
+
+def serialize(rows, fields, resource, request):
+    """Строки values() в ответ: только запрошенные поля, файлы - полными ссылками"""
+    file_fields = [name for name in resource.file_fields if name in fields]
+    results = []
+    for row in rows:
+        item = {name: row[name] for name in fields}
+        for name in file_fields:
+            item[name] = request.build_absolute_uri(settings.MEDIA_URL + item[name]) if item[name] else None
+        results.append(item)
+    return results
+
+
+def respond(request, data):
+    """JSON-ответ с ETag тела; 304, если у клиента та же версия"""
+    response = JsonResponse(data, json_dumps_params={'ensure_ascii': False})
+    response['ETag'] = f'"{hashlib.md5(response.content).hexdigest()}"'
+    return get_conditional_response(request, etag=response['ETag'], response=response) or response
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+@require_GET
+async def resource_list(request, name):
+    """Страница списка: ?fields=, фильтры ресурса, ?limit= и ?cursor="""
+    resource = RESOURCES[name]
+    params = request.GET
+    if params.get('city'):
+        # Фильтры сравнивают город с названием из справочника
+        params = params.copy()
+        params['city'] = await acanonical_name(params['city'])
+    try:
+        fields = get_fields(resource, params)
+        limit = parse_int(params.get('limit', PAGE_SIZE), 'limit')
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ApiError(f'limit: от 1 до {MAX_PAGE_SIZE}')
+        ordering = resource.get_ordering(params)
+        queryset = resource.filter(resource.get_queryset(), params)
+        if params.get('cursor'):
+            queryset = seek(queryset, ordering, params['cursor'])
+    except ApiError as e:
+        return error(str(e))
+
+    key = ordering.lstrip('-')
+    pk_ordering = '-pk' if ordering.startswith('-') else 'pk'
+    # Одна лишняя строка показывает, есть ли следующая страница
+    rows = await alist(queryset.order_by(ordering, pk_ordering)
+                       .values(*dict.fromkeys([*fields, key, 'pk']))[:limit + 1])
+
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        query = params.copy()
+        query['cursor'] = encode_cursor(rows[-1][key], rows[-1]['pk'])
+        next_url = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+    return respond(request, {'results': serialize(rows, fields, resource, request), 'next': next_url})
+
+
+@require_GET
+async def resource_detail(request, name, lookup):
+    """Один объект; по умолчанию со всеми полями, ?fields= сужает набор"""
+    resource = RESOURCES[name]
+    try:
+        fields = get_fields(resource, request.GET, detail=True)
+    except ApiError as e:
+        return error(str(e))
+
+    row = await resource.get_object_queryset().filter(**{resource.lookup: lookup}).values(*fields).afirst()
+    if row is None:
+        return error('Объект не найден', status=404)
+    return respond(request, serialize([row], fields, resource, request)[0])
+
+
+app_name = 'api'
+
+urlpatterns = [
+    path('news/', resource_list, {'name': 'news'}, name='news_list'),
+    path('news/<slug:lookup>/', resource_detail, {'name': 'news'}, name='news_detail'),
+    path('events/', resource_list, {'name': 'events'}, name='event_list'),
+    path('events/<int:lookup>/', resource_detail, {'name': 'events'}, name='event_detail'),
+    path('knowledge/', resource_list, {'name': 'knowledge'}, name='knowledge_list'),
+    path('knowledge/<int:lookup>/', resource_detail, {'name': 'knowledge'}, name='knowledge_detail'),
+    path('nko/', resource_list, {'name': 'nko'}, name='nko_list'),
+    path('nko/<int:lookup>/', resource_detail, {'name': 'nko'}, name='nko_detail'),
+]
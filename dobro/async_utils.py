@@ -0,0 +1,59 @@
+"""
+Помощники для асинхронных представлений.
+
+Шаблоны рендерятся синхронно, поэтому все, что шаблон читает из БД
+(страница пагинатора, пользователь), нужно получить заранее через async ORM.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+
+
+async def alist(queryset):
+    """Выполнить QuerySet асинхронно и вернуть список"""
+    return [obj async for obj in queryset]
+
+
+async def aresolve_user(request):
+    """Загрузить пользователя асинхронно, чтобы шаблон не обращался к БД"""
+    request.user = await request.auser()
+    return request.user
+
+
+async def apaginate(queryset, per_page, page_number):
+    """Асинхронный аналог Paginator.get_page с уже загруженными объектами страницы"""
+    paginator = Paginator(queryset, per_page)
+    paginator.count = await queryset.acount()
+    try:
+        number = paginator.validate_number(page_number)
+    except PageNotAnInteger:
+        number = 1
+    except EmptyPage:
+        number = paginator.num_pages
+
+    bottom = (number - 1) * per_page
+    objects = await alist(queryset[bottom:bottom + per_page])
+    return Page(objects, number, paginator)
+
+
+async def aiterate(iterable):
+    """
+    Асинхронный итератор по синхронному: каждый элемент получается в потоке
+    через sync_to_async, так что генератор может читать БД.
+    """
+    iterator = iter(iterable)
+    done = object()
+    try:
+        while (item := await sync_to_async(next)(iterator, done)) is not done:
+            yield item
+    finally:
+        if hasattr(iterator, 'close'):
+            await sync_to_async(iterator.close)()
+
+
+def streaming_content(request, iterable):
+    """
+    Содержимое StreamingHttpResponse. Синхронный итератор Django под ASGI сначала
+    собирает в список целиком, поэтому там куски отдаются через aiterate.
+    """
+    return aiterate(iterable) if isinstance(request, ASGIRequest) else iterable
@@ -0,0 +1,382 @@
+"""
+Бенчмарки сервисов и страниц на синтетических данных (см. seed_data).
+
+Запуск: python manage.py benchmark --scales 1 5 10
+"""
+import asyncio
+import io
+import math
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from importlib import import_module
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection, reset_queries, transaction
+from django.db.models import Count
+from django.db.models.query import QuerySet
+from django.test import AsyncClient, Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.services import VerificationService
+from cities import index as city_index
+from content.models import News, Event, KnowledgeBase, EventParticipation
+from content import exports, moderation, recommendations, related, reminders
+from content.services import (ContentService, EventService, NewsService, KnowledgeBaseService, LeaderboardService,
+                              LifecycleService)
+from organizations import dedup
+from organizations.models import NKO
+from organizations.services import MembershipService, NKOService
+
+
+class Case:
+    """Один измеряемый вызов"""
+
+    def __init__(self, name, func, writes=False):
+        self.name = name
+        self.func = func
+        # Пишущие вызовы выполняются в откатываемой транзакции,
+        # чтобы все повторы работали с одним и тем же состоянием БД
+        self.writes = writes
+
+    def run(self):
+        if not self.writes:
+            return evaluate(self.func())
+        with transaction.atomic():
+            result = evaluate(self.func())
+            transaction.set_rollback(True)
+        return result
+
+
+def evaluate(result):
+    """Принудительно выполнить ленивые QuerySet'ы в результате"""
+    if isinstance(result, QuerySet):
+        return list(result)
+    if isinstance(result, dict):
+        return {key: evaluate(value) for key, value in result.items()}
+    return result
+
+
+def is_transaction_control(sql):
+    """BEGIN/ROLLBACK/SAVEPOINT от обертки пишущих сценариев не учитываются"""
+    return sql.split(' ', 1)[0].upper() in ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+def percentile(values, pct):
+    """Перцентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def measure(case, repeat):
+    """Замерить p50/p95 и количество SQL-запросов одного вызова"""
+    # Первый прогон прогревает кэши и считает запросы, в замер не входит.
+    # Журнал запросов ограничен по длине, поэтому перед подсчетом очищаем его
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        case.run()
+    query_count = sum(1 for query in queries.captured_queries if not is_transaction_control(query['sql']))
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        case.run()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'queries': query_count,
+        'runs': repeat,
+    }
+
+
+def get_fixtures():
+    """Выбрать самые "тяжелые" объекты, чтобы бенчмарк проверял худший случай"""
+    city = (News.objects.filter(status='published').values('city')
+            .annotate(total=Count('id')).order_by('-total').values_list('city', flat=True).first())
+    news = (News.objects.filter(status='published', published_at__lte=timezone.now())
+            .annotate(total=Count('comments')).order_by('-total').first())
+    participation = (EventParticipation.objects.filter(event__status='published')
+                     .exclude(status='cancelled').select_related('user', 'event')
+                     .order_by('-event__current_participants').first())
+    return {
+        'city': city,
+        'news': news,
+        'event': participation.event,
+        'user': participation.user,
+        'material': KnowledgeBase.objects.filter(is_public=True).order_by('-view_count').first(),
+        'category': KnowledgeBase.objects.filter(is_public=True).values_list('category', flat=True).first(),
+        'nko': NKO.objects.filter(status='approved', is_active=True).order_by('-member_count').first(),
+    }
+
+
+def service_cases(fixtures):
+    user = fixtures['user']
+    event = fixtures['event']
+    request = RequestFactory().get('/', REMOTE_ADDR='127.0.0.1')
+    request.user = user
+    now = timezone.now()
+    month_events = list(Event.objects.filter(
+        status='published', start_date__year=now.year, start_date__month=now.month
+    ))
+
+    def quiet(func, *args):
+        # VerificationService печатает коды в консоль при DEBUG
+        def wrapper():
+            with redirect_stdout(io.StringIO()):
+                return func(*args)
+        return wrapper
+
+    def cold(func, *args):
+        # Замер без кэша: индекс и топ пользователя строятся заново
+        def wrapper():
+            recommendations.invalidate()
+            return func(*args)
+        return wrapper
+
+    return [
+        Case('ContentService.record_view', lambda: ContentService.record_view(fixtures['news'], request),
+             writes=True),
+        Case('ContentService.get_client_ip', lambda: ContentService.get_client_ip(request)),
+        Case('ContentService.get_calendar_data', lambda: ContentService.get_calendar_data(now, month_events)),
+        Case('ContentService.get_popular_content', ContentService.get_popular_content),
+        Case('ContentService.get_content_stats', ContentService.get_content_stats),
+        Case('ContentService.search_content', lambda: ContentService.search_content('волонтеры')),
+        Case('EventService.get_upcoming_events', EventService.get_upcoming_events),
+        Case('EventService.get_events_by_city', lambda: EventService.get_events_by_city(fixtures['city'])),
+        Case('EventService.get_recommended_events', lambda: EventService.get_recommended_events(user)),
+        Case('EventService.get_recommended_events[cold]', cold(EventService.get_recommended_events, user)),
+        Case('EventService.get_user_events', lambda: EventService.get_user_events(user)),
+        Case('EventService.cancel_registration', lambda: EventService.cancel_registration(user, event),
+             writes=True),
+        Case('LeaderboardService.get_page', lambda: LeaderboardService.get_page('', 'year')),
+        Case('LeaderboardService.get_ranks', lambda: LeaderboardService.get_ranks(user)),
+        Case('related.update', lambda: related.update(fixtures['news']), writes=True),
+        Case('LifecycleService.complete_events', LifecycleService.complete_events, writes=True),
+        Case('LifecycleService.archive_news', LifecycleService.archive_news, writes=True),
+        Case('reminders.process', reminders.process, writes=True),
+        Case('reminders.next_due', reminders.next_due),
+        Case('exports.render_csv', lambda: b''.join(
+            chunk.encode() for chunk in exports.render_csv(exports.get_rows(event)))),
+        Case('exports.render_xlsx', lambda: b''.join(exports.render_xlsx(exports.get_rows(event)))),
+        Case('moderation.get_page', lambda: moderation.get_page()),
+        Case('related.get_related', lambda: related.get_related(News, pk=fixtures['news'].pk)),
+        Case('NewsService.get_latest_news', NewsService.get_latest_news),
+        Case('NewsService.get_featured_news', NewsService.get_featured_news),
+        Case('NewsService.get_news_by_city', lambda: NewsService.get_news_by_city(fixtures['city'])),
+        Case('KnowledgeBaseService.get_popular_materials', KnowledgeBaseService.get_popular_materials),
+        Case('KnowledgeBaseService.get_materials_by_category',
+             lambda: KnowledgeBaseService.get_materials_by_category(fixtures['category'])),
+        Case('KnowledgeBaseService.get_categories_with_counts', KnowledgeBaseService.get_categories_with_counts),
+        Case('NKOService.get_popular_nkos', NKOService.get_popular_nkos),
+        Case('NKOService.get_nko_stats', NKOService.get_nko_stats),
+        Case('NKOService.get_nkos_by_city', lambda: NKOService.get_nkos_by_city(fixtures['city'])),
+        Case('NKOService.get_dashboard', lambda: NKOService.get_dashboard(fixtures['nko'].owner)),
+        Case('dedup.find_duplicates', lambda: dedup.find_duplicates(
+            fixtures['nko'].name, fixtures['nko'].city, fixtures['nko'].email, fixtures['nko'].website)),
+        Case('cities.suggest', lambda: city_index.suggest(fixtures['city'][:3])),
+        Case('cities.canonical_name', lambda: city_index.canonical_name(fixtures['city'].lower())),
+        Case('MembershipService.get_roster', lambda: MembershipService.get_roster(fixtures['nko'])[1]),
+        Case('MembershipService.set_status',
+             lambda: MembershipService.set_status(fixtures['nko'].memberships.filter(status='pending'), 'approved'),
+             writes=True),
+        Case('MembershipService.recount_member_counts', MembershipService.recount_member_counts, writes=True),
+        Case('VerificationService.generate_code', VerificationService.generate_code),
+        Case('VerificationService.create_verification_code',
+             lambda: VerificationService.create_verification_code(user, 'email_verification'), writes=True),
+        Case('VerificationService.send_email_verification',
+             quiet(VerificationService.send_email_verification, user), writes=True),
+        Case('VerificationService.send_password_reset_code',
+             quiet(VerificationService.send_password_reset_code, user), writes=True),
+        Case('VerificationService.verify_email_code',
+             lambda: VerificationService.verify_email_code(user, '000000'), writes=True),
+        Case('VerificationService.has_active_email_code',
+             lambda: VerificationService.has_active_email_code(user)),
+    ]
+
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'layered': 'dobro.sessions',
+}
+
+
+def session_cases(fixtures):
+    """Чтение и сохранение сессии авторизованного пользователя в стандартных бэкендах и dobro.sessions"""
+    user = fixtures['user']
+    data = {
+        SESSION_KEY: str(user.pk),
+        BACKEND_SESSION_KEY: 'django.contrib.auth.backends.ModelBackend',
+        HASH_SESSION_KEY: user.get_session_auth_hash(),
+    }
+
+    def make_cases(name, store_class):
+        store = store_class()
+        store.update(data)
+        store.save()
+        key = store.session_key
+
+        def save(**changes):
+            session = store_class(key)
+            session.update(changes)
+            session.save()
+            return session
+
+        return [
+            Case(f'session:{name}.load', lambda: store_class(key).load()),
+            # Сообщение пользователю: данные сессии меняются
+            Case(f'session:{name}.save', lambda: save(_messages=f'{time.perf_counter()}'), writes=True),
+            # Повторное сохранение тех же данных
+            Case(f'session:{name}.save_unchanged', lambda: save(**data), writes=True),
+        ]
+
+    return [case for name, engine in SESSION_ENGINES.items()
+            for case in make_cases(name, import_module(engine).SessionStore)]
+
+
+def view_cases(fixtures):
+    anonymous = Client()
+    authenticated = Client()
+    authenticated.force_login(fixtures['user'])
+
+    def get(client, url):
+        def wrapper():
+            response = client.get(url)
+            assert response.status_code == 200, f'{url}: {response.status_code}'
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response
+        return wrapper
+
+    def revalidate(client, url):
+        # Повторный запрос клиента с ETag из прошлого ответа
+        etag = []
+
+        def wrapper():
+            if not etag:
+                etag.append(client.get(url)['ETag'])
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag[0])
+            assert response.status_code == 304, f'{url}: {response.status_code}'
+            return response
+        return wrapper
+
+    city_ical = reverse('content:events_ical_city', args=[fixtures['event'].city])
+    news_detail = reverse('content:news_detail', args=[fixtures['news'].slug])
+
+    pages = [
+        ('home', anonymous, reverse('home')),
+        ('news_list', anonymous, reverse('content:news_list')),
+        ('news_detail', anonymous, news_detail),
+        ('event_list', anonymous, reverse('content:event_list')),
+        ('event_detail', anonymous, reverse('content:event_detail', args=[fixtures['event'].pk])),
+        ('event_detail_authenticated', authenticated,
+         reverse('content:event_detail', args=[fixtures['event'].pk])),
+        ('knowledge_base_list', anonymous, reverse('content:knowledge_base_list')),
+        ('knowledge_base_detail', anonymous,
+         reverse('content:knowledge_base_detail', args=[fixtures['material'].pk])),
+        ('calendar', anonymous, reverse('content:calendar')),
+        ('nko_list', anonymous, reverse('organizations:nko_list')),
+        ('nko_list_city', anonymous, reverse('organizations:nko_list') + f"?city={fixtures['city'].lower()}"),
+        ('cities:autocomplete', anonymous, reverse('cities:autocomplete') + f"?q={fixtures['city'][:3]}"),
+        ('nko_detail', anonymous, reverse('organizations:nko_detail', args=[fixtures['nko'].pk])),
+        ('nko_members', anonymous, reverse('organizations:nko_members', args=[fixtures['nko'].pk])),
+        ('my_organizations', authenticated, reverse('organizations:my_organizations')),
+        ('profile', authenticated, reverse('accounts:profile')),
+        ('events_ical_city', anonymous, city_ical),
+        ('news_feed_city', anonymous, reverse('content:news_feed_city', args=['rss', fixtures['city']])),
+        ('api:news_list', anonymous, reverse('api:news_list') + f"?city={fixtures['city']}&fields=title,content"),
+        ('api:event_list', anonymous, reverse('api:event_list')),
+    ]
+    # Детальные страницы записывают просмотр, поэтому выполняются с откатом
+    return [Case(f'view:{name}', get(client, url), writes=True) for name, client, url in pages] + [
+        Case('view:events_ical_city[304]', revalidate(anonymous, city_ical)),
+        Case('view:news_detail[304]', revalidate(anonymous, news_detail), writes=True),
+    ]
+
+
+def async_view_cases(fixtures, concurrency=10):
+    """Асинхронные страницы через ASGI-обработчик, включая параллельные запросы"""
+    client = AsyncClient()
+
+    def get(*urls):
+        async def fetch():
+            responses = await asyncio.gather(*(client.get(url) for url in urls))
+            for url, response in zip(urls, responses):
+                assert response.status_code == 200, f'{url}: {response.status_code}'
+            return responses
+        return async_to_sync(fetch)
+
+    event_url = reverse('content:event_detail', args=[fixtures['event'].pk])
+    pages = [
+        ('news_list', get(reverse('content:news_list'))),
+        ('news_detail', get(reverse('content:news_detail', args=[fixtures['news'].slug]))),
+        ('event_list', get(reverse('content:event_list'))),
+        ('event_detail', get(event_url)),
+        ('knowledge_base_list', get(reverse('content:knowledge_base_list'))),
+        ('knowledge_base_detail', get(reverse('content:knowledge_base_detail', args=[fixtures['material'].pk]))),
+        ('calendar', get(reverse('content:calendar'))),
+        ('nko_list', get(reverse('organizations:nko_list'))),
+        (f'event_detail_x{concurrency}', get(*[event_url] * concurrency)),
+    ]
+    return [Case(f'async_view:{name}', func, writes=True) for name, func in pages]
+
+
+def run_benchmarks(scales, repeat=20, seed=42, stdout=None, flush=True):
+    """Сгенерировать данные каждого масштаба и замерить все сценарии"""
+    results = {}
+    for scale in scales:
+        if flush:
+            call_command('flush', interactive=False, verbosity=0)
+            ContentType.objects.clear_cache()
+        call_command('seed_data', scale=scale, seed=seed, stdout=io.StringIO())
+
+        fixtures = get_fixtures()
+        cases = service_cases(fixtures) + session_cases(fixtures) + view_cases(fixtures) + async_view_cases(fixtures)
+        for case in cases:
+            key = f'{scale}:{case.name}'
+            results[key] = measure(case, repeat)
+            if stdout is not None:
+                result = results[key]
+                stdout.write(f'{key:<60} p50 {result["p50_ms"]:>9.2f} мс  '
+                             f'p95 {result["p95_ms"]:>9.2f} мс  {result["queries"]:>4} запр.')
+    return results
+
+
+def compare(results, baseline, tolerance=0.25, min_delta_ms=1.0):
+    """
+    Сравнить результаты с сохраненной базой.
+
+    Регрессией считается рост числа запросов или рост p95 больше чем на
+    tolerance (и больше min_delta_ms, чтобы не реагировать на шум).
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append(f'{key}: запросов {base["queries"]} -> {result["queries"]}')
+        limit = base['p95_ms'] * (1 + tolerance)
+        if result['p95_ms'] > limit and result['p95_ms'] - base['p95_ms'] > min_delta_ms:
+            regressions.append(f'{key}: p95 {base["p95_ms"]:.2f} -> {result["p95_ms"]:.2f} мс')
+    return regressions
+
+
+def make_report(results, scales, repeat, seed):
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'scales': scales,
+            'repeat': repeat,
+            'seed': seed,
+            'database': connection.vendor,
+        },
+        'results': results,
+    }
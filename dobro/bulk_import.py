@@ -0,0 +1,316 @@
+"""
+Массовый импорт мероприятий, НКО и материалов базы знаний из CSV или JSONL.
+
+Строки проверяются теми же формами, что и ручной ввод (EventForm, NKOForm,
+KnowledgeBaseForm), и пишутся пачками через bulk_create. Чтобы проверка не
+стала узким местом:
+- экземпляр формы создается один раз и переиспользуется для каждой строки
+  (иначе на строку уходит глубокое копирование всех полей формы);
+- внешние ключи (НКО-организатор мероприятия) загружаются одним запросом на
+  пачку, а не запросом на строку в ModelChoiceField;
+- повторная проверка полей моделью (full_clean) пропускается: поля формы
+  уже проверяют то же самое;
+- города всей пачки приводятся к справочнику (cities) одним запросом.
+Каждая пачка фиксируется отдельной транзакцией, после чего обновляются
+зависящие от нее индексы и счетчики, а номер последней обработанной строки
+сохраняется в контрольной точке (Checkpoint), так что прерванный импорт -
+из команды import_data или из админки - продолжается с места остановки.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django import forms
+from django.conf import settings
+from django.contrib import messages
+from django.core.exceptions import NON_FIELD_ERRORS, PermissionDenied
+from django.db import transaction
+from django.forms.models import construct_instance, model_to_dict, modelform_factory
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from cities.services import CityService
+from content import moderation, recommendations, related
+from content.forms import EventForm, KnowledgeBaseForm
+from content.models import Event, KnowledgeBase
+from organizations import dedup
+from organizations.forms import NKOForm
+from organizations.models import NKO
+
+BATCH_SIZE = 1000
+# Сколько ошибок хранить в отчете (считаются все)
+MAX_ERRORS = 1000
+FORMATS = ('csv', 'jsonl')
+
+
+class PreloadedChoiceField(forms.ModelChoiceField):
+    """Выбор объекта из загруженных на всю пачку вместо запроса на каждую строку"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.objects = {}
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.objects[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
+
+@dataclass
+class ImportKind:
+    """Что импортируется: модель, форма ручного ввода и поле владельца записи"""
+    model: type
+    form: type
+    owner_field: str
+    # Поля модели, которых нет в форме, но которые можно задать в файле
+    extra_fields: tuple = ('status',)
+    # Файлы из CSV/JSONL не загружаются
+    skip_fields: tuple = ()
+    # after_batch(instances) вызывается после фиксации каждой пачки: bulk_create не отправляет сигналы
+    after_batch: object = None
+
+
+def after_events(instances):
+    recommendations.invalidate()
+    moderation.invalidate_counts()
+
+
+def after_nko(instances):
+    # Индекс дубликатов живет в памяти процесса, поэтому сбрасывается только после фиксации транзакции
+    transaction.on_commit(dedup.invalidate)
+    moderation.invalidate_counts()
+
+
+def after_knowledge(instances):
+    related.add_many(instances)
+
+
+KINDS = {
+    'events': ImportKind(Event, EventForm, 'created_by', after_batch=after_events),
+    'nko': ImportKind(NKO, NKOForm, 'owner', skip_fields=('logo', 'cover_image'), after_batch=after_nko),
+    'knowledge': ImportKind(KnowledgeBase, KnowledgeBaseForm, 'author', extra_fields=(),
+                            skip_fields=('attached_file',), after_batch=after_knowledge),
+}
+
+
+@dataclass
+class ImportReport:
+    processed: int = 0
+    created: int = 0
+    error_count: int = 0
+    # [(номер строки файла, текст ошибки)]
+    errors: list = field(default_factory=list)
+    # Номер последней обработанной строки файла (контрольная точка)
+    line: int = 0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+
+class Checkpoint:
+    """Контрольная точка импорта в файле JSON: вид импорта и номер последней обработанной строки"""
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+
+    def load(self):
+        """Строка, после которой продолжается импорт (0 - с начала); ValueError, если точка от другого импорта"""
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path) as file:
+            state = json.load(file)
+        if state.get('kind') != self.kind:
+            raise ValueError(f'Контрольная точка {self.path} относится к другому импорту')
+        return state['line']
+
+    def save(self, report):
+        # Запись через временный файл, чтобы сбой не оставил точку недописанной
+        with open(f'{self.path}.tmp', 'w') as file:
+            json.dump({'kind': self.kind, 'line': report.line}, file)
+        os.replace(f'{self.path}.tmp', self.path)
+
+
+def upload_checkpoint(kind, upload):
+    """Контрольная точка загруженного в админке файла по хешу его содержимого: повторная загрузка продолжит импорт"""
+    digest = hashlib.sha256()
+    for chunk in upload.chunks():
+        digest.update(chunk)
+    upload.seek(0)
+    directory = getattr(settings, 'IMPORT_CHECKPOINT_DIR', None) or tempfile.gettempdir()
+    return Checkpoint(os.path.join(directory, f'import-{kind}-{digest.hexdigest()}.checkpoint'), kind)
+
+
+def read_rows(stream, format):
+    """(номер строки файла, значения полей) из текстового потока CSV или JSONL"""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError:
+            row = None
+        yield line, row
+
+
+def format_errors(form):
+    return '; '.join(
+        f"{name}: {' '.join(messages)}" if name != NON_FIELD_ERRORS else ' '.join(messages)
+        for name, messages in form.errors.items()
+    )
+
+
+class Importer:
+    """Проверка строк формой и вставка пачками"""
+
+    def __init__(self, kind, owner, batch_size=BATCH_SIZE):
+        self.kind = KINDS[kind]
+        self.owner = owner
+        self.batch_size = batch_size
+        # bulk_create не отправляет pre_save, поэтому города приводятся к справочнику пачкой
+        self.link_cities = self.kind.model in CityService.linked_models()
+        meta = self.kind.form._meta
+        fields = [name for name in meta.fields if name not in self.kind.skip_fields]
+        form_class = modelform_factory(self.kind.model, form=self.kind.form,
+                                       fields=fields + list(self.kind.extra_fields))
+        preloaded = {name for name, form_field in form_class.base_fields.items()
+                     if isinstance(form_field, forms.ModelChoiceField)}
+
+        class ImportForm(form_class):
+            def _post_clean(self):
+                # Поля модели уже проверены полями формы (обязательность, длина, варианты, формат),
+                # а своих clean(), уникальных полей и ограничений у импортируемых моделей нет,
+                # поэтому повторный full_clean() модели не выполняется
+                self.instance = construct_instance(self, self.instance, self._meta.fields, self._meta.exclude)
+
+        # Внешние ключи проверяются по загруженной пачке, а не запросом на строку
+        self.preloaded = {}
+        for name in preloaded:
+            form_field = ImportForm.base_fields[name]
+            ImportForm.base_fields[name] = PreloadedChoiceField(
+                queryset=form_field.queryset, required=form_field.required, label=form_field.label,
+            )
+            self.preloaded[name] = form_field.queryset
+        self.form = ImportForm()
+        # Отсутствующие в строке поля получают значения по умолчанию модели, как в пустой форме
+        self.defaults = {name: value for name, value in model_to_dict(self.kind.model(), self.form.fields).items()
+                         if value not in (None, '')}
+
+    def preload(self, batch):
+        for name, queryset in self.preloaded.items():
+            ids = set()
+            for _, data in batch:
+                try:
+                    ids.add(int(data[name]))
+                except (KeyError, TypeError, ValueError):
+                    pass
+            self.form.fields[name].objects = queryset.in_bulk(ids) if ids else {}
+
+    def validate(self, data):
+        """Несохраненный объект или None, если форма нашла ошибки"""
+        form = self.form
+        # Переиспользуем экземпляр формы: сбрасываем данные и результаты прошлой проверки
+        form.data = {**self.defaults, **data}
+        form.is_bound = True
+        form._errors = None
+        form.instance = self.kind.model(**{self.kind.owner_field: self.owner})
+        if form.is_valid():
+            return form.instance
+        return None
+
+    def run(self, rows, start_after=0, on_batch=None):
+        """Импорт строк после контрольной точки start_after; on_batch(report) вызывается после каждой пачки"""
+        report = ImportReport(line=start_after)
+        rows = ((line, data) for line, data in rows if line > start_after)
+        while batch := list(islice(rows, self.batch_size)):
+            self.preload([(line, data) for line, data in batch if isinstance(data, dict)])
+            instances = []
+            for line, data in batch:
+                if not isinstance(data, dict):
+                    report.add_error(line, 'Строка не является объектом JSON')
+                    continue
+                instance = self.validate(data)
+                if instance is None:
+                    report.add_error(line, format_errors(self.form))
+                else:
+                    instances.append(instance)
+            with transaction.atomic():
+                if self.link_cities and instances:
+                    # Импорт выполняют сотрудники, поэтому новые города добавляются в справочник
+                    CityService.link(instances, create=True)
+                self.kind.model.objects.bulk_create(instances)
+            # Индексы обновляются после каждой пачки, чтобы прерванный импорт не оставил их устаревшими
+            if instances and self.kind.after_batch:
+                self.kind.after_batch(instances)
+            report.processed += len(batch)
+            report.created += len(instances)
+            report.line = batch[-1][0]
+            if on_batch:
+                on_batch(report)
+        return report
+
+
+class ImportFileForm(forms.Form):
+    file = forms.FileField(label='Файл CSV или JSONL (UTF-8)')
+    restart = forms.BooleanField(label='Начать заново, не продолжая прерванную загрузку этого файла', required=False)
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if upload.name.rsplit('.', 1)[-1].lower() not in FORMATS:
+            raise forms.ValidationError('Поддерживаются файлы .csv и .jsonl')
+        return upload
+
+
+class ImportAdminMixin:
+    """Загрузка файла импорта со страницы списка в админке"""
+    import_kind = None
+    change_list_template = 'admin/import_change_list.html'
+
+    def get_urls(self):
+        opts = self.model._meta
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view),
+                 name=f'{opts.app_label}_{opts.model_name}_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = ImportFileForm(request.POST or None, request.FILES or None)
+        report = None
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            format = upload.name.rsplit('.', 1)[-1].lower()
+            # Прерванная загрузка того же файла продолжается после последней зафиксированной пачки
+            checkpoint = upload_checkpoint(self.import_kind, upload)
+            start_after = 0 if form.cleaned_data['restart'] else checkpoint.load()
+            if start_after:
+                self.message_user(request, f'Продолжаем после строки {start_after}', messages.INFO)
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            report = Importer(self.import_kind, request.user).run(read_rows(stream, format), start_after=start_after,
+                                                                  on_batch=checkpoint.save)
+            level = messages.WARNING if report.error_count else messages.SUCCESS
+            self.message_user(request, f'Импортировано: {report.created} из {report.processed}', level)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f'Импорт: {self.model._meta.verbose_name_plural}',
+            'opts': self.model._meta,
+            'form': form,
+            'report': report,
+        }
+        return TemplateResponse(request, 'admin/import.html', context)
@@ -0,0 +1,114 @@
+"""
+Условные GET-запросы (ETag/Last-Modified) для детальных страниц.
+
+Версия страницы считается одним небольшим запросом: updated_at объекта и по
+каждому набору связанных записей (комментарии, участники, похожие материалы)
+их число и наибольшее значение поля версии. Число нужно потому, что удаление
+записи не меняет максимум. Если версия совпала с присланной браузером, страница
+отвечает 304, не загружая остальные данные и не рендеря шаблон.
+
+Имена людей на странице (авторов комментариев, участников) версионируются их
+User.updated_at. Счетчик просмотров растет при каждом показе, в том числе при
+ответе 304, поэтому в версию не входит и анонимным посетителям не показывается.
+
+Проверяются только страницы анонимных посетителей: авторизованным показываются
+личные данные (участие, счетчик просмотров, формы с CSRF-токеном), которых версия
+не учитывает. Страница с непоказанными сообщениями (messages) тоже всегда отдается целиком.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from .async_utils import aresolve_user
+
+
+def related(queryset, field='object_id', version='pk'):
+    """
+    Подзапросы (число, максимум поля version) записей queryset, ссылающихся на объект полем field.
+    Для записей, которые пересоздаются при изменении, версией служит pk.
+    """
+    grouped = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    return (
+        Subquery(grouped.annotate(total=Count('pk')).values('total')),
+        Subquery(grouped.annotate(last=Max(version)).values('last')),
+    )
+
+
+def get_state(queryset, **relations):
+    """
+    Объект (загружается только updated_at) с атрибутами etag и last_modified
+    или None, если объекта нет; relations - {имя: related(...)}
+    """
+    annotations = {}
+    for name, (total, last) in relations.items():
+        annotations[f'{name}_total'] = total
+        annotations[f'{name}_last'] = last
+    obj = next(iter(queryset.annotate(**annotations).only('updated_at').order_by()[:1]), None)
+    if obj is None:
+        return None
+
+    versions = [obj.updated_at] + [getattr(obj, name) for name in annotations]
+    obj.etag = f'"{hashlib.md5(repr(versions).encode()).hexdigest()}"'
+    obj.last_modified = max(value for value in versions if isinstance(value, datetime))
+    return obj
+
+
+def is_conditional(request):
+    """Можно ли ответить на запрос по версии страницы"""
+    return (request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+            and not len(messages.get_messages(request)))
+
+
+def set_headers(response, state):
+    if state is not None and response.status_code in (200, 304):
+        response['ETag'] = state.etag
+        response['Last-Modified'] = http_date(state.last_modified.timestamp())
+    # Авторизованным та же страница отдается без валидаторов
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def condition(state_func, not_modified=None):
+    """
+    Аналог django.views.decorators.http.condition для синхронных и асинхронных страниц объектов.
+    state_func(request, **kwargs) возвращает get_state(...) или None, если запрос нужно выполнить без проверки;
+    not_modified(request, state) вызывается при ответе 304 (например, чтобы учесть просмотр).
+    """
+    def check(request, kwargs):
+        if not is_conditional(request):
+            return None, None
+        state = state_func(request, **kwargs)
+        if state is None:
+            return None, None
+        response = get_conditional_response(request, etag=state.etag,
+                                            last_modified=int(state.last_modified.timestamp()))
+        if response is not None and response.status_code == 304 and not_modified:
+            not_modified(request, state)
+        return state, response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, **kwargs):
+                # Сообщения читаются из сессии, поэтому проверка выполняется синхронно
+                await aresolve_user(request)
+                state, response = await sync_to_async(check)(request, kwargs)
+                if response is None:
+                    response = await view(request, **kwargs)
+                return set_headers(response, state)
+        else:
+            @wraps(view)
+            def wrapper(request, **kwargs):
+                state, response = check(request, kwargs)
+                if response is None:
+                    response = view(request, **kwargs)
+                return set_headers(response, state)
+        return wrapper
+    return decorator
@@ -0,0 +1,188 @@
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY, get_user_model
+from django.db import connections
+
+from accounts import activity
+
+logger = logging.getLogger('dobro.sql')
+
+# Списки параметров IN (%s, %s, ...) разной длины сводим к одному шаблону
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+DEFAULT_SQL_INSTRUMENTATION = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0,
+    'QUERY_BUDGET': 50,
+    'TIME_BUDGET_MS': 200,
+    'NPLUSONE_THRESHOLD': 10,
+}
+
+
+def get_instrumentation_settings():
+    """Настройки инструментирования с подстановкой значений по умолчанию"""
+    # Server-Timing показывает любому посетителю число запросов и время БД, поэтому по умолчанию только при DEBUG
+    return {**DEFAULT_SQL_INSTRUMENTATION, 'SERVER_TIMING': settings.DEBUG,
+            **getattr(settings, 'SQL_INSTRUMENTATION', {})}
+
+
+class QueryStats:
+    """Счетчики SQL-запросов в рамках одного HTTP-запроса"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.templates = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper получает SQL с плейсхолдерами, поэтому шаблон
+        # запроса - это сама строка sql без значений параметров
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.templates[sql] += 1
+
+    def repeated(self, threshold):
+        """Шаблоны запросов, выполненные больше threshold раз"""
+        grouped = Counter()
+        for sql, count in self.templates.items():
+            grouped[IN_LIST_RE.sub('IN (...)', sql)] += count
+        return [(sql, count) for sql, count in grouped.most_common() if count > threshold]
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Считает количество SQL-запросов и время работы БД для каждого запроса,
+    отдает их в заголовке Server-Timing и пишет в лог запросы, превысившие
+    бюджет или похожие на N+1.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        config = get_instrumentation_settings()
+        if not self.sampled(config):
+            return self.get_response(request)
+
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            self.install(stack, stats)
+            response = self.get_response(request)
+        return self.finish(request, response, stats, started, config)
+
+    async def __acall__(self, request):
+        config = get_instrumentation_settings()
+        if not self.sampled(config):
+            return await self.get_response(request)
+
+        # Асинхронный ORM выполняет запросы в потоке sync_to_async, а соединения
+        # у каждого потока свои, поэтому обертки ставятся и снимаются в том же потоке
+        stats = QueryStats()
+        started = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(self.install)(stack, stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, stats, started, config)
+
+    @staticmethod
+    def sampled(config):
+        return config['ENABLED'] and random.random() < config['SAMPLE_RATE']
+
+    @staticmethod
+    def install(stack, stats):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+
+    def finish(self, request, response, stats, started, config):
+        total = time.perf_counter() - started
+        request.query_stats = stats
+        if config['SERVER_TIMING']:
+            self.add_server_timing(response, stats, total)
+        self.report(request, stats, total, config)
+        return response
+
+    @staticmethod
+    def add_server_timing(response, stats, total):
+        """Добавить метрики в заголовок Server-Timing"""
+        metrics = [
+            f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"',
+            f'total;dur={total * 1000:.1f}',
+        ]
+        existing = response.get('Server-Timing')
+        if existing:
+            metrics.insert(0, existing)
+        response['Server-Timing'] = ', '.join(metrics)
+
+    @staticmethod
+    def report(request, stats, total, config):
+        """Записать в лог превышения бюджета и повторяющиеся запросы"""
+        db_ms = stats.duration * 1000
+        if stats.count > config['QUERY_BUDGET'] or db_ms > config['TIME_BUDGET_MS']:
+            logger.warning(
+                '%s %s: %d SQL queries, db %.1f ms, total %.1f ms',
+                request.method, request.path, stats.count, db_ms, total * 1000,
+            )
+
+        for sql, count in stats.repeated(config['NPLUSONE_THRESHOLD']):
+            logger.warning(
+                'Possible N+1 on %s %s: query executed %d times: %s',
+                request.method, request.path, count, sql,
+            )
+
+
+class ActivityTrackingMiddleware:
+    """
+    Отмечает активность авторизованного пользователя после каждого запроса
+    (см. accounts.activity) и раз в интервал записывает накопленное в БД.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        response = self.get_response(request)
+        if activity.get_activity_settings()['ENABLED']:
+            # id из сессии: пользователя не нужно загружать, если страница к нему не обращалась
+            user_id = request.session.get(SESSION_KEY)
+            if user_id is not None and activity.tracker.touch(get_user_model()._meta.pk.to_python(user_id)):
+                activity.tracker.flush()
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if activity.get_activity_settings()['ENABLED']:
+            user_id = await request.session.aget(SESSION_KEY)
+            if user_id is not None and activity.tracker.touch(get_user_model()._meta.pk.to_python(user_id)):
+                await sync_to_async(activity.tracker.flush)()
+        return response
@@ -0,0 +1,179 @@
+"""
+Сессии в БД с LRU-кэшем в памяти процесса (SESSION_ENGINE = 'dobro.sessions').
+
+Стандартный django.contrib.sessions.backends.db читает django_session на каждом
+запросе с cookie сессии и пишет ее при каждом изменении. Здесь:
+- прочитанные и сохраненные сессии хранятся в памяти процесса (не больше SIZE
+  записей, давно не использованные вытесняются) не дольше TIMEOUT секунд;
+- сохранение пропускается, если данные сессии не изменились, а срок действия
+  сдвинулся меньше чем на WRITE_INTERVAL секунд, так что повторные сохранения
+  одних и тех же данных объединяются в одну запись. Кэш процесса мог отстать
+  от записи другого процесса, поэтому совпадение с ним проверяется чтением
+  строки из БД: запись заменяется чтением по ключу;
+- устаревшие сессии удаляются пачками по CLEAR_BATCH_SIZE (clearsessions),
+  чтобы не блокировать таблицу одним большим DELETE.
+
+Удаление сессии (выход, смена ключа при входе) сразу убирает ее из кэша своего
+процесса, а другие процессы перестают ее принимать не позже чем через TIMEOUT
+секунд, поэтому TIMEOUT держится коротким.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends import db
+from django.utils import timezone
+
+DEFAULT_SESSION_CACHE = {
+    'SIZE': 10000,
+    'TIMEOUT': 10,
+    'WRITE_INTERVAL': 60,
+    'CLEAR_BATCH_SIZE': 1000,
+}
+
+
+def get_session_cache_settings():
+    """Настройки кэша сессий с подстановкой значений по умолчанию"""
+    return {**DEFAULT_SESSION_CACHE, **getattr(settings, 'SESSION_CACHE', {})}
+
+
+class Entry(NamedTuple):
+    # Сериализованные данные: сравниваются при сохранении и дают новую копию при чтении
+    data: bytes
+    expire_date: object
+    stored_at: float
+
+
+class LocalSessions:
+    """LRU-кэш сессий процесса; общий для потоков, поэтому под блокировкой"""
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_key):
+        """Свежая запись сессии или None"""
+        with self.lock:
+            entry = self.entries.get(session_key)
+            if entry is None:
+                return None
+            if (time.monotonic() - entry.stored_at > get_session_cache_settings()['TIMEOUT']
+                    or entry.expire_date <= timezone.now()):
+                del self.entries[session_key]
+                return None
+            self.entries.move_to_end(session_key)
+            return entry
+
+    def set(self, session_key, entry):
+        size = get_session_cache_settings()['SIZE']
+        with self.lock:
+            self.entries[session_key] = entry
+            self.entries.move_to_end(session_key)
+            while len(self.entries) > size:
+                self.entries.popitem(last=False)
+
+    def delete(self, session_key):
+        with self.lock:
+            self.entries.pop(session_key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_sessions = LocalSessions()
+
+
+class SessionStore(db.SessionStore):
+    def make_entry(self, data, expire_date=None):
+        if expire_date is None:
+            expire_date = self.get_expiry_date(expiry=data.get('_session_expiry'))
+        return Entry(self.serializer().dumps(data), expire_date, time.monotonic())
+
+    def is_close(self, entry, data, expire_date):
+        """Данные те же, а срок сдвинулся ненамного"""
+        interval = timedelta(seconds=get_session_cache_settings()['WRITE_INTERVAL'])
+        return data == entry.data and abs(entry.expire_date - expire_date) < interval
+
+    def may_be_unchanged(self, entry):
+        """Совпадает ли entry с кэшем процесса; иначе сессию нужно записать без проверки по БД"""
+        cached = local_sessions.get(self.session_key)
+        return cached is not None and self.is_close(entry, cached.data, cached.expire_date)
+
+    def get_stored(self):
+        return (self.model.objects.filter(session_key=self.session_key, expire_date__gt=timezone.now())
+                .values_list('session_data', 'expire_date'))
+
+    def is_unchanged(self, entry, stored):
+        """Сохранение можно пропустить: строка stored (данные, срок) из БД совпадает с entry"""
+        if stored is None:
+            return False
+        session_data, expire_date = stored
+        return self.is_close(entry, self.serializer().dumps(self.decode(session_data)), expire_date)
+
+    def from_db(self, session):
+        if session is None:
+            return {}
+        data = self.decode(session.session_data)
+        local_sessions.set(self.session_key, self.make_entry(data, session.expire_date))
+        return data
+
+    def load(self):
+        entry = local_sessions.get(self.session_key)
+        if entry is not None:
+            return self.serializer().loads(entry.data)
+        return self.from_db(self._get_session_from_db())
+
+    async def aload(self):
+        entry = local_sessions.get(self.session_key)
+        if entry is not None:
+            return self.serializer().loads(entry.data)
+        return self.from_db(await self._aget_session_from_db())
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        entry = self.make_entry(self._get_session(no_load=must_create))
+        if not must_create and self.may_be_unchanged(entry) and self.is_unchanged(entry, self.get_stored().first()):
+            return
+        super().save(must_create=must_create)
+        local_sessions.set(self.session_key, entry)
+
+    async def asave(self, must_create=False):
+        if self.session_key is None:
+            return await self.acreate()
+        entry = self.make_entry(await self._aget_session(no_load=must_create))
+        if (not must_create and self.may_be_unchanged(entry)
+                and self.is_unchanged(entry, await self.get_stored().afirst())):
+            return
+        await super().asave(must_create=must_create)
+        local_sessions.set(self.session_key, entry)
+
+    def delete(self, session_key=None):
+        session_key = session_key or self.session_key
+        super().delete(session_key)
+        local_sessions.delete(session_key)
+
+    async def adelete(self, session_key=None):
+        session_key = session_key or self.session_key
+        await super().adelete(session_key)
+        local_sessions.delete(session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        """Удалить устаревшие сессии пачками; возвращает число удаленных"""
+        model = cls.get_model_class()
+        batch_size = get_session_cache_settings()['CLEAR_BATCH_SIZE']
+        deleted = 0
+        while keys := list(model.objects.filter(expire_date__lt=timezone.now())
+                           .values_list('pk', flat=True)[:batch_size]):
+            deleted += model.objects.filter(pk__in=keys).delete()[0]
+        return deleted
+
+    @classmethod
+    async def aclear_expired(cls):
+        return await sync_to_async(cls.clear_expired)()
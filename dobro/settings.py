@@ -39,15 +39,18 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'organizations',
     'accounts',
-    'content'
+    'content',
+    'cities',
 ]
 
 MIDDLEWARE = [
+    'dobro.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'dobro.middleware.ActivityTrackingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -64,6 +67,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'content.context_processors.moderation_counts',
             ],
         },
     },
@@ -82,6 +86,21 @@ DATABASES = {
     }
 }
 
+# Кэш общий для всех процессов: через версии в нем сбрасываются индексы в памяти процессов
+# (дубликаты НКО, справочник городов), рекомендации, ленты и счетчики модерации, в том числе
+# из команд cron. LocMemCache у каждого процесса свой и для этого не подходит. Файловый кэш
+# общий в пределах сервера; при нескольких серверах используйте Memcached или Redis.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -132,4 +151,50 @@ AUTH_USER_MODEL = 'accounts.User'
 # Email верификация
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@rosatom-dobro.ru'
-EMAIL_SUBJECT_PREFIX = '[Добрые дела Росатома] '
\ No newline at end of file
+EMAIL_SUBJECT_PREFIX = '[Добрые дела Росатома] '
+
+# Через сколько дней после публикации новость переводится в архив (python manage.py transition_content)
+NEWS_ARCHIVE_AFTER_DAYS = 365
+
+# Сессии в БД с кэшем в памяти процесса (dobro.sessions); устаревшие удаляются python manage.py clearsessions
+SESSION_ENGINE = 'dobro.sessions'
+SESSION_CACHE = {
+    'SIZE': 10000,  # сессий в кэше одного процесса
+    'TIMEOUT': 10,  # секунд, через которые сессия перечитывается из БД (выход в другом процессе)
+    'WRITE_INTERVAL': 60,  # на сколько секунд может отстать срок действия при пропуске неизменной записи
+    'CLEAR_BATCH_SIZE': 1000,  # сессий в одном DELETE при очистке
+}
+
+# Учет последней активности пользователей (accounts.activity)
+ACTIVITY_TRACKING = {
+    'ENABLED': True,
+    'FLUSH_INTERVAL': 60,  # секунд между записями накопленной активности в БД
+    'BATCH_SIZE': 500,  # пользователей в одном UPDATE
+    'ONLINE_WINDOW': 300,  # за сколько секунд активности пользователь считается онлайн
+}
+
+# Инструментирование SQL-запросов (dobro.middleware.QueryInstrumentationMiddleware)
+SQL_INSTRUMENTATION = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 1.0 if DEBUG else 0.05,  # доля запросов, которые инструментируются
+    'QUERY_BUDGET': 50,  # максимум SQL-запросов на страницу
+    'TIME_BUDGET_MS': 200,  # максимум времени БД на страницу
+    'NPLUSONE_THRESHOLD': 10,  # сколько раз один шаблон запроса может повториться
+    'SERVER_TIMING': DEBUG,  # заголовок Server-Timing с числом запросов и временем БД
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'dobro': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
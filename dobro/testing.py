@@ -0,0 +1,131 @@
+"""
+Общие помощники для тестов приложений: фабрики объектов и проверка
+бюджета SQL-запросов.
+"""
+from datetime import timedelta
+from itertools import count
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.utils import timezone
+
+from accounts import activity
+from accounts.models import User, UserProfile
+from cities import index as city_index
+from content.models import News, Event, KnowledgeBase, Comment
+from organizations.models import NKO
+
+_sequence = count(1)
+
+
+def create_user(**fields):
+    """Пользователь с профилем"""
+    number = next(_sequence)
+    fields.setdefault('username', f'user{number}')
+    fields.setdefault('email', f'user{number}@example.com')
+    fields.setdefault('first_name', 'Иван')
+    fields.setdefault('last_name', 'Петров')
+    fields.setdefault('city', 'Саров')
+    user = User.objects.create_user(**fields)
+    UserProfile.objects.create(user=user)
+    return user
+
+
+def create_users(size, **fields):
+    """Пачка пользователей без профилей для наполнения связей"""
+    prefix = next(_sequence)
+    return User.objects.bulk_create([
+        User(username=f'bulk{prefix}_{i}', email=f'bulk{prefix}_{i}@example.com',
+             first_name='Мария', last_name='Иванова', **fields)
+        for i in range(size)
+    ])
+
+
+def create_nko(owner=None, **fields):
+    fields.setdefault('name', f'НКО {next(_sequence)}')
+    fields.setdefault('description', 'Описание деятельности')
+    fields.setdefault('category', 'ecology')
+    fields.setdefault('email', 'nko@example.com')
+    fields.setdefault('city', 'Саров')
+    fields.setdefault('status', 'approved')
+    return NKO.objects.create(owner=owner or create_user(), **fields)
+
+
+def create_news(author=None, **fields):
+    number = next(_sequence)
+    fields.setdefault('title', f'Новость номер {number}')
+    fields.setdefault('content', 'Текст новости')
+    fields.setdefault('city', 'Саров')
+    fields.setdefault('status', 'published')
+    fields.setdefault('published_at', timezone.now() - timedelta(hours=1))
+    fields.setdefault('slug', f'news-{number}')
+    return News.objects.create(author=author or create_user(), **fields)
+
+
+def create_event(created_by=None, **fields):
+    start = fields.pop('start_date', timezone.now() + timedelta(days=7))
+    fields.setdefault('title', f'Мероприятие {next(_sequence)}')
+    fields.setdefault('description', 'Описание мероприятия')
+    fields.setdefault('event_type', 'volunteer')
+    fields.setdefault('end_date', start + timedelta(hours=3))
+    fields.setdefault('city', 'Саров')
+    fields.setdefault('address', 'ул. Ленина, 1')
+    fields.setdefault('status', 'published')
+    return Event.objects.create(start_date=start, created_by=created_by or create_user(), **fields)
+
+
+def create_material(author=None, **fields):
+    fields.setdefault('title', f'Материал {next(_sequence)}')
+    fields.setdefault('content', 'Содержание материала')
+    fields.setdefault('category', 'guide')
+    return KnowledgeBase.objects.create(author=author or create_user(), **fields)
+
+
+def create_comments(content_object, authors, with_replies=False):
+    """По одному комментарию (и ответу на него) от каждого автора"""
+    content_type = ContentType.objects.get_for_model(content_object)
+    comments = Comment.objects.bulk_create([
+        Comment(content_type=content_type, object_id=content_object.pk, author=author, text='Комментарий')
+        for author in authors
+    ])
+    if with_replies:
+        Comment.objects.bulk_create([
+            Comment(content_type=content_type, object_id=content_object.pk, author=author,
+                    parent=comment, text='Ответ')
+            for comment, author in zip(comments, authors)
+        ])
+    return comments
+
+
+class QueryBudgetMixin:
+    """
+    Проверка, что страница выполняет фиксированное число SQL-запросов
+    независимо от количества связанных строк.
+    """
+    sizes = (1, 10, 100)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Кэш ContentType прогреваем заранее, иначе первый запрос
+        # страницы выполнит лишний SELECT и бюджет будет зависеть от порядка тестов
+        ContentType.objects.clear_cache()
+        ContentType.objects.get_for_models(News, Event, KnowledgeBase, NKO)
+        # Запись накопленной активности не должна попасть в замер страницы
+        activity.tracker.reset()
+        # Индекс справочника городов строится один раз на процесс, а не на запрос
+        city_index.get_index()
+
+    def assertQueryBudget(self, budget, populate, method='get', status=200):
+        """
+        populate(size) создает size связанных строк, при необходимости
+        авторизует self.client и возвращает URL страницы.
+        Сессия, сохраненная force_login, уже лежит в кэше процесса (dobro.sessions),
+        поэтому ее чтение в бюджет не входит.
+        """
+        for size in self.sizes:
+            with self.subTest(size=size):
+                url = populate(size)
+                with self.assertNumQueries(budget):
+                    response = getattr(self.client, method)(url)
+                self.assertEqual(response.status_code, status)
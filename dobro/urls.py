@@ -26,4 +26,6 @@ urlpatterns = [
     path('organizations/', include('organizations.urls')),
     path('accounts/', include('accounts.urls')),
     path('content/', include('content.urls')),
+    path('cities/', include('cities.urls')),
+    path('api/', include('dobro.api')),
 ]
@@ -1,28 +1,56 @@
 from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from cities.services import CityService
+from content import moderation
+from dobro.bulk_import import ImportAdminMixin
+from . import dedup
 from .models import NKO, NKOMembership
+from .services import MembershipService
 
 
 # Register your models here.
 @admin.register(NKO)
-class NKOAdmin(admin.ModelAdmin):
-    list_display = ['name', 'city', 'category', 'status', 'owner', 'created_at']
+class NKOAdmin(ImportAdminMixin, admin.ModelAdmin):
+    import_kind = 'nko'
+    list_display = ['name', 'city', 'category', 'status', 'owner', 'member_count', 'created_at']
     list_filter = ['status', 'category', 'city', 'created_at']
     search_fields = ['name', 'description', 'owner__username']
-    readonly_fields = ['created_at', 'updated_at']
-    actions = ['approve_nko', 'reject_nko']
+    readonly_fields = ['member_count', 'created_at', 'updated_at']
+    actions = ['approve_nko', 'reject_nko', 'duplicates_report']
+
+    def set_status(self, queryset, status):
+        # Список фильтра "на модерации" после UPDATE опустеет, поэтому ключи читаем заранее
+        selected = NKO.objects.filter(pk__in=list(queryset.values_list('pk', flat=True)))
+        selected.update(status=status, updated_at=timezone.now())
+        # UPDATE обходит сигналы: города одобренных попадают в справочник, счетчики модерации сбрасываются явно
+        if status == 'approved':
+            CityService.link_moderated(selected)
+        moderation.invalidate_counts()
 
     def approve_nko(self, request, queryset):
-        queryset.update(status='approved')
+        self.set_status(queryset, 'approved')
         self.message_user(request, "НКО одобрены")
 
     approve_nko.short_description = "Одобрить выбранные НКО"
 
     def reject_nko(self, request, queryset):
-        queryset.update(status='rejected')
+        self.set_status(queryset, 'rejected')
         self.message_user(request, "НКО отклонены")
 
     reject_nko.short_description = "Отклонить выбранные НКО"
 
+    def duplicates_report(self, request, queryset):
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Вероятные дубликаты',
+            'opts': self.model._meta,
+            'pairs': dedup.duplicate_report(queryset.only('name', 'city', 'email', 'website')),
+        }
+        return TemplateResponse(request, 'admin/organizations/nko/duplicates.html', context)
+
+    duplicates_report.short_description = "Найти дубликаты выбранных НКО"
+
 
 @admin.register(NKOMembership)
 class NKOMembershipAdmin(admin.ModelAdmin):
@@ -30,3 +58,23 @@ class NKOMembershipAdmin(admin.ModelAdmin):
     list_filter = ['status', 'role', 'joined_at']
     search_fields = ['user__username', 'nko__name']
     readonly_fields = ['joined_at']
+    actions = ['approve_memberships', 'reject_memberships', 'ban_memberships']
+
+    # Статус меняется через сервис, чтобы пересчитать счетчики участников НКО
+    def approve_memberships(self, request, queryset):
+        MembershipService.set_status(queryset, 'approved')
+        self.message_user(request, "Заявки одобрены")
+
+    approve_memberships.short_description = "Одобрить выбранные заявки"
+
+    def reject_memberships(self, request, queryset):
+        MembershipService.set_status(queryset, 'rejected')
+        self.message_user(request, "Заявки отклонены")
+
+    reject_memberships.short_description = "Отклонить выбранные заявки"
+
+    def ban_memberships(self, request, queryset):
+        MembershipService.set_status(queryset, 'banned')
+        self.message_user(request, "Участники заблокированы")
+
+    ban_memberships.short_description = "Заблокировать выбранных участников"
@@ -0,0 +1,201 @@
+"""
+Поиск вероятных дубликатов НКО.
+
+Индекс держится в памяти процесса: триграммы нормализованного названия ->
+множество pk, плюс точные совпадения email и домена сайта. Чтобы сходство
+Жаккара было не ниже NAME_THRESHOLD, у названий должна совпасть хотя бы одна
+из самых редких триграмм проверяемого названия (префиксный фильтр), поэтому
+кандидаты собираются только по коротким спискам и поиск почти не зависит от
+общего числа НКО. При изменении НКО сигнал меняет версию в общем для всех
+процессов кэше (CACHES в settings, не LocMemCache), и каждый процесс
+перестраивает свой индекс при следующем обращении.
+"""
+import math
+import re
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from django.core.cache import cache
+
+from .models import NKO
+
+VERSION_KEY = 'nko_dedup:version'
+INDEXED_FIELDS = {'name', 'city', 'email', 'website', 'is_active'}
+
+NAME_THRESHOLD = 0.5
+CITY_BONUS = 0.1
+
+# Организационно-правовые формы и общие слова не отличают одну НКО от другой
+NAME_STOP_WORDS = {
+    'ано', 'нко', 'оо', 'роо', 'моо', 'бф', 'фонд', 'благотворительный', 'благотворительная', 'общественная',
+    'организация', 'автономная', 'некоммерческая', 'региональная', 'местная', 'движение', 'центр',
+}
+WORD_RE = re.compile(r'[a-zа-я0-9]+')
+
+
+def normalize_name(name):
+    words = WORD_RE.findall(name.lower().replace('ё', 'е'))
+    return ' '.join(word for word in words if word not in NAME_STOP_WORDS)
+
+
+def trigrams(text):
+    """Триграммы строки с границами слов: "сад" -> {"  с", " са", "сад", "ад "}"""
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)} if text else set()
+
+
+def get_domain(website):
+    host = urlsplit(website if '//' in website else f'//{website}').hostname or ''
+    return host.removeprefix('www.')
+
+
+@dataclass
+class Duplicate:
+    nko_id: int
+    score: float
+    reasons: list = field(default_factory=list)
+
+
+class DuplicateIndex:
+    def __init__(self, rows):
+        # rows: [(pk, название, город, email, сайт)]
+        self.grams = {}
+        self.cities = {}
+        self.contacts = {}
+        # триграмма -> {число триграмм названия: множество pk}
+        self.postings = defaultdict(dict)
+        self.emails = defaultdict(set)
+        self.domains = defaultdict(set)
+        for pk, name, city, email, website in rows:
+            self.add(pk, name, city, email, website)
+
+    @classmethod
+    def build(cls):
+        return cls(NKO.objects.filter(is_active=True)
+                   .values_list('pk', 'name', 'city', 'email', 'website').iterator())
+
+    def add(self, pk, name, city, email, website):
+        grams = trigrams(normalize_name(name))
+        self.grams[pk] = grams
+        self.cities[pk] = city.strip().lower()
+        for gram in grams:
+            self.postings[gram].setdefault(len(grams), set()).add(pk)
+        email, domain = email.strip().lower(), get_domain(website) if website else ''
+        self.contacts[pk] = email, domain
+        if email:
+            self.emails[email].add(pk)
+        if domain:
+            self.domains[domain].add(pk)
+
+    def remove(self, pk):
+        grams = self.grams.pop(pk, set())
+        self.cities.pop(pk, None)
+        for gram in grams:
+            self.postings[gram][len(grams)].discard(pk)
+        email, domain = self.contacts.pop(pk, ('', ''))
+        self.emails[email].discard(pk)
+        self.domains[domain].discard(pk)
+
+    def find(self, name, city='', email='', website='', exclude=None, limit=10):
+        """Вероятные дубликаты, самые похожие первыми"""
+        grams = trigrams(normalize_name(name))
+        # При сходстве от NAME_THRESHOLD у названий не меньше low общих триграмм, а их
+        # число отличается не больше чем в 1 / NAME_THRESHOLD раз. Поэтому достаточно
+        # названий подходящей длины, содержащих одну из len - low + 1 самых редких триграмм
+        low, high = math.ceil(NAME_THRESHOLD * len(grams)), math.floor(len(grams) / NAME_THRESHOLD)
+        lists = {
+            gram: [pks for size, pks in self.postings.get(gram, {}).items() if low <= size <= high]
+            for gram in grams
+        }
+        rare = sorted(grams, key=lambda gram: sum(map(len, lists[gram])))[:len(grams) - low + 1]
+        candidates = set().union(*(pks for gram in rare for pks in lists[gram]))
+
+        duplicates = {}
+        city = city.strip().lower()
+        for pk in candidates:
+            count = len(grams & self.grams[pk])
+            score = count / (len(grams) + len(self.grams[pk]) - count)
+            if score < NAME_THRESHOLD:
+                continue
+            duplicate = duplicates[pk] = Duplicate(pk, score, ['похожее название'])
+            if city and self.cities[pk] == city:
+                duplicate.score += CITY_BONUS
+                duplicate.reasons.append('тот же город')
+
+        exact = [
+            (self.emails.get(email.strip().lower(), ()) if email else (), 'тот же email'),
+            (self.domains.get(get_domain(website), ()) if website else (), 'тот же сайт'),
+        ]
+        for matches, reason in exact:
+            for pk in matches:
+                duplicate = duplicates.setdefault(pk, Duplicate(pk, 0.0))
+                duplicate.score += 1
+                duplicate.reasons.append(reason)
+
+        duplicates.pop(exclude, None)
+        return sorted(duplicates.values(), key=lambda duplicate: -duplicate.score)[:limit]
+
+
+_index = None
+_index_version = None
+
+
+def get_version():
+    # Случайная версия вместо счетчика: после очистки кэша не совпадет со старой
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_index():
+    """Индекс текущей версии, перестраивается в процессе после изменений НКО"""
+    global _index, _index_version
+    version = get_version()
+    if _index is None or _index_version != version:
+        _index, _index_version = DuplicateIndex.build(), version
+    return _index
+
+
+def invalidate(pk=None, row=None):
+    """
+    Сбросить индекс во всех процессах (при изменении НКО). Индекс текущего
+    процесса, если он актуален, обновляется на месте: НКО pk удаляется и
+    добавляется заново из row (название, город, email, сайт), если row задан.
+    """
+    global _index_version
+    current = _index is not None and _index_version == cache.get(VERSION_KEY)
+    version = uuid.uuid4().hex
+    cache.set(VERSION_KEY, version, timeout=None)
+    if current and pk is not None:
+        _index.remove(pk)
+        if row:
+            _index.add(pk, *row)
+        _index_version = version
+
+
+def find_duplicates(name, city='', email='', website='', exclude=None, limit=10):
+    """Вероятные дубликаты с загруженными объектами НКО: [(НКО, Duplicate)]"""
+    duplicates = get_index().find(name, city, email, website, exclude, limit)
+    nkos = NKO.objects.in_bulk([duplicate.nko_id for duplicate in duplicates])
+    return [(nkos[duplicate.nko_id], duplicate) for duplicate in duplicates if duplicate.nko_id in nkos]
+
+
+def duplicate_report(nkos):
+    """Пары вероятных дубликатов среди НКО queryset и всего индекса для модерации"""
+    index = get_index()
+    pairs = {}
+    for nko in nkos:
+        for duplicate in index.find(nko.name, nko.city, nko.email, nko.website, exclude=nko.pk):
+            pair = tuple(sorted((nko.pk, duplicate.nko_id)))
+            if pair not in pairs or pairs[pair].score < duplicate.score:
+                pairs[pair] = duplicate
+    objects = NKO.objects.in_bulk({pk for pair in pairs for pk in pair})
+    return sorted(
+        ((objects[first], objects[second], duplicate) for (first, second), duplicate in pairs.items()
+         if first in objects and second in objects),
+        key=lambda row: -row[2].score,
+    )
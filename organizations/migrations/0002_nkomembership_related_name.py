@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nkomembership',
+            name='nko',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='organizations.nko', verbose_name='НКО'),
+        ),
+    ]
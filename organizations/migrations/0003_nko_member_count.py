@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:59
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_member_count(apps, schema_editor):
+    NKO = apps.get_model('organizations', 'NKO')
+    NKOMembership = apps.get_model('organizations', 'NKOMembership')
+    approved = (NKOMembership.objects.filter(nko=OuterRef('pk'), status='approved')
+                .values('nko').annotate(total=Count('id')).values('total'))
+    NKO.objects.update(member_count=Coalesce(Subquery(approved, output_field=IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0002_nkomembership_related_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nko',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Участников'),
+        ),
+        migrations.RunPython(fill_member_count, migrations.RunPython.noop),
+    ]
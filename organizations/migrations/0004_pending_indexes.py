@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0003_nko_member_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='nko',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['created_at', 'id'], name='nko_pending_idx'),
+        ),
+    ]
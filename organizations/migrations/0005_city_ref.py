@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-19 17:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cities', '0001_initial'),
+        ('organizations', '0004_pending_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nko',
+            name='city_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='cities.city', verbose_name='Город из справочника'),
+        ),
+    ]
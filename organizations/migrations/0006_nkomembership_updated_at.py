@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-19 20:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organizations', '0005_city_ref'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nkomembership',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Обновлено'),
+            preserve_default=False,
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.db import models
 
+from cities.models import LoadedCityMixin
+
 # Create your models here.
-class NKO(models.Model):
+class NKO(LoadedCityMixin, models.Model):
     STATUS_CHOICES = [
         ('draft', 'Черновик'),
         ('pending', 'На модерации'),
@@ -36,6 +38,15 @@ class NKO(models.Model):
 
     # Локация
     city = models.CharField("Город", max_length=100)
+    city_ref = models.ForeignKey(
+        'cities.City',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Город из справочника",
+        related_name='+'
+    )
     address = models.TextField("Адрес", blank=True)
 
     # Визуал
@@ -51,6 +62,9 @@ class NKO(models.Model):
     )
     status = models.CharField("Статус", max_length=20, choices=STATUS_CHOICES, default='draft')
 
+    # Счетчики (обновляются сигналами членства, см. signals.py)
+    member_count = models.PositiveIntegerField("Участников", default=0)
+
     # Даты
     created_at = models.DateTimeField("Создано", auto_now_add=True)
     updated_at = models.DateTimeField("Обновлено", auto_now=True)
@@ -58,11 +72,20 @@ class NKO(models.Model):
     # Системные поля
     is_active = models.BooleanField("Активно", default=True)
 
+    class Meta:
+        indexes = [
+            # Очередь модерации (content/moderation.py)
+            models.Index(fields=['created_at', 'id'], condition=models.Q(status='pending'), name='nko_pending_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.city})"
 
 
 class NKOMembership(models.Model):
+    # Порядок групп в списке участников: от старших ролей к младшим
+    ROLE_ORDER = ['admin', 'moderator', 'coordinator', 'volunteer', 'member']
+
     ROLE_CHOICES = [
         ('member', 'Участник'),
         ('volunteer', 'Волонтер'),
@@ -79,7 +102,7 @@ class NKOMembership(models.Model):
     ]
 
     user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, verbose_name="Пользователь")
-    nko = models.ForeignKey(NKO, on_delete=models.CASCADE, verbose_name="НКО")
+    nko = models.ForeignKey(NKO, on_delete=models.CASCADE, verbose_name="НКО", related_name='memberships')
 
     role = models.CharField("Роль", max_length=20, choices=ROLE_CHOICES, default='member')
     status = models.CharField("Статус", max_length=20, choices=STATUS_CHOICES, default='pending')
@@ -90,6 +113,8 @@ class NKOMembership(models.Model):
 
     # Даты
     joined_at = models.DateTimeField("Вступил", auto_now_add=True)
+    # Версия строки в списке участников: роль, статус, имя пользователя
+    updated_at = models.DateTimeField("Обновлено", auto_now=True)
 
     class Meta:
         unique_together = ['user', 'nko']  # пользователь может быть в НКО только один раз
@@ -1,12 +1,26 @@
-from django.db.models import Count
-from .models import NKO
+from itertools import groupby
+
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from content.models import News, Event
+from .models import NKO, NKOMembership
+
+
+def count_by_nko(queryset):
+    """Коррелированный подзапрос с количеством строк queryset для каждой НКО"""
+    counts = (queryset.filter(nko=OuterRef('pk')).order_by()
+              .values('nko').annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
 
 
 class NKOService:
     @staticmethod
     def get_popular_nkos(limit=5):
-        """Получить популярные НКО по просмотрам"""
-        return NKO.objects.filter(status='approved', is_active=True).order_by('-view_count')[:limit]
+        """Получить популярные НКО по количеству участников"""
+        return NKO.objects.filter(status='approved', is_active=True).order_by('-member_count')[:limit]
 
     @staticmethod
     def get_nko_stats():
@@ -26,4 +40,83 @@ class NKOService:
     @staticmethod
     def get_nkos_by_city(city):
         """Получить НКО по городу"""
-        return NKO.objects.filter(city=city, status='approved', is_active=True)
\ No newline at end of file
+        return NKO.objects.filter(city=city, status='approved', is_active=True)
+
+    @staticmethod
+    def get_dashboard(user):
+        """НКО пользователя (свои и те, где он участник) со сводкой одним запросом"""
+        membership = NKOMembership.objects.filter(nko=OuterRef('pk'), user=user)
+        statuses = dict(NKOMembership.STATUS_CHOICES)
+        roles = dict(NKOMembership.ROLE_CHOICES)
+        latest_news = (News.objects.filter(nko=OuterRef('pk'), status='published').order_by()
+                       .values('nko').annotate(latest=Max('published_at')).values('latest'))
+        nkos = list(NKO.objects
+                    .filter(Q(owner=user) | Q(pk__in=NKOMembership.objects.filter(user=user).values('nko')))
+                    .annotate(
+                        membership_status=Subquery(membership.values('status')[:1]),
+                        membership_role=Subquery(membership.values('role')[:1]),
+                        pending_count=count_by_nko(NKOMembership.objects.filter(status='pending')),
+                        upcoming_event_count=count_by_nko(
+                            Event.objects.filter(status='published', start_date__gte=timezone.now())
+                        ),
+                        latest_news_at=Subquery(latest_news),
+                    )
+                    .order_by('-created_at'))
+        for nko in nkos:
+            nko.membership_status_display = statuses.get(nko.membership_status, '')
+            nko.membership_role_display = roles.get(nko.membership_role, '')
+        return nkos
+
+
+class MembershipService:
+    @staticmethod
+    def change_member_count(nko_id, delta):
+        """Атомарно изменить счетчик участников НКО"""
+        # UPDATE ... SET member_count = member_count + delta не теряет
+        # одновременные изменения, в отличие от чтения и сохранения объекта
+        NKO.objects.filter(pk=nko_id).update(member_count=Greatest(F('member_count') + delta, 0))
+
+    @staticmethod
+    @transaction.atomic
+    def set_status(memberships, status):
+        """Изменить статус нескольких членств и пересчитать счетчики их НКО"""
+        memberships = memberships.exclude(status=status)
+        if status == 'approved':
+            changed = memberships
+        else:
+            changed = memberships.filter(status='approved')
+        deltas = dict(changed.values_list('nko').annotate(total=Count('id')).order_by())
+
+        # update() не вызывает auto_now, а по updated_at проверяется версия страницы НКО
+        updated = memberships.update(status=status, updated_at=timezone.now())
+        sign = 1 if status == 'approved' else -1
+        for nko_id, total in deltas.items():
+            MembershipService.change_member_count(nko_id, sign * total)
+        return updated
+
+    @staticmethod
+    def recount_member_counts(nkos=None):
+        """Пересчитать счетчики участников по таблице членств"""
+        nkos = NKO.objects.all() if nkos is None else nkos
+        return nkos.update(member_count=count_by_nko(NKOMembership.objects.filter(status='approved')))
+
+    @staticmethod
+    def get_roster(nko, page_number=None, per_page=50):
+        """Страница подтвержденных участников, сгруппированных по ролям"""
+        role_rank = Case(
+            *[When(role=role, then=Value(rank)) for rank, role in enumerate(NKOMembership.ROLE_ORDER)],
+            default=Value(len(NKOMembership.ROLE_ORDER)),
+        )
+        members = (NKOMembership.objects.filter(nko=nko, status='approved')
+                   .select_related('user')
+                   .order_by(role_rank, 'user__last_name', 'user__first_name', 'pk'))
+
+        # Количество берем из счетчика, чтобы не выполнять COUNT по всей группе
+        paginator = Paginator(members, per_page)
+        paginator.count = nko.member_count
+        page = paginator.get_page(page_number)
+        groups = [
+            (memberships[0].get_role_display(), memberships)
+            for memberships in (list(group) for _, group in groupby(page, key=lambda m: m.role))
+        ]
+        return page, groups
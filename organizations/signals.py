@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from accounts.models import User
+from . import dedup
+from .models import NKO, NKOMembership
+from .services import MembershipService
+
+# Поля пользователя, которые показываются в списке участников НКО
+ROSTER_USER_FIELDS = ('first_name', 'last_name')
+
+
+@receiver(pre_save, sender=NKOMembership)
+def remember_membership_status(sender, instance, **kwargs):
+    """Запомнить статус до сохранения, чтобы понять, изменился ли состав"""
+    instance._previous_status = None
+    if instance.pk and not instance._state.adding:
+        instance._previous_status = (NKOMembership.objects.filter(pk=instance.pk)
+                                     .values_list('status', flat=True).first())
+
+
+@receiver(post_save, sender=NKOMembership)
+def update_member_count(sender, instance, created, **kwargs):
+    """Обновление счетчика участников при одобрении, отклонении или блокировке"""
+    was_approved = getattr(instance, '_previous_status', None) == 'approved'
+    is_approved = instance.status == 'approved'
+    if was_approved != is_approved:
+        MembershipService.change_member_count(instance.nko_id, 1 if is_approved else -1)
+
+
+@receiver(post_delete, sender=NKOMembership)
+def decrease_member_count(sender, instance, **kwargs):
+    """Уменьшение счетчика участников при удалении членства"""
+    if instance.status == 'approved':
+        MembershipService.change_member_count(instance.nko_id, -1)
+
+
+@receiver(post_save, sender=NKO)
+def update_duplicate_index(sender, instance, update_fields=None, **kwargs):
+    """Обновление индекса дубликатов при изменении названия или контактов НКО"""
+    # Индекс живет в памяти процесса, поэтому меняем его только после фиксации транзакции
+    if update_fields is None or dedup.INDEXED_FIELDS & set(update_fields):
+        pk = instance.pk
+        row = (instance.name, instance.city, instance.email, instance.website) if instance.is_active else None
+        transaction.on_commit(lambda: dedup.invalidate(pk, row))
+
+
+@receiver(post_delete, sender=NKO)
+def remove_from_duplicate_index(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: dedup.invalidate(pk))
+
+
+def get_roster_data(user):
+    # Читаем из __dict__, чтобы не загружать отложенные поля
+    return tuple(user.__dict__.get(field) for field in ROSTER_USER_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_roster_data(sender, instance, **kwargs):
+    """Запомнить имя пользователя, показанное в списках участников"""
+    instance._previous_roster_data = get_roster_data(instance)
+
+
+@receiver(post_save, sender=User)
+def touch_memberships(sender, instance, created, update_fields=None, **kwargs):
+    """Сменить версию членств пользователя при изменении имени, чтобы страницы НКО не отдавались из кеша"""
+    if created or update_fields is not None and not set(ROSTER_USER_FIELDS) & set(update_fields):
+        return
+    data = get_roster_data(instance)
+    if data != instance._previous_roster_data:
+        NKOMembership.objects.filter(user=instance).update(updated_at=timezone.now())
+    instance._previous_roster_data = data
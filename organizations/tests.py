@@ -1,3 +1,352 @@
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from content import moderation
+from dobro.testing import QueryBudgetMixin, create_user, create_users, create_nko, create_event, create_news
+from . import dedup
+from .models import NKO, NKOMembership
+from .services import MembershipService, NKOService
+
+
+def add_members(nko, size, status='approved', role='member'):
+    """Пачка членств с пересчетом счетчика (bulk_create не вызывает сигналы)"""
+    memberships = NKOMembership.objects.bulk_create(
+        NKOMembership(user=user, nko=nko, status=status, role=role) for user in create_users(size)
+    )
+    MembershipService.recount_member_counts(NKO.objects.filter(pk=nko.pk))
+    nko.refresh_from_db(fields=['member_count'])
+    return memberships
+
+
+class MemberCountTest(TestCase):
+    def setUp(self):
+        self.nko = create_nko()
+
+    def assertMemberCount(self, expected):
+        self.nko.refresh_from_db(fields=['member_count'])
+        self.assertEqual(self.nko.member_count, expected)
+
+    def test_signals_follow_status_changes(self):
+        membership = NKOMembership.objects.create(user=create_user(), nko=self.nko)
+        self.assertMemberCount(0)
+
+        membership.status = 'approved'
+        membership.save()
+        self.assertMemberCount(1)
+
+        membership.save()
+        self.assertMemberCount(1)
+
+        membership.status = 'banned'
+        membership.save()
+        self.assertMemberCount(0)
+
+        NKOMembership.objects.create(user=create_user(), nko=self.nko, status='approved').delete()
+        self.assertMemberCount(0)
+
+    def test_set_status_updates_counts_in_bulk(self):
+        add_members(self.nko, 3, status='pending')
+        add_members(self.nko, 2)
+        memberships = NKOMembership.objects.filter(nko=self.nko)
+
+        self.assertEqual(MembershipService.set_status(memberships, 'approved'), 3)
+        self.assertMemberCount(5)
+        self.assertEqual(MembershipService.set_status(memberships.filter(pk__in=memberships[:2]), 'rejected'), 2)
+        self.assertMemberCount(3)
+
+    def test_recount_repairs_counter(self):
+        add_members(self.nko, 4)
+        NKO.objects.filter(pk=self.nko.pk).update(member_count=100)
+
+        MembershipService.recount_member_counts()
+        self.assertMemberCount(4)
+
+    def test_roster_is_grouped_by_role(self):
+        add_members(self.nko, 3)
+        add_members(self.nko, 2, role='admin')
+        add_members(self.nko, 1, status='pending', role='coordinator')
+
+        page, groups = MembershipService.get_roster(self.nko, per_page=4)
+        self.assertEqual([(role, len(members)) for role, members in groups],
+                         [('Администратор', 2), ('Участник', 2)])
+        self.assertEqual(page.paginator.num_pages, 2)
+
+
+class DashboardTest(TestCase):
+    def test_dashboard_summarizes_owned_and_joined_nkos(self):
+        user = create_user()
+        owned = create_nko(owner=user)
+        add_members(owned, 3)
+        add_members(owned, 2, status='pending')
+        create_event(created_by=user, nko=owned)
+        create_event(created_by=user, nko=owned, start_date=timezone.now() - timedelta(days=1))
+        news = create_news(author=user, nko=owned)
+        joined = create_nko()
+        NKOMembership.objects.create(user=user, nko=joined, role='volunteer', status='approved')
+        create_nko()
+
+        with self.assertNumQueries(1):
+            dashboard = {nko.pk: nko for nko in NKOService.get_dashboard(user)}
+
+        self.assertEqual(set(dashboard), {owned.pk, joined.pk})
+        self.assertEqual(dashboard[owned.pk].pending_count, 2)
+        self.assertEqual(dashboard[owned.pk].member_count, 3)
+        self.assertEqual(dashboard[owned.pk].upcoming_event_count, 1)
+        self.assertEqual(dashboard[owned.pk].latest_news_at, news.published_at)
+        self.assertIsNone(dashboard[owned.pk].membership_status)
+        self.assertEqual(dashboard[joined.pk].membership_role_display, 'Волонтер')
+        self.assertEqual(dashboard[joined.pk].member_count, 1)
+        self.assertIsNone(dashboard[joined.pk].latest_news_at)
+
+
+class DuplicateDetectionTest(TestCase):
+    def setUp(self):
+        # Транзакции тестов не фиксируются, поэтому индекс строится заново по новой версии
+        dedup.invalidate()
+        self.nko = create_nko(name='АНО «Зелёный город»', city='Саров', email='green@example.com',
+                              website='https://www.green-city.ru/about')
+        create_nko(name='Фонд помощи животным', city='Саров', email='pets@example.com')
+
+    def test_similar_name_in_same_city(self):
+        duplicates = dedup.find_duplicates('Зеленый город', 'Саров')
+        self.assertEqual([nko for nko, _ in duplicates], [self.nko])
+        self.assertEqual(duplicates[0][1].reasons, ['похожее название', 'тот же город'])
+
+    def test_contacts_match_exactly(self):
+        duplicates = dedup.find_duplicates('Экологи Сарова', email='GREEN@example.com')
+        self.assertEqual([nko for nko, _ in duplicates], [self.nko])
+        duplicates = dedup.find_duplicates('Экологи Сарова', website='http://green-city.ru')
+        self.assertEqual(duplicates[0][1].reasons, ['тот же сайт'])
+        self.assertEqual(dedup.find_duplicates('Экологи Сарова', 'Саров', 'eco@example.com'), [])
+
+    def test_index_follows_changes(self):
+        dedup.get_index()
+        self.nko.name = 'Клуб любителей книг'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nko.save()
+        self.assertEqual(dedup.find_duplicates('Зеленый город'), [])
+        self.assertEqual(len(dedup.find_duplicates('Клуб любителей книги')), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nko.delete()
+        self.assertEqual(dedup.find_duplicates('Клуб любителей книги'), [])
+
+    def test_create_asks_for_confirmation(self):
+        self.client.force_login(create_user())
+        data = {'name': 'Зеленый город', 'description': 'Описание', 'category': 'ecology',
+                'email': 'new@example.com', 'city': 'Саров'}
+        response = self.client.post(reverse('organizations:nko_create'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([nko for nko, _ in response.context['duplicates']], [self.nko])
+        self.assertEqual(NKO.objects.count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('organizations:nko_create'), {**data, 'confirm_duplicates': '1'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(NKO.objects.count(), 3)
+        self.assertEqual(len(dedup.find_duplicates('Зеленый город', 'Саров')), 2)
+
+    def test_admin_report(self):
+        copy = create_nko(name='Зеленый город', city='Саров')
+        self.client.force_login(create_user(is_staff=True, is_superuser=True))
+        response = self.client.post(reverse('admin:organizations_nko_changelist'), {
+            'action': 'duplicates_report', '_selected_action': [copy.pk],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(first, second) for first, second, _ in response.context['pairs']], [(self.nko, copy)])
+
+
+class NKOAdminTest(TestCase):
+    def setUp(self):
+        self.client.force_login(create_user(is_staff=True, is_superuser=True))
+        self.nko = create_nko(city='озерск', status='pending')
+
+    def run_action(self, action):
+        return self.client.post(reverse('admin:organizations_nko_changelist') + '?status__exact=pending', {
+            'action': action, '_selected_action': [self.nko.pk],
+        })
+
+    def test_approve_links_city_and_resets_counts(self):
+        self.assertEqual(moderation.get_counts()['nko'], 1)
+        self.assertEqual(self.run_action('approve_nko').status_code, 302)
+        self.nko.refresh_from_db()
+        self.assertEqual((self.nko.status, self.nko.city, self.nko.city_ref.name), ('approved', 'Озерск', 'Озерск'))
+        self.assertEqual(moderation.get_counts()['nko'], 0)
+
+    def test_reject_resets_counts(self):
+        self.assertEqual(moderation.get_counts()['nko'], 1)
+        self.run_action('reject_nko')
+        self.nko.refresh_from_db()
+        self.assertEqual((self.nko.status, self.nko.city_ref), ('rejected', None))
+        self.assertEqual(moderation.get_counts()['nko'], 0)
+
+
+class NKOImportTest(TestCase):
+    def setUp(self):
+        dedup.invalidate()
+        self.client.force_login(create_user(is_staff=True, is_superuser=True))
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # Контрольные точки загрузок из админки пишутся во временный каталог теста
+        self.enterContext(self.settings(IMPORT_CHECKPOINT_DIR=directory))
+
+    def test_admin_upload(self):
+        content = (
+            'name,description,category,email,city,website,status\n'
+            'Зеленый город,Экология,ecology,green@example.com,Саров,green-city.ru,approved\n'
+            'Без почты,Описание,ecology,,Саров,,approved\n'
+        )
+        upload = SimpleUploadedFile('nko.csv', ('\ufeff' + content).encode())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:organizations_nko_import'), {'file': upload})
+        report = response.context['report']
+        self.assertEqual((report.created, report.error_count), (1, 1))
+        self.assertEqual(report.errors[0][0], 3)
+        self.assertIn('email', report.errors[0][1])
+
+        nko = NKO.objects.get(name='Зеленый город')
+        self.assertEqual((nko.status, nko.website), ('approved', 'http://green-city.ru'))
+        self.assertEqual([found for found, _ in dedup.find_duplicates('Зеленый город', 'Саров')], [nko])
+
+        self.assertContains(self.client.get(reverse('admin:organizations_nko_changelist')), 'Импорт из файла')
+
+    def test_upload_resumes_and_refreshes_counts(self):
+        cache.clear()
+        moderation.get_counts()
+        rows = ''.join(f'Фонд {i},Описание,ecology,fund{i}@example.com,Саров,,pending\n' for i in range(3))
+        content = ('name,description,category,email,city,website,status\n' + rows).encode()
+        url = reverse('admin:organizations_nko_import')
+
+        response = self.client.post(url, {'file': SimpleUploadedFile('nko.csv', content)})
+        self.assertEqual(response.context['report'].created, 3)
+        # Счетчики очереди модерации сброшены после пачки
+        self.assertEqual(moderation.get_counts()['nko'], 3)
+
+        # Тот же файл продолжается после контрольной точки и ничего не дублирует
+        response = self.client.post(url, {'file': SimpleUploadedFile('nko.csv', content)})
+        self.assertEqual(response.context['report'].processed, 0)
+        self.assertContains(response, 'Продолжаем после строки 4')
+        response = self.client.post(url, {'file': SimpleUploadedFile('nko.csv', content), 'restart': 'on'})
+        self.assertEqual(response.context['report'].created, 3)
+        self.assertEqual(NKO.objects.filter(status='pending').count(), 6)
+
+
+class NKODetailConditionalTest(TestCase):
+    def test_members_change_version(self):
+        nko = create_nko()
+        url = reverse('organizations:nko_detail', args=[nko.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Заявка не видна на странице, подтвержденный участник - виден
+        membership = NKOMembership.objects.create(user=create_user(), nko=nko)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        MembershipService.set_status(NKOMembership.objects.filter(pk=membership.pk), 'approved')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_member_role_and_name_change_version(self):
+        nko = create_nko()
+        membership = NKOMembership.objects.create(user=create_user(), nko=nko, status='approved')
+        url = reverse('organizations:nko_detail', args=[nko.pk])
+
+        def changed(etag):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            return response.status_code == 200, response['ETag']
+
+        etag = self.client.get(url)['ETag']
+        # Сохранения пользователя без смены имени версию не меняют
+        user = membership.user
+        user.last_login = timezone.now()
+        user.save(update_fields=['last_login'])
+        user.save()
+        self.assertEqual(changed(etag), (False, etag))
+
+        membership.role = 'coordinator'
+        membership.save()
+        modified, etag = changed(etag)
+        self.assertTrue(modified)
+
+        user.refresh_from_db()
+        user.first_name = 'Новое имя'
+        user.save()
+        self.assertTrue(changed(etag)[0])
+
+
+class OrganizationsQueryBudgetTest(QueryBudgetMixin, TestCase):
+    def add_members(self, nko, size, status='approved'):
+        add_members(nko, size, status)
+
+    def test_nko_list(self):
+        def populate(size):
+            owner = create_user()
+            for i in range(size):
+                self.add_members(create_nko(owner=owner, city=f'Город {i}'), 1)
+            return reverse('organizations:nko_list')
+
+        # Города для фильтра подсказываются из справочника и на странице не читаются
+        self.assertQueryBudget(2, populate)
+
+    def test_nko_detail(self):
+        def populate(size):
+            nko = create_nko()
+            self.add_members(nko, size)
+            self.client.force_login(create_user())
+            return reverse('organizations:nko_detail', args=[nko.pk])
+
+        self.assertQueryBudget(5, populate)
+
+    def test_nko_members(self):
+        def populate(size):
+            nko = create_nko()
+            self.add_members(nko, size)
+            return reverse('organizations:nko_members', args=[nko.pk]) + '?page=2'
+
+        self.assertQueryBudget(2, populate)
+
+    def test_nko_create(self):
+        def populate(size):
+            owner = create_user()
+            for _ in range(size):
+                create_nko(owner=owner)
+            self.client.force_login(owner)
+            return reverse('organizations:nko_create')
+
+        self.assertQueryBudget(1, populate)
+
+    def test_nko_edit(self):
+        def populate(size):
+            nko = create_nko()
+            self.add_members(nko, size)
+            self.client.force_login(nko.owner)
+            return reverse('organizations:nko_edit', args=[nko.pk])
+
+        self.assertQueryBudget(2, populate)
+
+    def test_nko_join(self):
+        def populate(size):
+            nko = create_nko()
+            self.add_members(nko, size)
+            self.client.force_login(create_user())
+            return reverse('organizations:nko_join', args=[nko.pk])
+
+        self.assertQueryBudget(3, populate)
+
+    def test_my_organizations(self):
+        def populate(size):
+            user = create_user()
+            for _ in range(size):
+                owned = create_nko(owner=user)
+                add_members(owned, 2, status='pending')
+                create_event(created_by=user, nko=owned)
+                create_news(author=user, nko=owned)
+                NKOMembership.objects.create(user=user, nko=create_nko(owner=user), status='approved')
+            self.client.force_login(user)
+            return reverse('organizations:my_organizations')
 
-# Create your tests here.
+        self.assertQueryBudget(2, populate)
@@ -8,6 +8,7 @@ urlpatterns = [
     path('create/', views.nko_create, name='nko_create'),
     path('my/', views.my_organizations, name='my_organizations'),
     path('<int:pk>/', views.nko_detail, name='nko_detail'),
+    path('<int:pk>/members/', views.nko_members, name='nko_members'),
     path('<int:pk>/edit/', views.nko_edit, name='nko_edit'),
     path('<int:pk>/join/', views.nko_join, name='nko_join'),
 ]
\ No newline at end of file
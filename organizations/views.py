@@ -4,13 +4,23 @@ from django.contrib import messages
 from django.db.models import Count, Q
 from django.core.paginator import Paginator
 
+from . import dedup
 from .models import NKO, NKOMembership
 from .forms import NKOForm, NKOMembershipForm
+from .services import MembershipService, NKOService
+from cities.index import acanonical_name
+from content import moderation
+from dobro import conditional
+from dobro.async_utils import apaginate, aresolve_user
 
+ROSTER_PREVIEW_SIZE = 12
 
-def nko_list(request):
+
+async def nko_list(request):
     """Список всех НКО"""
-    nko_list = NKO.objects.filter(status='approved', is_active=True)
+    await aresolve_user(request)
+    await moderation.aload_counts(request)
+    nko_list = NKO.objects.filter(status='approved', is_active=True).order_by('-created_at')
 
     # Фильтрация
     city = request.GET.get('city')
@@ -18,6 +28,7 @@ def nko_list(request):
     search = request.GET.get('search')
 
     if city:
+        city = await acanonical_name(city)
         nko_list = nko_list.filter(city=city)
     if category:
         nko_list = nko_list.filter(category=category)
@@ -27,17 +38,11 @@ def nko_list(request):
             Q(description__icontains=search)
         )
 
-    # Пагинация
-    paginator = Paginator(nko_list, 12)
-    page_number = request.GET.get('page')
-    nkos = paginator.get_page(page_number)
-
-    # Статистика для фильтров
-    cities = NKO.objects.filter(status='approved').values_list('city', flat=True).distinct()
+    # Город вводится с подсказками из справочника (cities:autocomplete) вместо списка всех городов
+    nkos = await apaginate(nko_list, 12, request.GET.get('page'))
 
     context = {
         'nkos': nkos,
-        'cities': cities,
         'categories': NKO.CATEGORY_CHOICES,
         'selected_city': city,
         'selected_category': category,
@@ -46,12 +51,16 @@ def nko_list(request):
     return render(request, 'organizations/nko_list.html', context)
 
 
+@conditional.condition(lambda request, pk: conditional.get_state(
+    NKO.objects.filter(pk=pk, is_active=True),
+    members=conditional.related(NKOMembership.objects.filter(status='approved'), 'nko_id', 'updated_at'),
+))
 def nko_detail(request, pk):
     """Детальная страница НКО"""
     nko = get_object_or_404(NKO, pk=pk, is_active=True)
 
-    # Получаем участников
-    members = nko.memberships.filter(status='approved').select_related('user')
+    # На странице НКО показываем только первых участников, полный список - в nko_members
+    members, member_groups = MembershipService.get_roster(nko, per_page=ROSTER_PREVIEW_SIZE)
 
     # Проверяем, является ли пользователь участником
     user_membership = None
@@ -64,28 +73,48 @@ def nko_detail(request, pk):
     context = {
         'nko': nko,
         'members': members,
+        'member_groups': member_groups,
         'user_membership': user_membership,
-        'member_count': members.count(),
     }
     return render(request, 'organizations/nko_detail.html', context)
 
 
+def nko_members(request, pk):
+    """Список участников НКО по ролям"""
+    nko = get_object_or_404(NKO, pk=pk, is_active=True)
+    members, member_groups = MembershipService.get_roster(nko, request.GET.get('page'))
+
+    context = {
+        'nko': nko,
+        'members': members,
+        'member_groups': member_groups,
+    }
+    return render(request, 'organizations/nko_members.html', context)
+
+
 @login_required
 def nko_create(request):
     """Создание новой НКО"""
+    duplicates = []
     if request.method == 'POST':
         form = NKOForm(request.POST, request.FILES)
         if form.is_valid():
-            nko = form.save(commit=False)
-            nko.owner = request.user
-            nko.save()
-
-            messages.success(request, 'НКО успешно создано! Ожидайте модерации.')
-            return redirect('organizations:nko_detail', pk=nko.pk)
+            # Похожие организации показываем до создания; пользователь может подтвердить, что это не дубликат
+            if not request.POST.get('confirm_duplicates'):
+                data = form.cleaned_data
+                duplicates = dedup.find_duplicates(data['name'], data['city'], data['email'], data['website'])
+            if not duplicates:
+                nko = form.save(commit=False)
+                nko.owner = request.user
+                nko.save()
+
+                messages.success(request, 'НКО успешно создано! Ожидайте модерации.')
+                return redirect('organizations:nko_detail', pk=nko.pk)
     else:
         form = NKOForm()
 
-    return render(request, 'organizations/nko_form.html', {'form': form, 'action': 'create'})
+    context = {'form': form, 'action': 'create', 'duplicates': duplicates}
+    return render(request, 'organizations/nko_form.html', context)
 
 
 @login_required
@@ -134,14 +163,13 @@ def nko_join(request, pk):
 @login_required
 def my_organizations(request):
     """Мои организации"""
-    # Организации, где пользователь владелец
-    owned_nkos = NKO.objects.filter(owner=request.user)
-
-    # Организации, где пользователь участник
-    memberships = NKOMembership.objects.filter(user=request.user).select_related('nko')
+    # Все организации пользователя со сводкой загружаются одним запросом
+    nkos = NKOService.get_dashboard(request.user)
 
     context = {
-        'owned_nkos': owned_nkos,
-        'memberships': memberships,
+        # Организации, где пользователь владелец
+        'owned_nkos': [nko for nko in nkos if nko.owner_id == request.user.pk],
+        # Организации, где пользователь участник
+        'member_nkos': [nko for nko in nkos if nko.membership_status],
     }
     return render(request, 'organizations/my_organizations.html', context)
\ No newline at end of file